@@ -0,0 +1,80 @@
+# Admin endpoints
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from app.models.profiles import ProfileSummary
+from app.profiling import PROFILES, get_profile
+from app.security.authenticator import authenticate_admin
+
+admin_router = APIRouter()
+
+
+@admin_router.get(
+    "/admin/profiles",
+    response_model=List[ProfileSummary],
+    summary="List the latest request profiles",
+)
+async def get_profiles(
+    _: str = Depends(authenticate_admin),
+) -> List[ProfileSummary]:
+    """
+    List the latest profiled requests of this worker, newest first.
+
+    Returns:
+        List[ProfileSummary]: The request, its duration and the time spent
+            in each phase, in milliseconds, of every profile.
+
+    Raises:
+        HTTPException: If the user is not an admin.
+    """
+    return [
+        ProfileSummary(
+            id=profile.id,
+            method=profile.method,
+            path=profile.path,
+            started=profile.started,
+            duration_ms=profile.duration * 1e3,
+            spans_ms={
+                name: seconds * 1e3 for name, seconds in profile.spans.items()
+            },
+            cpu_profile=profile.stats is not None,
+        )
+        for profile in reversed(PROFILES)
+    ]
+
+
+@admin_router.get(
+    "/admin/profiles/{id}",
+    response_class=Response,
+    summary="Download the CPU profile of a request",
+)
+async def download_profile(
+    id: int, _: str = Depends(authenticate_admin)
+) -> Response:
+    """
+    Download the CPU profile of a profiled request, in the `pstats` format
+    read by `python -m pstats` or snakeviz.
+
+    Args:
+        id (int): The ID of the profile.
+
+    Returns:
+        Response: The profile file.
+
+    Raises:
+        HTTPException: If the user is not an admin, or the profile is not
+            kept or has no CPU profile.
+    """
+    profile = get_profile(id)
+    if profile is None or profile.stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    return Response(
+        profile.stats,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="request-{id}.prof"'
+        },
+    )
@@ -0,0 +1,45 @@
+from typing import AsyncIterator, Optional
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_length: int
+) -> AsyncIterator[Optional[bytes]]:
+    """
+    Splits a stream of bytes into lines as the chunks arrive.
+
+    At most one line is buffered, so memory is bounded by `max_length` and
+    the size of a chunk whatever the size of the stream.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The chunks of the stream.
+        max_length (int): The maximum length of a line, in bytes.
+
+    Yields:
+        Optional[bytes]: Each line without its newline, or None in place
+            of a line longer than `max_length`, which is dropped.
+    """
+    buffer = bytearray()
+    overlong = False
+    async for chunk in chunks:
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            if not overlong:
+                buffer += chunk[start:end]
+            if overlong or len(buffer) > max_length:
+                yield None
+            else:
+                yield bytes(buffer)
+            buffer.clear()
+            overlong = False
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if not overlong:
+            buffer += chunk[start:]
+            if len(buffer) > max_length:
+                buffer.clear()
+                overlong = True
+    if overlong:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
@@ -0,0 +1,24 @@
+from typing import Any, Dict, List
+
+from fastapi import Request
+
+
+def next_page_headers(
+    request: Request, page: List[Any], limit: int
+) -> Dict[str, str]:
+    """
+    Builds the headers pointing to the next page of a keyset pagination.
+
+    Args:
+        request (Request): The request of the current page.
+        page (List[Any]): The items of the current page, ordered by ID.
+        limit (int): The page size.
+
+    Returns:
+        Dict[str, str]: A `Link` header with `rel="next"` if the page is
+            full, no headers otherwise.
+    """
+    if len(page) < limit:
+        return {}
+    next_url = request.url.include_query_params(after=page[-1].id)
+    return {"Link": f'<{next_url}>; rel="next"'}
@@ -1,53 +1,374 @@
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import orjson
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 
-from app.database.db import PRODUCT_DB
-from app.models.products import Product, ProductIn
+from app.api.ndjson import iter_lines
+from app.api.pagination import next_page_headers
+from app.api.responses import (
+    RecordResponse,
+    encoded_response,
+    precondition_failed,
+)
+from app.api.review import check_product_precondition, encode_product
+from app.config import settings
+from app.database.base import Storage, VersionConflict
+from app.database.changes import Change, ChangeFeed
+from app.database.db import get_product_db, get_review_db
+from app.models.products import Product, ProductDetail, ProductIn
+from app.profiling import span
 from app.security.authenticator import authenticate
 
 product_router = APIRouter()
 
+# Number of products encoded per chunk of the export.
+EXPORT_CHUNK_SIZE = 1000
+# Number of imported products inserted at once.
+IMPORT_BATCH_SIZE = 1000
+# Maximum length of an imported line, in bytes.
+IMPORT_MAX_LINE_LENGTH = 64 * 1024
+# Maximum number of line errors reported by an import.
+IMPORT_MAX_ERRORS = 100
+
+
+def _parse_fields(fields: str) -> List[str]:
+    """
+    Parses a comma separated list of product fields.
+
+    Args:
+        fields (str): The comma separated field names.
+
+    Returns:
+        List[str]: The field names, in the order of the product fields.
+
+    Raises:
+        HTTPException: If a field name is not a product field.
+    """
+    requested = {field.strip() for field in fields.split(",")} - {""}
+    unknown = requested - set(Product.__fields__)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return [field for field in Product.__fields__ if field in requested]
+
+
+def _check_batch_size(size: int) -> None:
+    """
+    Checks the number of items of a batch request.
+
+    Args:
+        size (int): The number of items in the batch.
+
+    Raises:
+        HTTPException: If the batch holds more items than allowed.
+    """
+    if size > settings.batch_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=(
+                f"Batch too large, at most {settings.batch_max_size} items"
+            ),
+        )
+
 
 # Products
 @product_router.get(
-    "/products", response_model=List[Product], summary="Get all products"
+    "/products",
+    response_model=List[Product],
+    response_class=RecordResponse,
+    summary="Get all products",
 )
-async def get_products() -> List[Product]:
+async def get_products(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[int] = None,
+    fields: Optional[str] = None,
+    category: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    sort: Optional[str] = Query(None, regex="^-?score$"),
+    product_db: Storage = Depends(get_product_db),
+) -> Response:
     """
-    Retrieve a list of all products.
+    Retrieve a page of products, ordered by ID, or the top products by
+    score.
+
+    Filters on `category`, `name_prefix` and the score range are answered
+    from the product indexes without scanning the whole catalogue. Scores
+    are compared as numbers; products whose score is not a number never
+    match a score range and are left out of the score order.
+
+    When the page is full a `Link` header with `rel="next"` points to the
+    next page. Pages ordered by score are not paginated.
+
+    Args:
+        limit (int): The maximum number of products returned.
+        after (Optional[int]): Only products with a greater ID are returned.
+        fields (Optional[str]): Comma separated product fields to return.
+            All fields are returned if omitted.
+        category (Optional[str]): Only products of this category are
+            returned.
+        name_prefix (Optional[str]): Only products whose name starts with
+            this prefix are returned.
+        min_score (Optional[float]): Only products with a score at least
+            this high are returned.
+        max_score (Optional[float]): Only products with a score at most
+            this high are returned.
+        sort (Optional[str]): "score" or "-score" to return the products
+            with the lowest or highest scores first.
 
     Returns:
-        List[Product]: The list of products.
+        Response: The JSON list of products, the `response_model`.
+
+    Raises:
+        HTTPException: If `fields` contains an unknown field, or `after`
+            is combined with `sort`.
     """
-    return await PRODUCT_DB.get_all()
+    include = _parse_fields(fields) if fields is not None else None
+    equal = {"category": category} if category is not None else None
+    prefix = {"name": name_prefix} if name_prefix is not None else None
+    between = None
+    if min_score is not None or max_score is not None:
+        low = float("-inf") if min_score is None else min_score
+        high = float("inf") if max_score is None else max_score
+        between = {"score": (low, high)}
+    if sort is None:
+        products = await product_db.scan(
+            after=after,
+            limit=limit,
+            equal=equal,
+            prefix=prefix,
+            between=between,
+        )
+        headers = next_page_headers(request, products, limit)
+    elif after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="after cannot be combined with sort",
+        )
+    else:
+        products = await product_db.scan_sorted(
+            "score",
+            limit,
+            descending=sort.startswith("-"),
+            equal=equal,
+            prefix=prefix,
+            between=between,
+        )
+        headers = {}
+    if include is None:
+        with span("serialize"):
+            body = product_db.encode_all(products)
+        return RecordResponse(body, headers=headers)
+    return RecordResponse(
+        [
+            {field: getattr(product, field) for field in include}
+            for product in products
+        ],
+        headers=headers,
+    )
+
+
+@product_router.get(
+    "/products/export",
+    response_class=StreamingResponse,
+    summary="Export all products as NDJSON",
+)
+async def export_products(
+    product_db: Storage = Depends(get_product_db),
+) -> StreamingResponse:
+    """
+    Stream every product, ordered by ID, one JSON document per line.
+
+    The products are read from a consistent snapshot of the database and
+    encoded chunk by chunk as the client reads them, so the memory used
+    does not grow with the catalogue.
+
+    Returns:
+        StreamingResponse: The products as newline delimited JSON.
+    """
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for chunk in product_db.iter_chunks(EXPORT_CHUNK_SIZE):
+            yield product_db.encode_lines(chunk)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _event(change: Change) -> bytes:
+    """
+    Formats a change as a Server-Sent Event, identified by its version.
+    """
+    data = orjson.dumps(change._asdict())
+    return b"id: %d\ndata: %s\n\n" % (change.version, data)
+
+
+async def _stream_changes(
+    feed: ChangeFeed, version: int
+) -> AsyncIterator[bytes]:
+    """
+    Streams the changes newer than a version as they happen, until the
+    consumer falls too far behind and is told to resync.
+    """
+    while True:
+        changes = feed.since(version)
+        if changes is None:
+            data = orjson.dumps({"version": feed.version})
+            yield b"event: resync\ndata: %s\n\n" % data
+            return
+        if changes:
+            yield b"".join(map(_event, changes))
+            version = changes[-1].version
+        elif not await feed.wait(settings.change_feed_keepalive):
+            yield b": keepalive\n\n"
+
+
+@product_router.get(
+    "/products/changes",
+    response_class=StreamingResponse,
+    summary="Stream the product changes as Server-Sent Events",
+)
+async def stream_product_changes(
+    since: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    product_db: Storage = Depends(get_product_db),
+) -> StreamingResponse:
+    """
+    Stream the creations, updates and deletions of products as they happen.
+
+    Each event is a JSON object with the operation ("put", "delete" or
+    "reset"), the product ID and the version of the catalogue after the
+    change, which is also the ID of the event. Changes applied together,
+    like the products of a batch, share a version.
+
+    A `resync` event, holding the current version, ends the stream when
+    the changes since the requested version are no longer kept. The
+    consumer should then reload the products, and stream the changes
+    since that version.
+
+    Args:
+        since (Optional[int]): Only changes after this version are sent.
+            Defaults to the `Last-Event-ID` header that reconnecting
+            clients send, or to the current version.
+
+    Returns:
+        StreamingResponse: The changes as a `text/event-stream`.
+
+    Raises:
+        HTTPException: If the storage backend keeps no change feed.
+    """
+    feed = product_db.changes
+    if feed is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Change feed is not supported by the storage backend",
+        )
+    if since is None:
+        since = feed.version if last_event_id is None else last_event_id
+    return StreamingResponse(
+        _stream_changes(feed, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @product_router.get(
     "/products/{id}",
-    response_model=Product,
+    response_model=ProductDetail,
+    response_class=RecordResponse,
     summary="Get a specific product by ID",
 )
-async def get_product(id: int) -> Product:
+async def get_product(
+    id: int,
+    request: Request,
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> Response:
     """
-    Retrieve a specific product by its ID.
+    Retrieve a specific product by its ID, with the summary of its reviews.
+
+    The product is sent with a strong `ETag`; a request whose
+    `If-None-Match` header matches it is answered with a 304.
 
     Args:
         id (int): The ID of the product.
 
     Returns:
-        Product: The product information.
+        Response: The product information, the `response_model`, or a 304.
 
     Raises:
         HTTPException: If the product with the supplied ID does not exist.
     """
-    product = await PRODUCT_DB.get(id)
-    if not product:
+    encoded = await encode_product(id, product_db, review_db)
+    if encoded is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product with supplied ID does not exist",
         )
-    return product
+    return encoded_response(request, encoded)
+
+
+@product_router.put(
+    "/products/{id}",
+    dependencies=[Depends(authenticate)],
+    summary="Update a product by ID",
+)
+async def update_product(
+    id: int,
+    body: ProductIn,
+    request: Request,
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> dict:
+    """
+    Replace a specific product.
+
+    With an `If-Match` header holding the `ETag` of the product, as last
+    read, the product is only updated if it was not changed since,
+    otherwise the request fails with a 412. The version of the product is
+    checked and the product written atomically, so of several concurrent
+    updates of the same version only one succeeds.
+
+    Args:
+        id (int): The ID of the product.
+        body (ProductIn): The new product information.
+
+    Returns:
+        dict: A message indicating the successful update of the product.
+
+    Dependencies:
+        - Depends(authenticate): Requires authentication.
+
+    Raises:
+        HTTPException: If the product with the supplied ID does not exist,
+            or the precondition fails.
+    """
+    version = await check_product_precondition(
+        request, id, product_db, review_db
+    )
+    try:
+        product = await product_db.update(id, body, version=version)
+    except VersionConflict:
+        raise precondition_failed()
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
+        )
+    return {"message": "Product updated successfully"}
 
 
 @product_router.post(
@@ -57,6 +378,7 @@ async def get_product(id: int) -> Product:
 )
 async def create_product(
     body: ProductIn,
+    product_db: Storage = Depends(get_product_db),
 ) -> dict:
     """
     Create a new product.
@@ -70,18 +392,171 @@ async def create_product(
     Dependencies:
         - Depends(authenticate): Requires authentication.
     """
-    await PRODUCT_DB.save(body)
+    await product_db.save(body)
     return {"message": "Product created successfully"}
 
 
+@product_router.post(
+    "/products:batch",
+    dependencies=[Depends(authenticate)],
+    summary="Create several products",
+)
+async def create_products(
+    body: List[ProductIn],
+    product_db: Storage = Depends(get_product_db),
+) -> Response:
+    """
+    Create several products at once.
+
+    The products are inserted under a single acquisition of the database
+    lock and get consecutive IDs.
+
+    Args:
+        body (List[ProductIn]): The product information, at most
+            `batch_max_size` products.
+
+    Returns:
+        Response: A JSON object holding a message and the IDs of the
+            created products, in the order of the body, encoded without
+            the per-item validation of a `dict` return value.
+
+    Dependencies:
+        - Depends(authenticate): Requires authentication.
+
+    Raises:
+        HTTPException: If the batch holds too many products.
+    """
+    _check_batch_size(len(body))
+    products = await product_db.save_many(body)
+    return RecordResponse(
+        {
+            "message": "Products created successfully",
+            "ids": [product.id for product in products],
+        }
+    )
+
+
+@product_router.post(
+    "/products/import",
+    dependencies=[Depends(authenticate)],
+    summary="Import products from NDJSON",
+)
+async def import_products(
+    request: Request,
+    product_db: Storage = Depends(get_product_db),
+) -> dict:
+    """
+    Import products from a newline delimited JSON body, one product per
+    line.
+
+    The body is parsed and validated line by line as it is received, and
+    the valid products are inserted in batches, so the memory used does
+    not depend on the size of the upload. Invalid lines are reported and
+    skipped without aborting the import. Blank lines are ignored.
+
+    Returns:
+        dict: The number of created products, the number of invalid lines,
+            and the errors of the first `IMPORT_MAX_ERRORS` invalid lines.
+
+    Dependencies:
+        - Depends(authenticate): Requires authentication.
+    """
+    created = failed = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[ProductIn] = []
+    line_number = 0
+    async for line in iter_lines(request.stream(), IMPORT_MAX_LINE_LENGTH):
+        line_number += 1
+        if line is not None and not line.strip():
+            continue
+        try:
+            if line is None:
+                raise ValueError(
+                    f"Line longer than {IMPORT_MAX_LINE_LENGTH} bytes"
+                )
+            batch.append(ProductIn.parse_obj(orjson.loads(line)))
+        except ValidationError as exc:
+            detail: Any = exc.errors()
+        except ValueError as exc:
+            detail = [{"msg": str(exc), "type": "value_error.json"}]
+        else:
+            if len(batch) == IMPORT_BATCH_SIZE:
+                created += len(await product_db.save_many(batch))
+                batch = []
+            continue
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line_number, "detail": detail})
+    if batch:
+        created += len(await product_db.save_many(batch))
+    return {
+        "message": "Products imported",
+        "created": created,
+        "failed": failed,
+        "errors": errors,
+    }
+
+
+@product_router.delete(
+    "/products:batch",
+    dependencies=[Depends(authenticate)],
+    summary="Delete several products by ID",
+)
+async def delete_products(
+    ids: List[int] = Body(...),
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> Response:
+    """
+    Delete several products by their IDs, together with their reviews.
+
+    Args:
+        ids (List[int]): The IDs of the products, at most `batch_max_size`.
+
+    Returns:
+        Response: A JSON object holding a message and the IDs of the
+            deleted products. IDs of products that do not exist are left
+            out.
+
+    Dependencies:
+        - Depends(authenticate): Requires authentication.
+
+    Raises:
+        HTTPException: If the batch holds too many IDs.
+    """
+    _check_batch_size(len(ids))
+    products = await product_db.delete_many(ids)
+    review_ids = [
+        review.id
+        for product in products
+        for review in await review_db.scan(equal={"product_id": product.id})
+    ]
+    await review_db.delete_many(review_ids)
+    return RecordResponse(
+        {
+            "message": "Products deleted successfully.",
+            "ids": [product.id for product in products],
+        }
+    )
+
+
 @product_router.delete(
     "/products/{id}",
     dependencies=[Depends(authenticate)],
     summary="Delete a product by ID",
 )
-async def delete_product(id: int) -> dict:
+async def delete_product(
+    id: int,
+    request: Request,
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> dict:
     """
-    Delete a specific product by its ID.
+    Delete a specific product by its ID, together with its reviews.
+
+    With an `If-Match` header holding the `ETag` of the product, as last
+    read, the product is only deleted if it was not changed since,
+    otherwise the request fails with a 412.
 
     Args:
         id (int): The ID of the product.
@@ -93,13 +568,27 @@ async def delete_product(id: int) -> dict:
         - Depends(authenticate): Requires authentication.
 
     Raises:
-        HTTPException: If the product with the supplied ID does not exist.
+        HTTPException: If the product with the supplied ID does not exist,
+            or the precondition fails.
     """
-    product = await PRODUCT_DB.get(id)
+    version = await check_product_precondition(
+        request, id, product_db, review_db
+    )
+    product = await product_db.get(id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
         )
-    await PRODUCT_DB.delete(id)
+    try:
+        deleted = await product_db.delete(id, version=version)
+    except VersionConflict:
+        raise precondition_failed()
+    # The product may have been deleted by another request since.
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
+        )
+    reviews = await review_db.scan(equal={"product_id": id})
+    await review_db.delete_many([review.id for review in reviews])
 
     return {"message": "Product deleted successfully."}
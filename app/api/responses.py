@@ -0,0 +1,143 @@
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from app.database.base import Encoded
+from app.profiling import span
+
+
+def _encode_model(obj: Any) -> Any:
+    """
+    Encodes the models orjson does not know about as their field values.
+
+    Args:
+        obj (Any): The object to encode.
+
+    Returns:
+        Any: The field values of a model.
+
+    Raises:
+        TypeError: If the object is not a model.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError
+
+
+class RecordResponse(Response):
+    """
+    JSON response for records read from the database.
+
+    Stored records were validated when they were saved, so they are encoded
+    straight to JSON bytes with orjson. Returning this response from an
+    endpoint skips the validation and `jsonable_encoder` pass FastAPI runs
+    for the `response_model`, which then only documents the response.
+    Content that is already encoded, such as the cached encoding of a
+    record, is sent as is.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        with span("serialize"):
+            return orjson.dumps(content, default=_encode_model)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Checks the `If-None-Match` header of a request against an ETag.
+
+    Args:
+        request (Request): The request.
+        etag (str): The quoted ETag of the current representation.
+
+    Returns:
+        bool: True if the client already holds the representation.
+    """
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def if_match_version(
+    request: Request, encoded: Optional[Encoded]
+) -> Optional[int]:
+    """
+    Checks the `If-Match` header of a write against the current
+    representation of its target.
+
+    Args:
+        request (Request): The request.
+        encoded (Optional[Encoded]): The current representation, or None
+            if the target does not exist.
+
+    Returns:
+        Optional[int]: The version of the data item the write must still
+            find, or None if the write is not conditional on a version.
+
+    Raises:
+        HTTPException: A 412 if the header does not match, or a 501 if it
+            names a tag and the storage backend does not track versions.
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    tags = {tag.strip() for tag in header.split(",")}
+    if encoded is None:
+        raise precondition_failed()
+    if "*" in tags:
+        return None
+    if encoded.version is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Conditional writes are not supported by the storage "
+            "backend",
+        )
+    # Weak tags never match, the comparison is strong.
+    if encoded.etag not in tags:
+        raise precondition_failed()
+    return encoded.version
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Precondition failed",
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+    )
+
+
+def encoded_response(
+    request: Request,
+    encoded: Encoded,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Sends an encoded representation, or a 304 if the client holds it.
+
+    Args:
+        request (Request): The request.
+        encoded (Encoded): The representation and its ETag.
+        headers (Optional[Dict[str, str]]): Extra headers of the full
+            response.
+
+    Returns:
+        Response: The response.
+    """
+    if etag_matches(request, encoded.etag):
+        return not_modified(encoded.etag)
+    return RecordResponse(
+        encoded.body, headers={**(headers or {}), "ETag": encoded.etag}
+    )
@@ -1,22 +1,52 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import Response
 from pydantic import EmailStr
 
-from app.database.db import PRODUCT_DB
+from app.api.pagination import next_page_headers
+from app.api.responses import (
+    RecordResponse,
+    encoded_response,
+    etag_matches,
+    if_match_version,
+    not_modified,
+    precondition_failed,
+)
+from app.database.base import (
+    Encoded,
+    Requirement,
+    Storage,
+    VersionConflict,
+    make_etag,
+)
+from app.database.db import get_product_db, get_review_db
 from app.models.products import Product
-from app.models.reviews import Review, ReviewIn
+from app.models.reviews import Review, ReviewIn, ReviewSummary
+from app.profiling import span
 from app.security.authenticator import authenticate
 
 review_router = APIRouter()
 
+# Number of latest review IDs in a review summary.
+LATEST_REVIEWS = 5
+
 
-async def _get_product(product_id: int) -> Product:
+async def _get_product(product_id: int, product_db: Storage) -> Product:
     """
     Get a specific product by its ID.
 
     Args:
         product_id (int): The ID of the product.
+        product_db (Storage): The product storage.
 
     Returns:
         Product: The product information.
@@ -24,7 +54,7 @@ async def _get_product(product_id: int) -> Product:
     Raises:
         HTTPException: If the product with the supplied ID does not exist.
     """
-    product = await PRODUCT_DB.get(product_id)
+    product = await product_db.get(product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -33,39 +63,192 @@ async def _get_product(product_id: int) -> Product:
     return product
 
 
+async def review_summary(product_id: int, review_db: Storage) -> ReviewSummary:
+    """
+    Summarize the reviews of a product from the review table indexes.
+
+    Args:
+        product_id (int): The ID of the product.
+        review_db (Storage): The review storage.
+
+    Returns:
+        ReviewSummary: The review summary of the product.
+    """
+    summary = await review_db.summarize(
+        "product_id", product_id, distinct="user", latest=LATEST_REVIEWS
+    )
+    return ReviewSummary(
+        review_count=summary.total,
+        reviewer_count=summary.distinct,
+        latest_review_ids=summary.latest,
+    )
+
+
+async def encode_product(
+    product_id: int, product_db: Storage, review_db: Storage
+) -> Optional[Encoded]:
+    """
+    Encode a product with the summary of its reviews, the representation
+    of `GET /products/{id}`.
+
+    Args:
+        product_id (int): The ID of the product.
+        product_db (Storage): The product storage.
+        review_db (Storage): The review storage.
+
+    Returns:
+        Optional[Encoded]: The encoded product, with the version of the
+            stored product, or None if the product does not exist.
+    """
+    encoded = await product_db.get_encoded(product_id)
+    if encoded is None:
+        return None
+    summary = await review_summary(product_id, review_db)
+    # Splice the summary into the cached encoding of the product.
+    body = b"".join(
+        (
+            encoded.body[:-1],
+            b',"review_summary":',
+            orjson.dumps(summary.__dict__),
+            b"}",
+        )
+    )
+    return Encoded(make_etag(body), body, encoded.version)
+
+
+async def check_product_precondition(
+    request: Request, product_id: int, product_db: Storage, review_db: Storage
+) -> Optional[int]:
+    """
+    Check the `If-Match` header of a write against the current
+    representation of the product it concerns.
+
+    Args:
+        request (Request): The request.
+        product_id (int): The ID of the product.
+        product_db (Storage): The product storage.
+        review_db (Storage): The review storage.
+
+    Returns:
+        Optional[int]: The version the product must still have when it is
+            written, or None if the write is not conditional on it.
+
+    Raises:
+        HTTPException: If the precondition fails, or cannot be checked by
+            the storage backend.
+    """
+    if "if-match" not in request.headers:
+        return None
+    encoded = await encode_product(product_id, product_db, review_db)
+    return if_match_version(request, encoded)
+
+
 # Product Reviews
 @review_router.get(
     "/products/{product_id}/reviews",
     response_model=List[Review],
+    response_class=RecordResponse,
     summary="Get reviews for a product",
 )
-async def get_product_reviews(product_id: int) -> List[Review]:
+async def get_product_reviews(
+    product_id: int,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[int] = None,
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> Response:
+    """
+    Retrieve a page of reviews for a specific product, ordered by ID.
+
+    The reviews are read from the product ID index of the review table.
+    When the page is full a `Link` header with `rel="next"` points to the
+    next page.
+
+    The page is sent with a strong `ETag`; a request whose `If-None-Match`
+    header matches it is answered with a 304. When the review table tracks
+    its version the tag is checked before reading any review.
+
+    Args:
+        product_id (int): The ID of the product.
+        limit (int): The maximum number of reviews returned.
+        after (Optional[int]): Only reviews with a greater ID are returned.
+
+    Returns:
+        Response: The JSON list of reviews for the product, the
+            `response_model`, or a 304.
+
+    Raises:
+        HTTPException: If the product with the supplied ID does not exist.
+    """
+    await _get_product(product_id, product_db)
+    etag = review_db.etag()
+    if etag is not None and etag_matches(request, etag):
+        return not_modified(etag)
+    reviews = await review_db.scan(
+        after=after, limit=limit, equal={"product_id": product_id}
+    )
+    with span("serialize"):
+        body = review_db.encode_all(reviews)
+    return encoded_response(
+        request,
+        Encoded(etag or make_etag(body), body),
+        headers=next_page_headers(request, reviews, limit),
+    )
+
+
+@review_router.get(
+    "/products/{product_id}/reviews/summary",
+    response_model=ReviewSummary,
+    summary="Get the review summary of a product",
+)
+async def get_product_review_summary(
+    product_id: int,
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
+) -> ReviewSummary:
     """
-    Retrieve all reviews for a specific product.
+    Retrieve the number of reviews and reviewers of a product, and the IDs
+    of its latest reviews, newest first.
+
+    The summary is read from aggregates maintained as reviews are written,
+    without reading the reviews.
 
     Args:
         product_id (int): The ID of the product.
 
     Returns:
-        List[Review]: The list of reviews for the product.
+        ReviewSummary: The review summary of the product.
 
     Raises:
         HTTPException: If the product with the supplied ID does not exist.
     """
-    product = await _get_product(product_id)
-    return product.reviews
+    await _get_product(product_id, product_db)
+    return await review_summary(product_id, review_db)
 
 
 @review_router.post("/products/{product_id}/reviews")
 async def create_product_review(
     product_id: int,
     body: ReviewIn,
+    request: Request,
     user: EmailStr = Depends(authenticate),
+    product_db: Storage = Depends(get_product_db),
+    review_db: Storage = Depends(get_review_db),
     summary="Create a review for a product",
 ) -> dict:
     """
     Create a new review for a specific product.
 
+    Reviews are appended to the review table, the product is not rewritten.
+    With an `If-Match` header holding the `ETag` of the product, as last
+    read, the review is only created if the product was not changed since,
+    otherwise the request fails with a 412. The tag is compared when the
+    request arrives, and the product is checked again by the review
+    storage in the same critical section as the save: a review is never
+    saved for a product deleted in between, which would leave it behind,
+    nor for one written since the tag when the request is conditional.
+
     Args:
         product_id (int): The ID of the product.
         body (ReviewIn): The review information.
@@ -78,10 +261,25 @@ async def create_product_review(
         - Depends(authenticate): Requires authentication.
 
     Raises:
-        HTTPException: If the product with the supplied ID does not exist.
+        HTTPException: If the product with the supplied ID does not exist,
+            or the precondition fails.
     """
-    product = await _get_product(product_id)
-    review = Review(**body.dict(), user=user)
-    product.reviews.append(review)
-    review = await PRODUCT_DB.update(product.id, product)
+    await _get_product(product_id, product_db)
+    version = await check_product_precondition(
+        request, product_id, product_db, review_db
+    )
+    try:
+        await review_db.save(
+            body,
+            requires=Requirement(product_db, product_id, version),
+            product_id=product_id,
+            user=user,
+        )
+    except VersionConflict:
+        if "if-match" in request.headers:
+            raise precondition_failed()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found",
+        )
     return {"message": "Review created successfully"}
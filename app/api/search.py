@@ -0,0 +1,56 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
+
+from app.api.responses import RecordResponse
+from app.database.base import Storage
+from app.database.db import get_product_db, get_search_index
+from app.database.search import SearchIndex
+from app.models.search import SearchResult
+
+search_router = APIRouter()
+
+
+@search_router.get(
+    "/search",
+    response_model=List[SearchResult],
+    response_class=RecordResponse,
+    summary="Search products by name and review content",
+)
+async def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    product_db: Storage = Depends(get_product_db),
+    search_index: Optional[SearchIndex] = Depends(get_search_index),
+) -> Response:
+    """
+    Search the products whose name or reviews contain the query terms.
+
+    The products are ranked with BM25 over an inverted index holding the
+    terms of each product name and of the content of its reviews. Only the
+    posting lists of the query terms are read.
+
+    Args:
+        q (str): The query text.
+        limit (int): The maximum number of products returned.
+
+    Returns:
+        Response: The JSON list of the best matching products with their
+            score, best first, the `response_model`.
+
+    Raises:
+        HTTPException: If the storage backend does not support search.
+    """
+    if search_index is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Search is not supported by the storage backend",
+        )
+    results = []
+    for id, score in search_index.search(q, limit):
+        product = await product_db.get(id)
+        # A deleted product may linger while its reviews are deleted.
+        if product is not None:
+            results.append({"product": product, "score": score})
+    return RecordResponse(results)
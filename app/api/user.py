@@ -1,19 +1,21 @@
 # User endpoints
-
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.database.db import USER_DB
+from app.database.base import UserStorage
+from app.database.db import get_user_db
 from app.models.users import User, UserToken
-from app.security.hash import Hasher
+from app.security.hash import AsyncHasher
 from app.security.jwt import create_token
 
 user_router = APIRouter()
-hasher = Hasher()
+hasher = AsyncHasher()
 
 
 @user_router.post("/user/signup", summary="Create a new user")
-async def sign_up(user: User) -> dict:
+async def sign_up(
+    user: User, user_db: UserStorage = Depends(get_user_db)
+) -> dict:
     """
     Create a new user.
 
@@ -24,24 +26,34 @@ async def sign_up(user: User) -> dict:
         dict: A message indicating the successful creation of the user.
 
     Raises:
-        HTTPException: If the user with the supplied email already exists.
+        HTTPException: If the user with the supplied email already exists,
+            or if the hashing pool is saturated.
     """
-    user_passwd = USER_DB.get(user.email)
+    user_passwd = await user_db.fetch(user.email)
     if user_passwd:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="User exists already.",
         )
-    hashed_password = hasher.create(user.password)
+    hashed_password = await hasher.create(user.password)
+    # Another sign up for the same email may have finished while hashing.
+    if await user_db.fetch(user.email) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User exists already.",
+        )
     user.password = hashed_password
-    USER_DB[user.email] = user.password
+    await user_db.put(user.email, user.password)
     return {"message": "User created successfully"}
 
 
 @user_router.post(
     "/user/signin", response_model=UserToken, summary="User authentication"
 )
-async def sign_in(form: OAuth2PasswordRequestForm = Depends()) -> dict:
+async def sign_in(
+    form: OAuth2PasswordRequestForm = Depends(),
+    user_db: UserStorage = Depends(get_user_db),
+) -> dict:
     """
     Authenticate a user and generate an access token.
 
@@ -53,15 +65,16 @@ async def sign_in(form: OAuth2PasswordRequestForm = Depends()) -> dict:
         dict: The access token and token type.
 
     Raises:
-        HTTPException: If the credentials are invalid.
+        HTTPException: If the credentials are invalid, or if the hashing
+            pool is saturated.
     """
-    user_passwd = USER_DB.get(form.username)
+    user_passwd = await user_db.fetch(form.username)
     if not user_passwd:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials.",
         )
-    if hasher.verify(form.password, user_passwd):
+    if await hasher.verify(form.password, user_passwd):
         access_token = create_token(form.username)
         return {"access_token": access_token, "token_type": "Bearer"}
 
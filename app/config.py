@@ -0,0 +1,102 @@
+"""
+Configuration module for the application.
+
+Settings are read from environment variables (or a `.env` file) so that the
+same image can be tuned per deployment without code changes.
+"""
+import os
+from typing import List, Optional
+
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    """
+    Application settings.
+
+    Attributes:
+        hasher_executor (str): Pool used for password hashing, either
+            "thread" or "process".
+        hasher_max_workers (int): Number of workers in the hashing pool.
+        hasher_max_pending (int): Maximum number of hashing jobs queued or
+            running at once. Further jobs are rejected with a 429.
+        data_dir (Optional[str]): Directory where the databases are
+            journaled. The databases only live in memory if unset.
+        wal_fsync (str): When the write-ahead log is forced to disk:
+            "always", "interval" or "never".
+        wal_commit_interval (float): Seconds to wait for more writes
+            before committing a group to the write-ahead log.
+        wal_fsync_interval (float): Seconds between forced writes with
+            the "interval" fsync policy.
+        snapshot_interval (float): Seconds between database snapshots.
+        storage (str): Storage backend: "memory", "sqlite" or "shared".
+        sqlite_path (str): Path of the database file of the "sqlite"
+            backend.
+        sqlite_pool_size (int): Number of pooled connections per table of
+            the "sqlite" backend.
+        shared_dir (str): Directory of the change logs of the "shared"
+            backend, written by the writer process.
+        shared_socket (str): Path of the Unix socket the writer process of
+            the "shared" backend listens on.
+        jwt_secret (Optional[str]): Key signing the access tokens. A random
+            key is generated if unset, which only works with one worker.
+        token_cache_size (int): Maximum number of verified access tokens
+            kept in the cache.
+        batch_max_size (int): Maximum number of products created or
+            deleted by one batch request.
+        compact_storage (bool): Whether the "memory" backend stores the
+            records as tuples of field values, which takes less memory but
+            builds a model instance on every read.
+        profiling (bool): Whether requests may be profiled, see
+            `app.profiling`.
+        profile_sample_rate (float): Fraction of the requests profiled
+            without asking for it, when profiling is on.
+        profile_history (int): Number of latest request profiles kept.
+        admin_users (List[str]): Emails of the users allowed to use the
+            admin endpoints.
+        change_feed_size (int): Number of latest product changes kept for
+            the consumers of the change feed.
+        change_feed_keepalive (float): Seconds between keepalive comments
+            sent to idle consumers of the change feed.
+        write_batch_size (int): Number of concurrent writes to a collection
+            of the "memory" or "sqlite" backend applied together. Writes
+            are applied one by one if 1.
+        write_batch_interval (float): Seconds a write waits for others to
+            be batched with, at most.
+        encoded_cache_size (int): Maximum number of records per collection
+            of the "memory" or "shared" backend whose JSON encoding is
+            cached.
+    """
+
+    hasher_executor: str = "thread"
+    hasher_max_workers: int = os.cpu_count() or 1
+    hasher_max_pending: int = 4 * (os.cpu_count() or 1)
+    data_dir: Optional[str] = None
+    wal_fsync: str = "always"
+    wal_commit_interval: float = 0.0
+    wal_fsync_interval: float = 1.0
+    snapshot_interval: float = 300.0
+    storage: str = "memory"
+    sqlite_path: str = "app.db"
+    sqlite_pool_size: int = 4
+    shared_dir: str = "shared"
+    shared_socket: str = "writer.sock"
+    jwt_secret: Optional[str] = None
+    token_cache_size: int = 10_000
+    batch_max_size: int = 10_000
+    compact_storage: bool = False
+    profiling: bool = False
+    profile_sample_rate: float = 0.0
+    profile_history: int = 20
+    admin_users: List[str] = []
+    change_feed_size: int = 10_000
+    change_feed_keepalive: float = 15.0
+    write_batch_size: int = 1
+    write_batch_interval: float = 0.002
+    encoded_cache_size: int = 10_000
+
+    class Config:
+        env_file = ".env"
+
+
+settings = Settings()
@@ -0,0 +1,426 @@
+"""
+Storage protocol of the application.
+
+This module provides the `Storage` abstract class, the asynchronous interface
+every storage backend implements. The routers only depend on this interface
+and receive the configured backend through FastAPI dependencies, see
+`app.database.db.get_product_db`.
+
+It also provides `Encoded`, a data item encoded as JSON bytes together with
+its strong ETag, which the read endpoints send as is.
+
+The user table implements `UserStorage`, a mapping of emails to password
+hashes read with `fetch` and written with `put`, which returns once the
+write is durable.
+
+Every backend tracks record versions, which make writes conditional: `update`
+and `delete` take the version of the data item the caller read, and raise
+`VersionConflict` if it was written since.
+A new data item may also require an item of another collection of the same
+backend, see `Requirement`, which `save` checks atomically with the write.
+"""
+import hashlib
+from abc import ABC, abstractmethod
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import orjson
+
+from app.database.changes import ChangeFeed
+
+
+class Encoded(NamedTuple):
+    etag: str
+    body: bytes
+    # The version of the data item encoded, None if the representation is
+    # not that of a single stored item.
+    version: Optional[int] = None
+
+
+class VersionConflict(Exception):
+    """
+    Raised by a conditional write when the data item was written since the
+    version the caller expected.
+    """
+
+
+class Requirement(NamedTuple):
+    """
+    A data item of another collection of the same backend that a new data
+    item requires, such as the product of a review.
+    """
+
+    storage: "Storage"
+    id: int
+    # The version the item must still have, see `Encoded.version`. Only its
+    # existence is required if None.
+    version: Optional[int] = None
+
+
+class Summary(NamedTuple):
+    total: int
+    distinct: int
+    latest: List[int]
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Builds a strong ETag from the bytes of a representation.
+
+    Args:
+        body (bytes): The encoded representation.
+
+    Returns:
+        str: The quoted entity tag.
+    """
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def encode(data: Any) -> Encoded:
+    """
+    Encodes a data item as JSON.
+
+    Args:
+        data (Any): The data item, a model instance.
+
+    Returns:
+        Encoded: The JSON bytes of the item and their ETag.
+    """
+    body = orjson.dumps(data.__dict__)
+    return Encoded(make_etag(body), body)
+
+
+class Storage(ABC):
+    model: Any
+    # The feed of the mutations, if the backend keeps one.
+    changes: Optional[ChangeFeed] = None
+
+    @abstractmethod
+    async def get(self, index: int) -> Any:
+        """
+        Retrieves a data item by its ID.
+
+        Args:
+            index (int): The ID of the data item to retrieve.
+
+        Returns:
+            Any: The data item with the specified ID, or None if not found.
+        """
+
+    @abstractmethod
+    async def get_all(self) -> List[Any]:
+        """
+        Retrieves all data items in the collection.
+
+        Returns:
+            List[Any]: A list of all data items in the collection.
+        """
+
+    @abstractmethod
+    async def scan(
+        self,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        """
+        Retrieves a page of data items in ascending ID order.
+
+        Args:
+            after (Optional[int]): Only items with an ID greater than this
+                one are returned. Starts from the first item if None.
+            limit (Optional[int]): The maximum number of items returned.
+                Returns every remaining item if None.
+            equal (Optional[Dict[str, Any]]): Field values the items must
+                be equal to.
+            prefix (Optional[Dict[str, str]]): Prefixes the field values
+                must start with.
+            between (Optional[Dict[str, Tuple[Any, Any]]]): Inclusive
+                ranges the field values must fall in.
+
+        Returns:
+            List[Any]: The data items of the page.
+
+        Raises:
+            ValueError: If a condition targets a field without an index.
+        """
+
+    @abstractmethod
+    async def scan_sorted(
+        self,
+        field: str,
+        limit: int,
+        descending: bool = False,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        """
+        Retrieves the first data items in the order of a field.
+
+        Args:
+            field (str): The field to order by.
+            limit (int): The maximum number of items returned.
+            descending (bool): Whether the highest values come first.
+            equal (Optional[Dict[str, Any]]): Field values the items must
+                be equal to.
+            prefix (Optional[Dict[str, str]]): Prefixes the field values
+                must start with.
+            between (Optional[Dict[str, Tuple[Any, Any]]]): Inclusive
+                ranges the field values must fall in.
+
+        Returns:
+            List[Any]: The data items, ordered by the field, then by ID.
+
+        Raises:
+            ValueError: If a field is not indexed as required.
+        """
+
+    @abstractmethod
+    async def save(
+        self, data: Any, requires: Optional[Requirement] = None, **fields: Any
+    ) -> Any:
+        """
+        Saves a new data item to the collection.
+
+        Args:
+            data (Any): The data item to save.
+            requires (Optional[Requirement]): A data item the saved item
+                requires, checked in the same critical section as the
+                write.
+            **fields (Any): Extra fields to set on the saved item.
+
+        Returns:
+            Any: The saved data item with the assigned ID.
+
+        Raises:
+            VersionConflict: If the required data item was deleted, or
+                written since its required version.
+            ValueError: If the required data item is stored by another
+                backend.
+        """
+
+    @abstractmethod
+    async def save_many(self, items: Sequence[Any]) -> List[Any]:
+        """
+        Saves new data items to the collection at once.
+
+        Args:
+            items (Sequence[Any]): The data items to save.
+
+        Returns:
+            List[Any]: The saved data items with their assigned IDs, in the
+                order of `items`.
+        """
+
+    @abstractmethod
+    async def update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Any:
+        """
+        Updates a data item in the collection.
+
+        Args:
+            id (int): The ID of the data item to update.
+            data (Any): The updated data item.
+            version (Optional[int]): The version the stored data item must
+                still have, see `Encoded.version`. Not checked if None.
+
+        Returns:
+            Any: The updated data item, or None if not found.
+
+        Raises:
+            ValueError: If the ID in the data item does not match the key ID.
+            VersionConflict: If the data item was written since `version`.
+        """
+
+    @abstractmethod
+    async def delete(self, index: int, version: Optional[int] = None) -> Any:
+        """
+        Deletes a data item from the collection.
+
+        Args:
+            index (int): The ID of the data item to delete.
+            version (Optional[int]): The version the stored data item must
+                still have. Not checked if None.
+
+        Returns:
+            Any: The deleted data item, or None if not found.
+
+        Raises:
+            VersionConflict: If the data item was written since `version`.
+        """
+
+    @abstractmethod
+    async def delete_many(self, indexes: Iterable[int]) -> List[Any]:
+        """
+        Deletes data items from the collection at once.
+
+        Args:
+            indexes (Iterable[int]): The IDs of the data items to delete.
+
+        Returns:
+            List[Any]: The deleted data items. IDs that were not found are
+                skipped.
+        """
+
+    @abstractmethod
+    async def summarize(
+        self, field: str, value: Any, distinct: str, latest: int
+    ) -> Summary:
+        """
+        Summarizes the data items holding a field value.
+
+        Args:
+            field (str): The field grouping the data items.
+            value (Any): The value of the group.
+            distinct (str): The field whose distinct values are counted.
+            latest (int): The number of latest IDs returned.
+
+        Returns:
+            Summary: The number of data items in the group, the number of
+                distinct values of `distinct` among them, and their
+                `latest` highest IDs, newest first.
+
+        Raises:
+            ValueError: If the fields are not indexed for summaries.
+        """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """
+        Removes all data items and resets the ID counter.
+        """
+
+    @abstractmethod
+    async def get_encoded(self, index: int) -> Optional[Encoded]:
+        """
+        Retrieves a data item by its ID, encoded as JSON.
+
+        Args:
+            index (int): The ID of the data item to retrieve.
+
+        Returns:
+            Optional[Encoded]: The encoded data item, with its version, or
+                None if not found.
+        """
+
+    def encode_all(self, items: Iterable[Any]) -> bytes:
+        """
+        Encodes data items read from the collection as a JSON array.
+
+        Args:
+            items (Iterable[Any]): The data items.
+
+        Returns:
+            bytes: The JSON array.
+        """
+        return b"[" + b",".join(encode(data).body for data in items) + b"]"
+
+    def encode_lines(self, items: Iterable[Any]) -> bytes:
+        """
+        Encodes data items read from the collection as JSON lines.
+
+        Args:
+            items (Iterable[Any]): The data items.
+
+        Returns:
+            bytes: One JSON document per item, each ending with a newline.
+        """
+        return b"".join(encode(data).body + b"\n" for data in items)
+
+    async def iter_chunks(self, size: int) -> AsyncIterator[List[Any]]:
+        """
+        Iterates over all the data items in ascending ID order, in chunks.
+
+        This default implementation reads one page per chunk with `scan`,
+        so items written during the iteration may or may not be seen.
+        Backends override it to iterate over a consistent snapshot.
+
+        Args:
+            size (int): The number of data items per chunk.
+
+        Yields:
+            List[Any]: The next chunk of data items.
+        """
+        after = None
+        while True:
+            chunk = await self.scan(after=after, limit=size)
+            if not chunk:
+                return
+            yield chunk
+            after = chunk[-1].id
+
+    def etag(self) -> Optional[str]:
+        """
+        Returns a strong ETag for the state of the whole collection.
+
+        The tag changes on every mutation, so any representation built from
+        the collection can be tagged with it.
+
+        Returns:
+            Optional[str]: The quoted entity tag, or None if the backend
+                cannot track the mutations of other processes.
+        """
+        return None
+
+    def _dump(self, data: Any) -> Tuple[Any, ...]:
+        """
+        Encodes a data item as the tuple of its field values.
+        """
+        return tuple(getattr(data, field) for field in self.model.__fields__)
+
+    def _restore(self, values: Tuple[Any, ...]) -> Any:
+        """
+        Decodes a data item encoded by `_dump`.
+        """
+        # Stored items were validated when first saved, so skip the
+        # validation like `construct` does, without its per-call overhead.
+        fields = self.model.__fields__
+        data = self.model.__new__(self.model)
+        object.__setattr__(data, "__dict__", dict(zip(fields, values)))
+        object.__setattr__(data, "__fields_set__", set(fields))
+        return data
+
+
+class UserStorage(MutableMapping[str, str]):
+    """
+    Interface of the user table, mapping emails to password hashes.
+
+    The mapping methods may block and do not wait for a write to be
+    durable; the request handlers use `fetch` and `put`, which do neither.
+    """
+
+    @abstractmethod
+    async def fetch(self, key: str) -> Optional[str]:
+        """
+        Retrieves a value without blocking the event loop.
+
+        Args:
+            key (str): The key, an email.
+
+        Returns:
+            Optional[str]: The value, or None if the key is not found.
+        """
+
+    @abstractmethod
+    async def put(self, key: str, value: str) -> None:
+        """
+        Stores a value and waits until the write is durable.
+
+        Args:
+            key (str): The key, an email.
+            value (str): The value, a password hash.
+        """
@@ -0,0 +1,134 @@
+"""
+Write batching for the storage backends.
+
+Concurrent writes are queued by a `WriteBatcher` instead of being applied
+one by one: the queue is flushed as a single batch once it holds
+`size` writes, or `interval` seconds after the first write was queued,
+whichever comes first. The backend applies a batch under one acquisition
+of its lock, or in one transaction, and commits it at once, and the
+callers of the writes are all answered together.
+
+The interval trades latency for throughput: every write waits up to
+`interval` seconds longer, while the fixed cost of a write, taking the
+lock, committing the journal or a SQLite transaction, is paid once per
+batch rather than once per write. With an interval of 0 only the writes
+queued during the same iteration of the event loop are batched.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional, Set
+
+
+class Write(NamedTuple):
+    # "save", "update" or "delete".
+    op: str
+    # The arguments of the operation: (data, fields, requires) for "save",
+    # (id, data, version) for "update" and (index, version) for "delete".
+    args: tuple
+
+
+# Applies a batch of writes in order. Returns the result of every write,
+# or the exception it failed with, in the order of the batch.
+ApplyBatch = Callable[[List[Write]], Awaitable[List[Any]]]
+
+
+class WriteBatcher:
+    def __init__(self, apply: ApplyBatch, size: int, interval: float) -> None:
+        """
+        Initializes the WriteBatcher instance.
+
+        Args:
+            apply (ApplyBatch): Applies a batch of writes to the backend.
+            size (int): The number of queued writes flushing the queue.
+            interval (float): The maximum number of seconds a write is
+                queued for.
+
+        Attributes:
+            pending (List[Write]): The queued writes, oldest first.
+            futures (List[asyncio.Future]): Resolved with the results of
+                the queued writes, in the order of `pending`.
+            timer (Optional[asyncio.Handle]): Flushes the queue once the
+                interval of its oldest write elapsed.
+            flushes (Set[asyncio.Task]): The batches being applied.
+        """
+        self.apply: ApplyBatch = apply
+        self.size: int = size
+        self.interval: float = interval
+        self.pending: List[Write] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.Handle] = None
+        self.flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, op: str, *args: Any) -> Any:
+        """
+        Queues a write and waits for the batch holding it to be applied.
+
+        Args:
+            op (str): The operation: "save", "update" or "delete".
+            *args (Any): The arguments of the operation.
+
+        Returns:
+            Any: The result of the write.
+
+        Raises:
+            Exception: The exception the write failed with.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(Write(op, args))
+        self.futures.append(future)
+        if len(self.pending) >= self.size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.interval, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """
+        Starts applying the queued writes as a batch.
+
+        Batches are applied in the order they are flushed, since each one
+        queues for the lock, or the connection, of the backend in turn.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        writes, futures = self.pending, self.futures
+        self.pending, self.futures = [], []
+        task = asyncio.get_running_loop().create_task(
+            self._apply(writes, futures)
+        )
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def _apply(
+        self, writes: List[Write], futures: List[asyncio.Future]
+    ) -> None:
+        try:
+            results = await self.apply(writes)
+        except Exception as error:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        for future, result in zip(futures, results):
+            # A caller may have been cancelled while its write was queued.
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def drain(self) -> None:
+        """
+        Applies the queued writes and waits for every batch to be applied.
+        """
+        self.flush()
+        while self.flushes:
+            await asyncio.wait(set(self.flushes))
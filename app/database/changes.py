@@ -0,0 +1,114 @@
+"""
+Change feed of the in-memory `Database`.
+
+Every mutation of a collection is recorded as a `Change` holding the
+operation, the ID of the data item and the version of the collection after
+the mutation, in a ring buffer of the latest changes. Consumers read the
+changes newer than the last version they saw, and wait for the next ones.
+
+Writers only append to the buffer and wake the waiting consumers up, with
+a single future they all share, so a write costs the same however many
+consumers there are. A consumer that falls behind by more changes than the
+buffer holds is told to resync instead.
+"""
+import asyncio
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+
+
+class Change(NamedTuple):
+    op: str
+    id: Optional[int]
+    version: int
+
+
+class ChangeFeed:
+    def __init__(self, size: int) -> None:
+        """
+        Initializes the ChangeFeed instance.
+
+        Args:
+            size (int): The maximum number of changes kept.
+
+        Attributes:
+            changes (Deque[Change]): The latest changes, oldest first.
+            version (int): The version of the latest change.
+            dropped (int): The version of the latest change dropped from
+                the buffer. Consumers older than it must resync.
+            waiter (Optional[asyncio.Future]): Resolved on the next change.
+        """
+        self.changes: Deque[Change] = deque(maxlen=size)
+        self.version: int = 0
+        self.dropped: int = 0
+        self.waiter: Optional[asyncio.Future] = None
+
+    def append(self, op: str, id: Optional[int], version: int) -> None:
+        """
+        Records a change and wakes the waiting consumers up.
+
+        Args:
+            op (str): The operation: "put", "delete" or "reset".
+            id (Optional[int]): The ID of the data item, None for "reset".
+            version (int): The version of the collection after the change.
+                Changes applied together share a version.
+        """
+        if len(self.changes) == self.changes.maxlen:
+            self.dropped = self.changes[0].version
+        self.changes.append(Change(op, id, version))
+        self.version = version
+        if self.waiter is not None:
+            if not self.waiter.done():
+                self.waiter.set_result(None)
+            self.waiter = None
+
+    def restart(self, version: int) -> None:
+        """
+        Drops the changes, after the collection was recovered, so that
+        every consumer resyncs with the recovered version.
+
+        Args:
+            version (int): The version of the recovered collection.
+        """
+        self.changes.clear()
+        self.version = self.dropped = version
+
+    def since(self, version: int) -> Optional[List[Change]]:
+        """
+        Returns the changes newer than a version.
+
+        Args:
+            version (int): The version the consumer last saw.
+
+        Returns:
+            Optional[List[Change]]: The changes, oldest first, or None if
+                some were dropped or the version is unknown, in which case
+                the consumer must resync.
+        """
+        if version < self.dropped or version > self.version:
+            return None
+        changes = []
+        for change in reversed(self.changes):
+            if change.version <= version:
+                break
+            changes.append(change)
+        changes.reverse()
+        return changes
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        Waits for the next change.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait.
+
+        Returns:
+            bool: True if a change was recorded, False on timeout.
+        """
+        if self.waiter is None:
+            self.waiter = asyncio.get_running_loop().create_future()
+        try:
+            # Shielded, the future is shared with the other consumers.
+            await asyncio.wait_for(asyncio.shield(self.waiter), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
@@ -0,0 +1,106 @@
+"""
+Compact record storage for the in-memory `Database`.
+
+A pydantic model instance carries a `__dict__` and a `__fields_set__` set on
+top of its field values, several hundred bytes per record. `CompactDict`
+stores every record as the plain tuple of its field values instead, and
+rebuilds a model instance each time a record is read, trading some CPU on
+reads for a much smaller collection.
+"""
+from collections.abc import MutableMapping
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from app.database.snapshot import MappedRows
+
+Row = Tuple[Any, ...]
+
+
+class CompactDict(MutableMapping):
+    """
+    Dictionary of model instances stored as tuples of field values.
+
+    Reads return a new model instance on every call, so stored records can
+    only be compared by value, see `holds`.
+    """
+
+    def __init__(
+        self,
+        dump: Callable[[Any], Row],
+        restore: Callable[[Row], Any],
+        rows: Optional["MappedRows"] = None,
+    ) -> None:
+        """
+        Initializes the CompactDict instance.
+
+        Args:
+            dump (Callable[[Any], Row]): Encodes a model instance as the
+                tuple of its field values.
+            restore (Callable[[Row], Any]): Decodes a tuple encoded by
+                `dump`.
+            rows (Optional[MappedRows]): The rows of a recovered
+                catalogue. An empty dictionary if None.
+
+        Attributes:
+            rows (Union[Dict[Any, Row], MappedRows]): The stored tuples,
+                by key, a dictionary or the `MappedRows` of a recovered
+                catalogue.
+        """
+        self.dump = dump
+        self.restore = restore
+        self.rows: Union[Dict[Any, Row], "MappedRows"] = (
+            dict() if rows is None else rows
+        )
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.restore(self.rows[key])
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        row = self.rows.get(key)
+        return default if row is None else self.restore(row)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.rows[key] = self.dump(value)
+
+    def __delitem__(self, key: Any) -> None:
+        del self.rows[key]
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self.rows and default:
+            return default[0]
+        return self.restore(self.rows.pop(key))
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.rows
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def clear(self) -> None:
+        self.rows.clear()
+
+    def holds(self, key: Any, value: Any) -> bool:
+        """
+        Tells whether a model instance is the one stored under a key.
+
+        Args:
+            key (Any): The key.
+            value (Any): The model instance.
+
+        Returns:
+            bool: True if the stored record has the same field values.
+        """
+        row = self.rows.get(key)
+        return row is not None and row == self.dump(value)
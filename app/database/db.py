@@ -1,53 +1,511 @@
 """
 Database module for the application.
 
-This module provides a thread-safe database implementation for managing data
-storage. It contains the `Database` class, which serves as a wrapper around a
-dictionary, providing thread safety by using locks for operations. Faking the
-ACID database properties.
+This module provides an asyncio-safe database implementation for managing
+data storage. It contains the `Database` class, which serves as a wrapper
+around a dictionary. Faking the ACID database properties.
+
+Concurrency model: all access happens on the event loop thread, so any code
+path without an `await` runs atomically. Reads never take a lock, they look
+up the dictionary directly. Stored items are treated as immutable snapshots:
+writers replace an item by a new object instead of mutating it in place, so
+a reader always sees a complete item. Mutations are serialized by an
+`asyncio.Lock`, which yields to other tasks while waiting instead of
+blocking the event loop like a `threading.Lock` would. Concurrent writes
+can be queued and applied in batches, see `app.database.batching`.
+
+The backend is pluggable: the routers get the databases through the
+`get_*_db` dependencies, and `open_dbs` can swap the in-memory databases
+for SQLite tables shared by several worker processes, or for replicas of
+the in-memory databases of a single writer process.
+
+Reads of hot records are served from a bounded LRU cache of their JSON
+encoding, dropped whenever the record is written. A collection version
+counter, incremented on every mutation, tags the state of the whole
+collection, and every record keeps the version of its last write, which
+conditional writes check.
+
+In compact mode the records are stored as tuples of field values, see
+`CompactDict`, and only built into model instances when read. Together with
+interning repeated strings such as categories, this makes large collections
+take a fraction of the memory.
+
+Durability is optional: `open_dbs` attaches a `Journal` to every database,
+which logs each mutation and takes snapshots, and recovers the databases
+from it on startup. The snapshots are mapped in memory and read in place,
+see `app.database.snapshot`.
 """
-from threading import Lock
-from typing import Any, Dict, List
+import asyncio
+import secrets
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from app.config import settings
+from app.database.base import (
+    Encoded,
+    Requirement,
+    Storage,
+    Summary,
+    UserStorage,
+    VersionConflict,
+    encode,
+)
+from app.database.batching import Write, WriteBatcher
+from app.database.changes import ChangeFeed
+from app.database.compact import CompactDict
+from app.database.indexes import (
+    MAX_CHAR,
+    DistinctIndex,
+    HashIndex,
+    NumericIndex,
+    SortedIndex,
+)
+from app.database.journal import Journal
+from app.database.search import SearchIndex, TextIndex
+from app.database.snapshot import Catalogue, CatalogueSnapshots, MappedRows
+from app.database.sqlite import SqliteDatabase, SqliteDict
+from app.metrics import Gauge, Histogram, TimedLock
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+# Listener of the mutations of a database: called with the operation, the
+# key and the new value.
+Listener = Callable[[str, Any, Any], None]
+
+LOCK_WAIT = Histogram(
+    "db_lock_wait_seconds",
+    "Time spent waiting for the write lock of a collection.",
+    ("collection",),
+)
+LOCK_HOLD = Histogram(
+    "db_lock_hold_seconds",
+    "Time the write lock of a collection is held.",
+    ("collection",),
+)
+
+
+class EncodedCache:
+    """
+    Bounded LRU cache of the JSON encoding of the data items of a
+    collection, keyed on their ID.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Initializes the EncodedCache instance.
+
+        Args:
+            max_size (int): The maximum number of cached encodings.
+        """
+        self.max_size: int = max_size
+        self.entries: "OrderedDict[int, Encoded]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, index: int) -> Optional[Encoded]:
+        """
+        Returns the cached encoding of a data item, marking it as recently
+        used.
+
+        Args:
+            index (int): The ID of the data item.
+
+        Returns:
+            Optional[Encoded]: The encoding, or None if not cached.
+        """
+        encoded = self.entries.get(index)
+        if encoded is not None:
+            self.entries.move_to_end(index)
+        return encoded
+
+    def put(self, index: int, encoded: Encoded) -> None:
+        """
+        Caches the encoding of a data item, evicting the least recently
+        used one if the cache is full.
+
+        Args:
+            index (int): The ID of the data item.
+            encoded (Encoded): The encoding.
+        """
+        self.entries[index] = encoded
+        self.entries.move_to_end(index)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, index: int) -> None:
+        self.entries.pop(index, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class RecordVersions:
+    """
+    Versions of the data items of a collection, packed in an array indexed
+    by ID.
+
+    IDs are assigned in sequence, so the array is dense: a version takes 8
+    bytes, instead of a dictionary entry and an integer object per item.
+    Items without a version, such as the ones recovered from a snapshot
+    and not written since, are at version 0.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the RecordVersions instance.
+
+        Attributes:
+            values (array): The version of every ID up to the highest one
+                written.
+        """
+        self.values: array = array("q")
 
-from app.models.products import Product
-from app.models.reviews import Review
+    def get(self, index: int) -> int:
+        if 0 <= index < len(self.values):
+            return self.values[index]
+        return 0
 
+    def set(self, index: int, version: int) -> None:
+        missing = index + 1 - len(self.values)
+        if missing > 0:
+            self.values.frombytes(bytes(missing * self.values.itemsize))
+        self.values[index] = version
 
-class Database:
-    def __init__(self, model: Any) -> None:
+    def discard(self, index: int) -> None:
+        if 0 <= index < len(self.values):
+            self.values[index] = 0
+
+    def clear(self) -> None:
+        del self.values[:]
+
+
+class Database(Storage):
+    def __init__(
+        self,
+        model: Any,
+        hash_indexes: Sequence[str] = (),
+        sorted_indexes: Sequence[str] = (),
+        numeric_indexes: Sequence[str] = (),
+        text_indexes: Sequence[TextIndex] = (),
+        distinct_indexes: Sequence[Tuple[str, str]] = (),
+        compact: bool = False,
+        interned_fields: Sequence[str] = (),
+        write_batch_size: int = 1,
+        write_batch_interval: float = 0.0,
+        encoded_cache_size: int = 10_000,
+    ) -> None:
         """
         Initializes the Database instance.
 
         Args:
             model (Any): The model class representing the data structure.
+            hash_indexes (Sequence[str]): The fields to index for equality
+                lookups.
+            sorted_indexes (Sequence[str]): The fields to index for range
+                and prefix lookups.
+            numeric_indexes (Sequence[str]): The text fields holding
+                numbers to index for numeric range lookups and ordering.
+            text_indexes (Sequence[TextIndex]): The text fields to index
+                for full-text search.
+            distinct_indexes (Sequence[Tuple[str, str]]): The (group,
+                field) pairs whose distinct values are counted per group,
+                for summaries. The group field needs a hash index.
+            compact (bool): Whether to store the data items as tuples of
+                field values rather than model instances.
+            interned_fields (Sequence[str]): The text fields whose values
+                are interned, so that items holding the same value share a
+                single string.
+            write_batch_size (int): The number of concurrent writes
+                applied together, see `WriteBatcher`. Writes are applied
+                one by one if 1.
+            write_batch_interval (float): The maximum number of seconds a
+                write waits for others to be batched with.
+            encoded_cache_size (int): The maximum number of data items
+                whose JSON encoding is cached.
 
         Attributes:
             index (int): The index counter for assigning IDs to data.
-            collection (Dict[int, Any]): The collection of data items.
+            collection (MutableMapping[int, Any]): The collection of data
+                items, a `CompactDict` in compact mode or once recovered
+                from a catalogue.
+            ids (List[int]): The IDs in the collection, in ascending order.
             model (Any): The model class representing the data structure.
-            lock (Lock): The lock object for thread safety.
+            lock (asyncio.Lock): The lock serializing mutations, timed in
+                the metrics under the lowercase name of the model.
+            hash_indexes (Dict[str, HashIndex]): The equality indexes.
+            sorted_indexes (Dict[str, SortedIndex]): The range indexes,
+                numeric ones included.
+            text_indexes (List[TextIndex]): The full-text indexes.
+            distinct_indexes (Dict[Tuple[str, str], DistinctIndex]): The
+                distinct value counters.
+            journal (Optional[Journal]): The journal making mutations
+                durable, if any. Attached by `load`.
+            encoded (EncodedCache): The cached JSON encoding of the data
+                items most recently read since they were last written.
+            version (int): The mutation counter of the collection.
+            epoch (str): Random tag telling the counters of different
+                processes, or of restarts, apart.
+            shared_fields (Dict[Any, bool]): Whether each input model
+                shares its fields with the model, see `_shares_fields`.
+            interned_fields (Tuple[str, ...]): The interned text fields.
+            listeners (List[Listener]): Called with the operation, ID and
+                new data item of every mutation, in the order they are
+                applied.
+            snapshots (CatalogueSnapshots): The format of the journal
+                snapshots.
+            indexes_stale (bool): Whether the indexes are yet to be built
+                for the recovered collection, see `ensure_indexes`.
+            changes (Optional[ChangeFeed]): The latest mutations, tagged
+                with the version they brought the collection to.
+            batcher (Optional[WriteBatcher]): Queues the writes to apply
+                them in batches, if batching is on.
+            versions (RecordVersions): The version of every data item
+                written since startup, the version of the collection after
+                its last write. Data items recovered from a snapshot and
+                not written since are at version 0.
         """
         self.index: int = 0
-        self.collection: Dict[int, Any] = dict()
+        self.collection: MutableMapping[int, Any] = (
+            CompactDict(self._dump, self._restore) if compact else dict()
+        )
+        self.ids: List[int] = []
         self.model: Any = model
-        self.lock: Lock = Lock()
+        self.lock: asyncio.Lock = TimedLock(
+            LOCK_WAIT, LOCK_HOLD, model.__name__.lower()
+        )
+        self.hash_indexes: Dict[str, HashIndex] = {
+            field: HashIndex(field) for field in hash_indexes
+        }
+        self.sorted_indexes: Dict[str, SortedIndex] = {
+            field: SortedIndex(field) for field in sorted_indexes
+        }
+        self.sorted_indexes.update(
+            (field, NumericIndex(field)) for field in numeric_indexes
+        )
+        self.text_indexes: List[TextIndex] = list(text_indexes)
+        self.distinct_indexes: Dict[Tuple[str, str], DistinctIndex] = {
+            (group, field): DistinctIndex(group, field)
+            for group, field in distinct_indexes
+        }
+        self.journal: Optional[Journal] = None
+        self.encoded: EncodedCache = EncodedCache(encoded_cache_size)
+        self.version: int = 0
+        self.epoch: str = secrets.token_hex(4)
+        self.shared_fields: Dict[Any, bool] = dict()
+        self.interned_fields: Tuple[str, ...] = tuple(interned_fields)
+        self.listeners: List[Listener] = []
+        self.snapshots = CatalogueSnapshots(list(model.__fields__).index("id"))
+        self.indexes_stale: bool = False
+        self.changes: Optional[ChangeFeed] = ChangeFeed(
+            settings.change_feed_size
+        )
+        self.batcher: Optional[WriteBatcher] = (
+            WriteBatcher(
+                self._write_batch, write_batch_size, write_batch_interval
+            )
+            if write_batch_size > 1
+            else None
+        )
+        self.versions: RecordVersions = RecordVersions()
 
-    def _insert_id_and_review(self, data: Any, index: int) -> Any:
+    def _insert_id(self, data: Any, index: int, **fields: Any) -> Any:
         """
-        Inserts the ID and an empty list of reviews into the data object.
+        Builds a model instance from the data object and the ID.
 
         Args:
-            data (Any): The data object to insert the ID and reviews.
+            data (Any): The data object to insert the ID.
             index (int): The ID value to be assigned.
+            **fields (Any): Extra fields to set on the model instance.
+
+        Returns:
+            Any: The model instance with the ID.
+        """
+        if not fields and self._shares_fields(type(data)):
+            values = {**data.__dict__, "id": index}
+            return self._restore(
+                tuple(values[field] for field in self.model.__fields__)
+            )
+        new_data = self.model(**data.dict(), **fields, id=index)
+        return new_data
+
+    def _shares_fields(self, input_model: Any) -> bool:
+        """
+        Tells whether instances of an input model can be stored without
+        validating them again.
+
+        That is the case when the input model only has the fields of its
+        base class, and the stored model derives from the same base and
+        only adds the ID, like `ProductIn` and `Product`: the input was
+        validated by the very same fields.
+
+        Args:
+            input_model (Any): The model class of the input data.
+
+        Returns:
+            bool: True if the input fields can be copied as they are.
+        """
+        shared = self.shared_fields.get(input_model)
+        if shared is None:
+            base = input_model.__base__
+            shared = (
+                issubclass(self.model, base)
+                and input_model.__fields__.keys() == base.__fields__.keys()
+                and self.model.__fields__.keys() - base.__fields__.keys()
+                == {"id"}
+            )
+            self.shared_fields[input_model] = shared
+        return shared
+
+    def _intern(self, data: Any) -> None:
+        """
+        Interns the values of the interned fields of a data item about to
+        be stored, before the indexes keep references to them.
+
+        Replacing a string by an equal one is invisible to the readers, so
+        this is the only change made to an item in place.
+
+        Args:
+            data (Any): The data item.
+        """
+        values = data.__dict__
+        for field in self.interned_fields:
+            if type(values[field]) is str:
+                values[field] = sys.intern(values[field])
+
+    def _field_values(self, field: str) -> Iterable[Tuple[int, Any]]:
+        """
+        Returns the ID and value of a field of every stored item, in
+        ascending ID order, without building the items in compact mode.
+        """
+        if isinstance(self.collection, CompactDict):
+            rows = self.collection.rows
+            position = list(self.model.__fields__).index(field)
+            return ((id, rows[id][position]) for id in self.ids)
+        collection = self.collection
+        return ((id, getattr(collection[id], field)) for id in self.ids)
+
+    def _is_stored(self, data: Any) -> bool:
+        """
+        Tells whether a data item is the one currently stored under its ID.
+        """
+        if isinstance(self.collection, CompactDict):
+            return self.collection.holds(data.id, data)
+        return self.collection.get(data.id) is data
+
+    def _add_to_indexes(self, data: Any) -> None:
+        for field, hash_index in self.hash_indexes.items():
+            hash_index.add(data.id, getattr(data, field))
+        for field, sorted_index in self.sorted_indexes.items():
+            sorted_index.add(data.id, getattr(data, field))
+        for item_index in self._item_indexes():
+            item_index.add(data)
+
+    def _remove_from_indexes(self, data: Any) -> None:
+        for field, hash_index in self.hash_indexes.items():
+            hash_index.remove(data.id, getattr(data, field))
+        for field, sorted_index in self.sorted_indexes.items():
+            sorted_index.remove(data.id, getattr(data, field))
+        for item_index in self._item_indexes():
+            item_index.remove(data)
+
+    def _field_indexes(
+        self,
+    ) -> List[Tuple[str, Union[HashIndex, SortedIndex]]]:
+        """
+        Returns the indexes fed with a field value, with their field.
+        """
+        return [*self.hash_indexes.items(), *self.sorted_indexes.items()]
+
+    def _item_indexes(self) -> List[Any]:
+        """
+        Returns the indexes fed with whole items rather than a field value.
+        """
+        return [*self.text_indexes, *self.distinct_indexes.values()]
+
+    def _index_candidates(
+        self,
+        equal: Dict[str, Any],
+        prefix: Dict[str, str],
+        between: Dict[str, Tuple[Any, Any]],
+    ) -> List[int]:
+        """
+        Picks the smallest list of candidate IDs offered by the indexes.
+
+        Args:
+            equal (Dict[str, Any]): The equality conditions.
+            prefix (Dict[str, str]): The prefix conditions.
+            between (Dict[str, Tuple[Any, Any]]): The range conditions.
 
         Returns:
-            Any: The modified data object with the ID and reviews.
+            List[int]: The candidate IDs in ascending order.
 
         Raises:
-            ValueError: If the ID in the data object does not match the key ID.
+            ValueError: If a condition targets a field without an index.
         """
-        new_data = self.model(**data.dict(), id=index, reviews=[])
-        return new_data
+        options: List[Tuple[int, Callable[[], List[int]]]] = []
+        for field, value in equal.items():
+            if field not in self.hash_indexes:
+                raise ValueError(f"No hash index on field: {field}")
+            hash_index = self.hash_indexes[field]
+            options.append(
+                (
+                    len(hash_index.lookup(value)),
+                    partial(hash_index.lookup, value),
+                )
+            )
+        for field, bounds in [
+            *(
+                (field, (value, value + MAX_CHAR))
+                for field, value in prefix.items()
+            ),
+            *between.items(),
+        ]:
+            if field not in self.sorted_indexes:
+                raise ValueError(f"No sorted index on field: {field}")
+            sorted_index = self.sorted_indexes[field]
+            start, stop = sorted_index.between(*bounds)
+            options.append((stop - start, partial(sorted_index.ids, *bounds)))
+        _, fetch = min(options, key=itemgetter(0))
+        return fetch()
+
+    def _matches(
+        self,
+        data: Any,
+        equal: Dict[str, Any],
+        prefix: Dict[str, str],
+        between: Dict[str, Tuple[Any, Any]],
+    ) -> bool:
+        for field, value in equal.items():
+            if getattr(data, field) != value:
+                return False
+        for field, value in prefix.items():
+            if not getattr(data, field).startswith(value):
+                return False
+        for field, (low, high) in between.items():
+            # Ranges compare the keys of the sorted index, see NumericIndex.
+            key = self.sorted_indexes[field].key(getattr(data, field))
+            if key is None or not low <= key <= high:
+                return False
+        return True
 
     async def get(self, index: int) -> Any:
         """
@@ -59,8 +517,7 @@ class Database:
         Returns:
             Any: The data item with the specified ID, or None if not found.
         """
-        with self.lock:
-            return self.collection.get(index)
+        return self.collection.get(index)
 
     async def get_all(self) -> List[Any]:
         """
@@ -69,78 +526,1096 @@ class Database:
         Returns:
             List[Any]: A list of all data items in the collection.
         """
-        with self.lock:
-            return list(self.collection.values())
+        return list(self.collection.values())
+
+    async def get_encoded(self, index: int) -> Optional[Encoded]:
+        """
+        Retrieves a data item by its ID, encoded as JSON.
+
+        The encoding is cached until the data item is written again.
+
+        Args:
+            index (int): The ID of the data item to retrieve.
+
+        Returns:
+            Optional[Encoded]: The encoded data item, or None if not found.
+        """
+        data = self.collection.get(index)
+        return None if data is None else self._encoded(data)
+
+    def encode_all(self, items: Iterable[Any]) -> bytes:
+        """
+        Encodes data items read from the collection as a JSON array, using
+        the cached encoding of each item.
+
+        Args:
+            items (Iterable[Any]): The data items.
+
+        Returns:
+            bytes: The JSON array.
+        """
+        encoded = self._encoded
+        return b"[" + b",".join(encoded(data).body for data in items) + b"]"
+
+    def encode_lines(self, items: Iterable[Any]) -> bytes:
+        """
+        Encodes data items read from the collection as JSON lines.
+
+        Cached encodings are reused, but new ones are not cached, so that
+        exporting the collection does not fill the cache with every item.
+
+        Args:
+            items (Iterable[Any]): The data items.
+
+        Returns:
+            bytes: One JSON document per item, each ending with a newline.
+        """
+        return b"".join(
+            self._encoded(data, cache=False).body + b"\n" for data in items
+        )
+
+    async def iter_chunks(self, size: int) -> AsyncIterator[List[Any]]:
+        """
+        Iterates over a snapshot of the data items in ascending ID order,
+        in chunks.
+
+        The snapshot only copies references: stored items are never
+        mutated in place, so the items written after the iteration started
+        are not seen, and the ones deleted since are still returned. In
+        compact mode the stored tuples are referenced, and only the items
+        of the current chunk are built.
+
+        Args:
+            size (int): The number of data items per chunk.
+
+        Yields:
+            List[Any]: The next chunk of data items.
+        """
+        collection = self.collection
+        if isinstance(collection, CompactDict):
+            # Copying the rows of a catalogue does not read them, they are
+            # only decoded chunk by chunk.
+            rows, restore = collection.rows.copy(), collection.restore
+            ids = self.ids[:]
+            for start in range(0, len(ids), size):
+                stop = start + size
+                yield [restore(rows[id]) for id in ids[start:stop]]
+            return
+        items = [collection[id] for id in self.ids]
+        for start in range(0, len(items), size):
+            stop = start + size
+            yield items[start:stop]
+
+    def etag(self) -> Optional[str]:
+        """
+        Returns a strong ETag for the state of the whole collection.
+
+        Returns:
+            Optional[str]: The quoted entity tag, built from the epoch and
+                the version of the collection.
+        """
+        return f'"{self.epoch}-{self.version}"'
+
+    def _encoded(self, data: Any, cache: bool = True) -> Encoded:
+        """
+        Returns the encoding of a data item, from the cache if possible.
+
+        Only the item currently stored under its ID is cached, an item read
+        before a later write is encoded again.
+
+        Args:
+            data (Any): The data item.
+            cache (bool): Whether to cache a new encoding.
+
+        Returns:
+            Encoded: The encoded data item. Cached encodings carry the
+                version of the item.
+        """
+        cached = self.encoded.get(data.id)
+        if cached is None:
+            cached = encode(data)
+            if cache and self._is_stored(data):
+                cached = cached._replace(version=self.versions.get(data.id))
+                self.encoded.put(data.id, cached)
+        elif not self._is_stored(data):
+            cached = encode(data)
+        return cached
+
+    async def scan(
+        self,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        """
+        Retrieves a page of data items in ascending ID order.
+
+        Without conditions the start of the page is found by binary search
+        over the sorted IDs, so only the items of the page are visited. With
+        conditions the most selective index provides the candidate IDs, and
+        the remaining conditions are checked on each candidate.
+
+        Args:
+            after (Optional[int]): Only items with an ID greater than this
+                one are returned. Starts from the first item if None.
+            limit (Optional[int]): The maximum number of items returned.
+                Returns every remaining item if None.
+            equal (Optional[Dict[str, Any]]): Field values the items must
+                be equal to. Each field needs a hash index.
+            prefix (Optional[Dict[str, str]]): Prefixes the field values
+                must start with. Each field needs a sorted index.
+            between (Optional[Dict[str, Tuple[Any, Any]]]): Inclusive
+                ranges the field values must fall in. Each field needs a
+                sorted index.
+
+        Returns:
+            List[Any]: The data items of the page.
+
+        Raises:
+            ValueError: If a condition targets a field without an index.
+        """
+        if not (equal or prefix or between):
+            start = 0 if after is None else bisect_right(self.ids, after)
+            stop = None if limit is None else start + limit
+            return [self.collection[id] for id in self.ids[start:stop]]
 
-    async def delete(self, index: int) -> Any:
+        self.ensure_indexes()
+        equal, prefix, between = equal or {}, prefix or {}, between or {}
+        ids = self._index_candidates(equal, prefix, between)
+        start = 0 if after is None else bisect_right(ids, after)
+        page: List[Any] = []
+        for id in islice(ids, start, None):
+            if limit is not None and len(page) == limit:
+                break
+            data = self.collection[id]
+            if self._matches(data, equal, prefix, between):
+                page.append(data)
+        return page
+
+    async def scan_sorted(
+        self,
+        field: str,
+        limit: int,
+        descending: bool = False,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        """
+        Retrieves the first data items in the order of a field.
+
+        The sorted index on the field is walked in order, from the bounds
+        of its range condition if there is one, and stops as soon as the
+        page is full. Items without a key in the index are left out.
+
+        Args:
+            field (str): The field to order by. Needs a sorted index.
+            limit (int): The maximum number of items returned.
+            descending (bool): Whether the highest values come first.
+            equal (Optional[Dict[str, Any]]): Field values the items must
+                be equal to.
+            prefix (Optional[Dict[str, str]]): Prefixes the field values
+                must start with.
+            between (Optional[Dict[str, Tuple[Any, Any]]]): Inclusive
+                ranges the field values must fall in. Each field needs a
+                sorted index.
+
+        Returns:
+            List[Any]: The data items, ordered by the field, then by ID.
+
+        Raises:
+            ValueError: If a field is not indexed as required.
+        """
+        self.ensure_indexes()
+        equal, prefix, between = equal or {}, prefix or {}, between or {}
+        for other in [field, *between]:
+            if other not in self.sorted_indexes:
+                raise ValueError(f"No sorted index on field: {other}")
+        sorted_index = self.sorted_indexes[field]
+        if field in between:
+            start, stop = sorted_index.between(*between[field])
+        else:
+            start, stop = 0, len(sorted_index.entries)
+        positions = range(start, stop)
+        if descending:
+            positions = positions[::-1]
+        entries = sorted_index.entries
+        page: List[Any] = []
+        for position in positions:
+            if len(page) == limit:
+                break
+            data = self.collection[entries[position][1]]
+            if self._matches(data, equal, prefix, between):
+                page.append(data)
+        return page
+
+    def _put(self, data: Any) -> None:
+        """
+        Stores a data item under its ID, keeping the indexes up to date.
+
+        Args:
+            data (Any): The data item to store.
+        """
+        self.ensure_indexes()
+        self._intern(data)
+        old_data = self.collection.get(data.id)
+        if old_data is not None:
+            self._remove_from_indexes(old_data)
+        elif not self.ids or self.ids[-1] < data.id:
+            self.ids.append(data.id)
+        else:
+            insort(self.ids, data.id)
+        self.collection[data.id] = data
+        self._add_to_indexes(data)
+        self.encoded.discard(data.id)
+        self.version += 1
+        self.versions.set(data.id, self.version)
+
+    def _put_new(self, items: List[Any]) -> None:
+        """
+        Stores new data items, with IDs greater than every stored ID, and
+        adds them to the indexes in bulk.
+
+        Args:
+            items (List[Any]): The data items to store, in ascending ID
+                order.
+        """
+        self.ensure_indexes()
+        for data in items:
+            self._intern(data)
+            self.collection[data.id] = data
+            self.encoded.discard(data.id)
+        self.ids.extend(data.id for data in items)
+        for field, index in self._field_indexes():
+            index.add_many((data.id, getattr(data, field)) for data in items)
+        for item_index in self._item_indexes():
+            for data in items:
+                item_index.add(data)
+        self.version += 1
+        for data in items:
+            self.versions.set(data.id, self.version)
+
+    def _pop(self, index: int) -> Any:
+        """
+        Removes a data item, keeping the indexes up to date.
+
+        Args:
+            index (int): The ID of the data item to remove.
+
+        Returns:
+            Any: The removed data item, or None if not found.
+        """
+        self.ensure_indexes()
+        data = self.collection.pop(index, None)
+        if data is not None:
+            del self.ids[bisect_left(self.ids, index)]
+            self._remove_from_indexes(data)
+            self.encoded.discard(index)
+            self.versions.discard(index)
+            self.version += 1
+        return data
+
+    def _check_version(self, index: int, version: Optional[int]) -> None:
+        """
+        Checks that a stored data item is still at the version a
+        conditional write expects.
+
+        Args:
+            index (int): The ID of the data item.
+            version (Optional[int]): The expected version, or None if the
+                write is not conditional.
+
+        Raises:
+            VersionConflict: If the data item is at another version.
+        """
+        if version is not None and self.versions.get(index) != version:
+            raise VersionConflict(
+                f"Data item {index} was written since version {version}"
+            )
+
+    def _log(
+        self, op: str, index: Optional[int] = None, data: Any = None
+    ) -> Optional[asyncio.Future]:
+        """
+        Records a mutation in the change feed, notifies the listeners and
+        appends it to the journal, if there is one.
+
+        Args:
+            op (str): The operation: "put", "delete" or "reset".
+            index (Optional[int]): The ID of the mutated data item.
+            data (Any): The new data item, for "put".
+
+        Returns:
+            Optional[asyncio.Future]: Resolved once the mutation is
+                durable, or None without a journal.
+        """
+        if self.changes is not None:
+            self.changes.append(op, index, self.version)
+        for listener in self.listeners:
+            listener(op, index, data)
+        if self.journal is None:
+            return None
+        value = None if data is None else self._dump(data)
+        return self.journal.append(op, index, value)
+
+    def _check_requirement(self, requires: Requirement) -> None:
+        """
+        Checks that the data item a new data item requires is stored, at
+        the required version if one is given.
+
+        Args:
+            requires (Requirement): The required data item.
+
+        Raises:
+            VersionConflict: If the data item is missing or at another
+                version.
+            ValueError: If the data item is not stored by a `Database`.
+        """
+        other = requires.storage
+        if not isinstance(other, Database):
+            raise ValueError("Required data item of another backend")
+        if requires.id not in other.collection:
+            raise VersionConflict(f"Data item {requires.id} was deleted")
+        other._check_version(requires.id, requires.version)
+
+    def _save(
+        self,
+        data: Any,
+        fields: Dict[str, Any],
+        requires: Optional[Requirement] = None,
+    ) -> Tuple[Any, Any]:
+        # The other database is only written in other steps of the event
+        # loop, so the requirement still holds when the item is stored.
+        if requires is not None:
+            self._check_requirement(requires)
+        new_data = self._insert_id(data, self.index, **fields)
+        self._put(new_data)
+        self.index += 1
+        return new_data, self._log("put", new_data.id, new_data)
+
+    def _update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Tuple[Any, Any]:
+        if isinstance(data, self.model):
+            if data.id != id:
+                raise ValueError("ID in data does not match key ID")
+            new_data = data
+        else:
+            new_data = self._insert_id(data, id)
+        if id not in self.collection:
+            return None, None
+        self._check_version(id, version)
+        self._put(new_data)
+        return new_data, self._log("put", id, new_data)
+
+    def _delete(
+        self, index: int, version: Optional[int] = None
+    ) -> Tuple[Any, Any]:
+        if index in self.collection:
+            self._check_version(index, version)
+        data = self._pop(index)
+        if data is None:
+            return None, None
+        return data, self._log("delete", index)
+
+    async def _write_batch(self, writes: List[Write]) -> List[Any]:
+        """
+        Applies a batch of writes under a single acquisition of the lock,
+        and waits for the journal to commit them at once.
+
+        Args:
+            writes (List[Write]): The writes, in the order they are
+                applied.
+
+        Returns:
+            List[Any]: The result of every write, or the `ValueError` or
+                `VersionConflict` it failed with.
+        """
+        apply: Dict[str, Callable[..., Tuple[Any, Any]]] = {
+            "save": self._save,
+            "update": self._update,
+            "delete": self._delete,
+        }
+        results: List[Any] = []
+        committed = None
+        async with self.lock:
+            for write in writes:
+                try:
+                    result, logged = apply[write.op](*write.args)
+                except (ValueError, VersionConflict) as error:
+                    results.append(error)
+                    continue
+                results.append(result)
+                if logged is not None:
+                    committed = logged
+        # Records are committed in order, so the last one covers them all.
+        if committed is not None:
+            await committed
+        return results
+
+    async def delete(self, index: int, version: Optional[int] = None) -> Any:
         """
         Deletes a data item from the collection.
 
         Args:
             index (int): The ID of the data item to delete.
+            version (Optional[int]): The version the stored data item must
+                still have. Not checked if None.
 
         Returns:
             Any: The deleted data item, or None if not found.
+
+        Raises:
+            VersionConflict: If the data item was written since `version`.
         """
-        with self.lock:
-            return self.collection.pop(index, None)
+        if self.batcher is not None:
+            return await self.batcher.submit("delete", index, version)
+        async with self.lock:
+            data, committed = self._delete(index, version)
+        if committed is not None:
+            await committed
+        return data
 
-    async def save(self, data: Any) -> Any:
+    async def save(
+        self, data: Any, requires: Optional[Requirement] = None, **fields: Any
+    ) -> Any:
         """
         Saves a new data item to the collection.
 
         Args:
             data (Any): The data item to save.
+            requires (Optional[Requirement]): A data item the saved item
+                requires, checked under the lock.
+            **fields (Any): Extra fields to set on the saved item, such as
+                the owner of a review.
 
         Returns:
             Any: The saved data item with the assigned ID.
 
         Raises:
-            ValueError: If the ID in the data item does not match the key ID.
+            ValueError: If the ID in the data item does not match the key
+                ID, or the required data item is not stored by a
+                `Database`.
+            VersionConflict: If the required data item was deleted, or
+                written since its required version.
+        """
+        if self.batcher is not None:
+            return await self.batcher.submit("save", data, fields, requires)
+        async with self.lock:
+            new_data, committed = self._save(data, fields, requires)
+        if committed is not None:
+            await committed
+        return new_data
+
+    async def save_many(self, items: Sequence[Any]) -> List[Any]:
+        """
+        Saves new data items to the collection under a single acquisition
+        of the lock, so the items get consecutive IDs.
+
+        Args:
+            items (Sequence[Any]): The data items to save.
+
+        Returns:
+            List[Any]: The saved data items with their assigned IDs, in the
+                order of `items`.
+        """
+        committed = None
+        async with self.lock:
+            saved = [
+                self._insert_id(data, index)
+                for index, data in enumerate(items, self.index)
+            ]
+            self._put_new(saved)
+            self.index += len(saved)
+            for new_data in saved:
+                committed = self._log("put", new_data.id, new_data)
+        # Records are committed in order, so the last one covers them all.
+        if committed is not None:
+            await committed
+        return saved
+
+    async def delete_many(self, indexes: Iterable[int]) -> List[Any]:
+        """
+        Deletes data items from the collection under a single acquisition
+        of the lock.
+
+        Args:
+            indexes (Iterable[int]): The IDs of the data items to delete.
+
+        Returns:
+            List[Any]: The deleted data items. IDs that were not found are
+                skipped.
         """
-        with self.lock:
-            new_data = self._insert_id_and_review(data, self.index)
-            self.collection[self.index] = new_data
-            self.index += 1
-            return new_data
+        committed = None
+        async with self.lock:
+            deleted = []
+            for index in indexes:
+                data, logged = self._delete(index)
+                if data is not None:
+                    committed = logged
+                    deleted.append(data)
+        if committed is not None:
+            await committed
+        return deleted
 
-    async def update(self, id: int, data: Any) -> Any:
+    async def update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Any:
         """
         Updates a data item in the collection.
 
+        The check of the version and the write happen under the lock, so a
+        conditional update never overwrites a concurrent one.
+
         Args:
             id (int): The ID of the data item to update.
             data (Any): The updated data item.
+            version (Optional[int]): The version the stored data item must
+                still have, see `Encoded.version`. Not checked if None.
 
         Returns:
             Any: The updated data item, or None if not found.
 
         Raises:
             ValueError: If the ID in the data item does not match the key ID.
+            VersionConflict: If the data item was written since `version`.
+        """
+        if self.batcher is not None:
+            return await self.batcher.submit("update", id, data, version)
+        async with self.lock:
+            new_data, committed = self._update(id, data, version)
+        if committed is not None:
+            await committed
+        return new_data
+
+    async def summarize(
+        self, field: str, value: Any, distinct: str, latest: int
+    ) -> Summary:
         """
-        with self.lock:
-            if isinstance(data, self.model):
-                if data.id != id:
-                    raise ValueError("ID in data does not match key ID")
-                new_data = data
-            else:
-                new_data = self._insert_id_and_review(data, id)
-            if id in self.collection:
-                self.collection[id] = new_data
-                return new_data
+        Summarizes the data items holding a field value.
+
+        Answered from the indexes in constant time: the hash index on
+        `field` holds the IDs of the group in ascending order, and the
+        distinct index on (`field`, `distinct`) counts its distinct values.
+
+        Args:
+            field (str): The field grouping the data items.
+            value (Any): The value of the group.
+            distinct (str): The field whose distinct values are counted.
+            latest (int): The number of latest IDs returned.
+
+        Returns:
+            Summary: The number of data items in the group, the number of
+                distinct values of `distinct` among them, and their
+                `latest` highest IDs, newest first.
+
+        Raises:
+            ValueError: If `field` has no hash index, or the pair has no
+                distinct index.
+        """
+        self.ensure_indexes()
+        if field not in self.hash_indexes:
+            raise ValueError(f"No hash index on field: {field}")
+        if (field, distinct) not in self.distinct_indexes:
+            raise ValueError(
+                f"No distinct index on fields: {field}, {distinct}"
+            )
+        ids = self.hash_indexes[field].lookup(value)
+        return Summary(
+            total=len(ids),
+            distinct=self.distinct_indexes[field, distinct].count(value),
+            latest=ids[-latest:][::-1] if latest else [],
+        )
 
     def reset(self) -> None:
-        with self.lock:
-            self.collection.clear()
-            self.index = 0
+        """
+        Removes all data items and resets the index counter.
 
+        Runs without awaiting, so it is atomic with respect to other tasks.
+        """
+        self._clear()
+        self._log("reset")
 
-PRODUCT_DB: Database = Database(Product)
-REVIEW_DB: Database = Database(Review)
-USER_DB: Dict[str, str] = dict()
+    def _clear(self) -> None:
+        # The search indexes may be fed by other databases as well, so only
+        # the text of this collection is removed from them.
+        if not self.indexes_stale:
+            for text_index in self.text_indexes:
+                for data in self.collection.values():
+                    text_index.remove(data)
+        self.indexes_stale = False
+        self.collection.clear()
+        del self.ids[:]
+        for _, field_index in self._field_indexes():
+            field_index.clear()
+        for distinct_index in self.distinct_indexes.values():
+            distinct_index.clear()
+        self.encoded.clear()
+        self.versions.clear()
+        self.index = 0
+        self.version += 1
+
+    def _load_snapshot(self, state: Any) -> None:
+        if isinstance(state, Catalogue):
+            # The records stay in the mapped file until written again.
+            self.collection = CompactDict(
+                self._dump, self._restore, MappedRows(state)
+            )
+            self.ids = state.id_list()
+            self.index = state.index
+            return
+        index, rows = state
+        for values in rows:
+            self._put(self._restore(values))
+        self.index = index
+
+    def _replay(self, op: str, index: Any, values: Any) -> None:
+        if op == "put":
+            self._put(self._restore(values))
+            self.index = max(self.index, index + 1)
+        elif op == "delete":
+            self._pop(index)
+        elif op == "reset":
+            self._clear()
+
+    def load(self, journal: Journal) -> None:
+        """
+        Attaches a journal and recovers the collection from it.
+
+        The latest snapshot is mapped in memory, see `Catalogue`, and the
+        logged mutations newer than it are replayed over it. The recovered
+        collection is stored compactly, its records only read from the
+        snapshot when needed. Building the indexes is left to their first
+        use, so recovery takes no longer than replaying the log. Every
+        later mutation is logged to the journal.
+
+        Args:
+            journal (Journal): The journal to recover from.
+        """
+        self._clear()
+        self._without_indexes(
+            lambda: journal.recover(
+                self._load_snapshot, self._replay, self.snapshots
+            ),
+            build=False,
+        )
+        self.indexes_stale = True
+        if self.changes is not None:
+            self.changes.restart(self.version)
+        self.journal = journal
+
+    def ensure_indexes(self) -> None:
+        """
+        Builds the indexes of a recovered collection, unless already done.
+
+        Called before the indexes are read or updated. The shared search
+        index is only complete once every database feeding it is indexed.
+        """
+        if self.indexes_stale:
+            self.indexes_stale = False
+            self._build_indexes()
+
+    def _without_indexes(
+        self, fill: Callable[[], Any], build: bool = True
+    ) -> None:
+        """
+        Fills the empty collection without index maintenance, then builds
+        each index once.
+
+        Args:
+            fill (Callable[[], Any]): Stores the data items.
+            build (bool): Whether to build the indexes, or leave them
+                empty.
+        """
+        hash_indexes, sorted_indexes = self.hash_indexes, self.sorted_indexes
+        text_indexes, distinct_indexes = (
+            self.text_indexes,
+            self.distinct_indexes,
+        )
+        self.hash_indexes, self.sorted_indexes = {}, {}
+        self.text_indexes, self.distinct_indexes = [], {}
+        try:
+            fill()
+        finally:
+            self.hash_indexes, self.sorted_indexes = (
+                hash_indexes,
+                sorted_indexes,
+            )
+            self.text_indexes = text_indexes
+            self.distinct_indexes = distinct_indexes
+        if build:
+            self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        for field, index in self._field_indexes():
+            index.rebuild(self._field_values(field))
+        for item_index in self._item_indexes():
+            for data in self.collection.values():
+                item_index.add(data)
+
+    async def checkpoint(self) -> None:
+        """
+        Writes a snapshot of the collection to the journal.
+
+        Only references to the stored items are taken under the lock;
+        encoding them happens on a worker thread, which is safe because
+        stored items are never mutated in place.
+        """
+        if self.journal is None:
+            return
+        async with self.journal.snapshot_lock:
+            async with self.lock:
+                if self.journal.lsn == self.journal.snapshot_lsn:
+                    return
+                if isinstance(self.collection, CompactDict):
+                    # The stored tuples are already encoded by `_dump`, and
+                    # the ones of a catalogue are read on the worker thread.
+                    items: Iterable[Any] = self.collection.rows.copy().values()
+                    dump = None
+                else:
+                    items, dump = list(self.collection.values()), self._dump
+                index = self.index
+                lsn, rotated = self.journal.rotate()
+            await rotated
+            await self.journal.snapshot(
+                lsn,
+                lambda: (
+                    index,
+                    items if dump is None else [dump(data) for data in items],
+                ),
+                self.snapshots,
+            )
+
+
+class JournaledDict(dict, UserStorage):
+    """
+    Dictionary whose mutations are logged to an optional journal.
+
+    Used for the user table. Mutations return without waiting for the
+    journal, they become durable with the next group commit, which `put`
+    waits for. Listeners are notified of every mutation, like those of a
+    `Database`.
+    """
+
+    journal: Optional[Journal] = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.listeners: List[Listener] = []
+
+    def _log(
+        self, op: str, key: Any, value: Any = None
+    ) -> Optional[asyncio.Future]:
+        for listener in self.listeners:
+            listener(op, key, value)
+        if self.journal is None:
+            return None
+        return self.journal.append(op, key, value)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._log("put", key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._log("delete", key)
+
+    async def fetch(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def put(self, key: str, value: str) -> None:
+        super().__setitem__(key, value)
+        committed = self._log("put", key, value)
+        if committed is not None:
+            await committed
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        existed = key in self
+        value = super().pop(key, *default)
+        if existed:
+            self._log("delete", key)
+        return value
+
+    def clear(self) -> None:
+        super().clear()
+        self._log("reset", None)
+
+    def _replay(self, op: str, key: Any, value: Any) -> None:
+        if op == "put":
+            super().__setitem__(key, value)
+        elif op == "delete":
+            super().pop(key, None)
+        elif op == "reset":
+            super().clear()
+
+    def load(self, journal: Journal) -> None:
+        """
+        Attaches a journal and recovers the items from it.
+
+        Args:
+            journal (Journal): The journal to recover from.
+        """
+        super().clear()
+        journal.recover(super().update, self._replay)
+        self.journal = journal
+
+    async def checkpoint(self) -> None:
+        """
+        Writes a snapshot of the items to the journal.
+        """
+        if self.journal is None:
+            return
+        async with self.journal.snapshot_lock:
+            if self.journal.lsn == self.journal.snapshot_lsn:
+                return
+            items = dict(self)
+            lsn, rotated = self.journal.rotate()
+            await rotated
+            await self.journal.snapshot(lsn, lambda: items)
+
+
+PRODUCT_INDEXES: Dict[str, Any] = {
+    "hash_indexes": ("category",),
+    "sorted_indexes": ("name",),
+    "numeric_indexes": ("score",),
+}
+REVIEW_INDEXES: Dict[str, Any] = {
+    "hash_indexes": ("product_id",),
+    "distinct_indexes": (("product_id", "user"),),
+}
+
+# Products are searched by their name and the content of their reviews.
+SEARCH_INDEX = SearchIndex()
+
+PRODUCT_DB: Storage = Database(
+    Product,
+    text_indexes=(TextIndex("name", SEARCH_INDEX),),
+    compact=settings.compact_storage,
+    interned_fields=("category", "score"),
+    write_batch_size=settings.write_batch_size,
+    write_batch_interval=settings.write_batch_interval,
+    encoded_cache_size=settings.encoded_cache_size,
+    **PRODUCT_INDEXES,
+)
+REVIEW_DB: Storage = Database(
+    Review,
+    text_indexes=(TextIndex("content", SEARCH_INDEX, document="product_id"),),
+    compact=settings.compact_storage,
+    interned_fields=("user",),
+    write_batch_size=settings.write_batch_size,
+    write_batch_interval=settings.write_batch_interval,
+    encoded_cache_size=settings.encoded_cache_size,
+    **REVIEW_INDEXES,
+)
+USER_DB: UserStorage = JournaledDict()
+
+
+def collection_sizes() -> Dict[Tuple[str, ...], float]:
+    """
+    Reads the number of items of the in-memory collections, for metrics.
+
+    Returns:
+        Dict[Tuple[str, ...], float]: The number of items, by collection.
+    """
+    return {
+        (db.model.__name__.lower(),): len(db.collection)
+        for db in (PRODUCT_DB, REVIEW_DB)
+        if isinstance(db, Database)
+    }
+
+
+COLLECTION_ITEMS = Gauge(
+    "db_collection_items",
+    "Number of items in an in-memory collection.",
+    ("collection",),
+    function=collection_sizes,
+)
+
+
+def get_product_db() -> Storage:
+    """
+    Dependency returning the product storage.
+
+    Returns:
+        Storage: The configured product storage.
+    """
+    return PRODUCT_DB
+
+
+def get_review_db() -> Storage:
+    """
+    Dependency returning the review storage.
+
+    Returns:
+        Storage: The configured review storage.
+    """
+    return REVIEW_DB
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """
+    Dependency returning the full-text index of the products.
+
+    Returns:
+        Optional[SearchIndex]: The index, or None if the storage backend
+            does not support search.
+    """
+    if settings.storage not in ("memory", "shared"):
+        return None
+    # The replicas of the shared backend also read their change log.
+    for db in (PRODUCT_DB, REVIEW_DB):
+        if isinstance(db, Database):
+            db.ensure_indexes()
+    return SEARCH_INDEX
+
+
+def get_user_db() -> UserStorage:
+    """
+    Dependency returning the user table, mapping emails to password hashes.
+
+    Returns:
+        UserStorage: The configured user table.
+    """
+    return USER_DB
 
 
 def reset_dbs() -> None:
     PRODUCT_DB.reset()
     REVIEW_DB.reset()
     USER_DB.clear()
+
+
+def open_dbs() -> None:
+    """
+    Sets up the storage backend selected by the settings.
+
+    With the "sqlite" backend the databases are tables of a shared SQLite
+    file. With the "shared" backend they are replicas of the databases of
+    the writer process, see `app.database.shared`. With the "memory"
+    backend and a data directory, the databases are made durable by
+    journaling them to the directory, and are recovered from the journals
+    found there.
+
+    Raises:
+        ValueError: If the storage backend is unknown.
+    """
+    global PRODUCT_DB, REVIEW_DB, USER_DB
+    if settings.storage == "sqlite":
+        options: Dict[str, Any] = {
+            "pool_size": settings.sqlite_pool_size,
+            "write_batch_size": settings.write_batch_size,
+            "write_batch_interval": settings.write_batch_interval,
+        }
+        path = settings.sqlite_path
+        PRODUCT_DB = SqliteDatabase(
+            path, "products", Product, **options, **PRODUCT_INDEXES
+        )
+        REVIEW_DB = SqliteDatabase(
+            path, "reviews", Review, **options, **REVIEW_INDEXES
+        )
+        USER_DB = SqliteDict(path, "users")
+    elif settings.storage == "shared":
+        # Imported here, the shared backend builds on `Database`.
+        from app.database.shared import (
+            SharedDatabase,
+            SharedDict,
+            WriterClient,
+        )
+
+        directory, socket = settings.shared_dir, settings.shared_socket
+        PRODUCT_DB = SharedDatabase(
+            "products",
+            Product,
+            ProductIn,
+            WriterClient(socket),
+            directory,
+            text_indexes=(TextIndex("name", SEARCH_INDEX),),
+            encoded_cache_size=settings.encoded_cache_size,
+            **PRODUCT_INDEXES,
+        )
+        REVIEW_DB = SharedDatabase(
+            "reviews",
+            Review,
+            ReviewIn,
+            WriterClient(socket),
+            directory,
+            text_indexes=(
+                TextIndex("content", SEARCH_INDEX, document="product_id"),
+            ),
+            encoded_cache_size=settings.encoded_cache_size,
+            **REVIEW_INDEXES,
+        )
+        USER_DB = SharedDict("users", WriterClient(socket), directory)
+    elif settings.storage != "memory":
+        raise ValueError(f"Unknown storage backend: {settings.storage}")
+    elif settings.data_dir:
+        load_journals(settings.data_dir)
+
+
+def load_journals(directory: str) -> None:
+    """
+    Makes the in-memory databases durable by journaling them to the data
+    directory, and recovers them from the journals found there.
+
+    Args:
+        directory (str): The data directory, see `Settings.data_dir`.
+    """
+    for name, db in (
+        ("products", PRODUCT_DB),
+        ("reviews", REVIEW_DB),
+        ("users", USER_DB),
+    ):
+        assert isinstance(db, (Database, JournaledDict))
+        db.load(
+            Journal(
+                directory,
+                name,
+                fsync=settings.wal_fsync,
+                commit_interval=settings.wal_commit_interval,
+                fsync_interval=settings.wal_fsync_interval,
+            )
+        )
+
+
+async def checkpoint_dbs() -> None:
+    """
+    Snapshots the journaled databases.
+    """
+    for db in (PRODUCT_DB, REVIEW_DB, USER_DB):
+        if isinstance(db, (Database, JournaledDict)):
+            await db.checkpoint()
+
+
+async def checkpoint_periodically() -> None:
+    """
+    Snapshots the databases every `snapshot_interval` seconds.
+    """
+    while True:
+        await asyncio.sleep(settings.snapshot_interval)
+        await checkpoint_dbs()
+
+
+async def close_dbs() -> None:
+    """
+    Applies the queued writes, commits the pending journal records and
+    closes the journals, or closes the SQLite connections or the
+    connections to the writer.
+    """
+    from app.database.shared import SharedDatabase, SharedDict
+
+    for db in (PRODUCT_DB, REVIEW_DB, USER_DB):
+        batcher = getattr(db, "batcher", None)
+        if batcher is not None:
+            await batcher.drain()
+        if isinstance(
+            db, (SqliteDatabase, SqliteDict, SharedDatabase, SharedDict)
+        ):
+            db.close()
+        elif (
+            isinstance(db, (Database, JournaledDict))
+            and db.journal is not None
+        ):
+            await db.journal.close()
+            db.journal = None
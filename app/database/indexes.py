@@ -0,0 +1,368 @@
+"""
+Secondary indexes for the in-memory `Database`.
+
+`HashIndex` answers equality lookups, `SortedIndex` answers range and prefix
+lookups. Both map field values to item IDs and are kept up to date by the
+`Database` on every mutation. `NumericIndex` is a `SortedIndex` ordering
+text values by the number they hold, such as product scores.
+`DistinctIndex` counts the distinct values of a field among the items of
+each group, such as the reviewers of a product.
+"""
+import math
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Sorts after every ID, used to find the end of a run of equal values.
+_LAST_ID = float("inf")
+# Highest code point, every string starting with a prefix sorts before the
+# prefix followed by it.
+MAX_CHAR = chr(0x10FFFF)
+# Batch size from which merging a sorted batch into a `SortedIndex` beats
+# inserting the entries one by one, which moves the tail of the list on
+# every insertion.
+MERGE_THRESHOLD = 32
+
+
+def to_number(value: Any) -> Optional[float]:
+    """
+    Reads the number held by a value.
+
+    Args:
+        value (Any): A number, or a string holding one.
+
+    Returns:
+        Optional[float]: The number, or None if the value does not hold a
+            finite number.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class HashIndex:
+    def __init__(self, field: str) -> None:
+        """
+        Initializes the HashIndex instance.
+
+        Args:
+            field (str): The name of the indexed field.
+
+        Attributes:
+            field (str): The name of the indexed field.
+            entries (Dict[Any, List[int]]): The IDs of the items holding
+                each value, in ascending order.
+        """
+        self.field: str = field
+        self.entries: Dict[Any, List[int]] = dict()
+
+    def add(self, id: int, value: Any) -> None:
+        """
+        Adds an item to the index.
+
+        Args:
+            id (int): The ID of the item.
+            value (Any): The value of the indexed field.
+        """
+        ids = self.entries.setdefault(value, [])
+        if not ids or ids[-1] < id:
+            ids.append(id)
+        else:
+            insort(ids, id)
+
+    def add_many(self, items: Iterable[Tuple[int, Any]]) -> None:
+        """
+        Adds items to the index.
+
+        Args:
+            items (Iterable[Tuple[int, Any]]): The ID and field value of
+                every item.
+        """
+        for id, value in items:
+            self.add(id, value)
+
+    def remove(self, id: int, value: Any) -> None:
+        """
+        Removes an item from the index.
+
+        Args:
+            id (int): The ID of the item.
+            value (Any): The value of the indexed field.
+        """
+        ids = self.entries[value]
+        del ids[bisect_left(ids, id)]
+        if not ids:
+            del self.entries[value]
+
+    def lookup(self, value: Any) -> List[int]:
+        """
+        Returns the IDs of the items holding a value.
+
+        Args:
+            value (Any): The value to look up.
+
+        Returns:
+            List[int]: The IDs in ascending order. Must not be modified.
+        """
+        return self.entries.get(value, [])
+
+    def rebuild(self, items: Iterable[Tuple[int, Any]]) -> None:
+        """
+        Replaces the content of the index.
+
+        Args:
+            items (Iterable[Tuple[int, Any]]): The ID and field value of
+                every item, in ascending ID order.
+        """
+        self.entries.clear()
+        for id, value in items:
+            self.entries.setdefault(value, []).append(id)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class SortedIndex:
+    def __init__(self, field: str) -> None:
+        """
+        Initializes the SortedIndex instance.
+
+        Args:
+            field (str): The name of the indexed field.
+
+        Attributes:
+            field (str): The name of the indexed field.
+            entries (List[Tuple[Any, int]]): The (value, ID) pairs of all
+                items, in ascending order.
+            ranges (OrderedDict[Tuple[Any, Any], List[int]]): The IDs of
+                the latest ranges looked up, in ascending order, least
+                recently used first. Cleared whenever the index changes.
+            cached (int): The number of IDs held by `ranges`.
+        """
+        self.field: str = field
+        self.entries: List[Tuple[Any, int]] = []
+        self.ranges: OrderedDict[Tuple[Any, Any], List[int]] = OrderedDict()
+        self.cached: int = 0
+
+    def key(self, value: Any) -> Any:
+        """
+        Returns the key a field value is ordered by in the index.
+
+        Args:
+            value (Any): The value of the indexed field.
+
+        Returns:
+            Any: The key, the value itself.
+        """
+        return value
+
+    def add(self, id: int, value: Any) -> None:
+        """
+        Adds an item to the index.
+
+        Args:
+            id (int): The ID of the item.
+            value (Any): The value of the indexed field.
+        """
+        self._invalidate()
+        insort(self.entries, (value, id))
+
+    def add_many(self, items: Iterable[Tuple[int, Any]]) -> None:
+        """
+        Adds items to the index. Large batches are sorted and merged into
+        the entries in a single copy.
+
+        Args:
+            items (Iterable[Tuple[int, Any]]): The ID and field value of
+                every item.
+        """
+        self._invalidate()
+        batch = [(value, id) for id, value in items]
+        if len(batch) < MERGE_THRESHOLD:
+            for entry in batch:
+                insort(self.entries, entry)
+            return
+        batch.sort()
+        # Copy the runs of entries between the insertion points.
+        entries, merged, start = self.entries, [], 0
+        for entry in batch:
+            stop = bisect_left(entries, entry, start)
+            merged += entries[start:stop]
+            merged.append(entry)
+            start = stop
+        merged += entries[start:]
+        self.entries = merged
+
+    def remove(self, id: int, value: Any) -> None:
+        """
+        Removes an item from the index.
+
+        Args:
+            id (int): The ID of the item.
+            value (Any): The value of the indexed field.
+        """
+        self._invalidate()
+        del self.entries[bisect_left(self.entries, (value, id))]
+
+    def between(self, low: Any, high: Any) -> Tuple[int, int]:
+        """
+        Finds the entries with a value in the inclusive range [low, high].
+
+        Args:
+            low (Any): The lowest value.
+            high (Any): The highest value.
+
+        Returns:
+            Tuple[int, int]: The start and stop positions of the entries.
+        """
+        start = bisect_left(self.entries, (low,))
+        stop = bisect_left(self.entries, (high, _LAST_ID))
+        return start, max(start, stop)
+
+    def ids(self, low: Any, high: Any) -> List[int]:
+        """
+        Returns the IDs of the items with a value in the inclusive range
+        [low, high].
+
+        The IDs of a range are sorted once and kept until the index
+        changes, so the pages of a scan over the range do not sort them
+        again. The latest ranges are kept as long as they hold no more IDs
+        than the index.
+
+        Args:
+            low (Any): The lowest value.
+            high (Any): The highest value.
+
+        Returns:
+            List[int]: The IDs in ascending order. Must not be modified.
+        """
+        key = (low, high)
+        ids = self.ranges.get(key)
+        if ids is not None:
+            self.ranges.move_to_end(key)
+            return ids
+        start, stop = self.between(low, high)
+        ids = sorted(id for _, id in self.entries[start:stop])
+        self.ranges[key] = ids
+        self.cached += len(ids)
+        while self.cached > len(self.entries):
+            _, evicted = self.ranges.popitem(last=False)
+            self.cached -= len(evicted)
+        return ids
+
+    def _invalidate(self) -> None:
+        if self.ranges:
+            self.ranges.clear()
+            self.cached = 0
+
+    def rebuild(self, items: Iterable[Tuple[int, Any]]) -> None:
+        """
+        Replaces the content of the index, sorting once.
+
+        Args:
+            items (Iterable[Tuple[int, Any]]): The ID and field value of
+                every item.
+        """
+        self._invalidate()
+        self.entries = sorted((value, id) for id, value in items)
+
+    def clear(self) -> None:
+        self._invalidate()
+        self.entries.clear()
+
+
+class NumericIndex(SortedIndex):
+    """
+    Sorted index ordering the values of a field by the number they hold.
+
+    Values that do not hold a number are left out of the index, so they
+    never fall in a range and sort after every number.
+    """
+
+    def key(self, value: Any) -> Optional[float]:
+        return to_number(value)
+
+    def add(self, id: int, value: Any) -> None:
+        number = to_number(value)
+        if number is not None:
+            super().add(id, number)
+
+    def add_many(self, items: Iterable[Tuple[int, Any]]) -> None:
+        super().add_many(self._numbers(items))
+
+    def remove(self, id: int, value: Any) -> None:
+        number = to_number(value)
+        if number is not None:
+            super().remove(id, number)
+
+    def rebuild(self, items: Iterable[Tuple[int, Any]]) -> None:
+        super().rebuild(self._numbers(items))
+
+    @staticmethod
+    def _numbers(
+        items: Iterable[Tuple[int, Any]]
+    ) -> Iterable[Tuple[int, float]]:
+        for id, value in items:
+            number = to_number(value)
+            if number is not None:
+                yield id, number
+
+
+class DistinctIndex:
+    def __init__(self, group: str, field: str) -> None:
+        """
+        Initializes the DistinctIndex instance.
+
+        Args:
+            group (str): The name of the field grouping the items.
+            field (str): The name of the field whose values are counted.
+
+        Attributes:
+            entries (Dict[Any, Counter]): The number of items holding each
+                value of `field`, per group.
+        """
+        self.group: str = group
+        self.field: str = field
+        self.entries: Dict[Any, Counter] = dict()
+
+    def add(self, data: Any) -> None:
+        """
+        Adds an item to the index.
+
+        Args:
+            data (Any): The item.
+        """
+        counter = self.entries.setdefault(getattr(data, self.group), Counter())
+        counter[getattr(data, self.field)] += 1
+
+    def remove(self, data: Any) -> None:
+        """
+        Removes an item from the index.
+
+        Args:
+            data (Any): The item.
+        """
+        group, value = getattr(data, self.group), getattr(data, self.field)
+        counter = self.entries[group]
+        counter[value] -= 1
+        if not counter[value]:
+            del counter[value]
+            if not counter:
+                del self.entries[group]
+
+    def count(self, group: Any) -> int:
+        """
+        Returns the number of distinct values in a group.
+
+        Args:
+            group (Any): The group.
+
+        Returns:
+            int: The number of distinct values of `field` in the group.
+        """
+        return len(self.entries.get(group, ()))
+
+    def clear(self) -> None:
+        self.entries.clear()
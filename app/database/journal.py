@@ -0,0 +1,332 @@
+"""
+Journal module for the in-memory databases.
+
+This module provides the `Journal` class, an optional durability layer made
+of an append-only write-ahead log (WAL) and periodic snapshots.
+
+Every mutation is appended to the log as a length-prefixed, checksummed
+record tagged with a log sequence number (LSN). Appends only buffer the
+record; a single background task writes the buffer, so all the records
+appended while the previous write was in flight are committed together
+(group commit). The fsync policy decides when the file is forced to disk.
+
+A snapshot stores the full state together with the LSN it reflects, in a
+format chosen by the journaled database: pickled, or a memory-mapped
+catalogue for the collections, see `app.database.snapshot`. The log
+is split in segments named after their first LSN, and taking a snapshot
+starts a new segment so that older segments can be dropped once the
+snapshot is on disk. Recovery loads the snapshot and replays the records of
+the remaining segments that are newer than it.
+"""
+import asyncio
+import os
+import pickle
+import struct
+import time
+import zlib
+from typing import IO, Any, Callable, List, Optional, Tuple, Union
+
+# Payload length and CRC32 of each log record.
+HEADER = struct.Struct("<II")
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class PickledSnapshots:
+    """
+    Snapshot format storing the state with pickle, the default one.
+
+    Formats write a snapshot with `dump`, and read it back with `load`.
+    """
+
+    def dump(self, file: IO[bytes], lsn: int, state: Any) -> None:
+        pickle.dump((lsn, state), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str) -> Tuple[int, Any]:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+PICKLED = PickledSnapshots()
+
+
+class Journal:
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        fsync: str = "always",
+        commit_interval: float = 0.0,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        """
+        Initializes the Journal instance.
+
+        Args:
+            directory (str): The directory holding the log and snapshots.
+            name (str): The name of the journaled database.
+            fsync (str): When the log is forced to disk: "always" on every
+                group commit, "interval" at most every `fsync_interval`
+                seconds, or "never" (left to the operating system).
+            commit_interval (float): Seconds to wait for more records
+                before writing a group commit.
+            fsync_interval (float): Seconds between forced writes with the
+                "interval" policy.
+
+        Raises:
+            ValueError: If the fsync policy is unknown.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory: str = directory
+        self.name: str = name
+        self.fsync: str = fsync
+        self.commit_interval: float = commit_interval
+        self.fsync_interval: float = fsync_interval
+        self.lsn: int = 0
+        self.snapshot_lsn: int = 0
+        self.file: Any = None
+        self.last_fsync: float = 0.0
+        # Encoded records, or the first LSN of a new segment to switch to.
+        self.pending: List[Union[bytes, int]] = []
+        self.waiters: List[asyncio.Future] = []
+        self.flusher: Optional[asyncio.Task] = None
+        self.snapshot_lock: asyncio.Lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.snapshot")
+
+    def _segment_path(self, first_lsn: int) -> str:
+        return os.path.join(
+            self.directory, f"{self.name}.{first_lsn:020d}.wal"
+        )
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """
+        Lists the log segments.
+
+        Returns:
+            List[Tuple[int, str]]: The first LSN and path of each segment,
+                oldest first.
+        """
+        segments = []
+        prefix, suffix = f"{self.name}.", ".wal"
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith(prefix) and file_name.endswith(suffix):
+                first_lsn = file_name.removeprefix(prefix).removesuffix(suffix)
+                if first_lsn.isdigit():
+                    path = os.path.join(self.directory, file_name)
+                    segments.append((int(first_lsn), path))
+        return sorted(segments)
+
+    def _read_segment(
+        self, path: str, apply: Callable[[int, str, Any, Any], None]
+    ) -> None:
+        """
+        Reads the records of a log segment.
+
+        A record that is cut short or fails its checksum can only be the
+        last one written before a crash, so the segment is truncated there.
+
+        Args:
+            path (str): The path of the segment.
+            apply (Callable): Called with the LSN, operation, key and value
+                of each record.
+        """
+        with open(path, "rb") as file:
+            buffer = memoryview(file.read())
+        offset = 0
+        while offset + HEADER.size <= len(buffer):
+            length, crc = HEADER.unpack_from(buffer, offset)
+            start, end = offset + HEADER.size, offset + HEADER.size + length
+            payload = buffer[start:end]
+            if end > len(buffer) or zlib.crc32(payload) != crc:
+                break
+            apply(*pickle.loads(payload))
+            offset = end
+        if offset < len(buffer):
+            with open(path, "r+b") as file:
+                file.truncate(offset)
+
+    def recover(
+        self,
+        load_snapshot: Callable[[Any], None],
+        apply: Callable[[str, Any, Any], None],
+        snapshots: PickledSnapshots = PICKLED,
+    ) -> None:
+        """
+        Recovers the journaled state and opens a new log segment.
+
+        Args:
+            load_snapshot (Callable): Called with the state of the latest
+                snapshot, if there is one.
+            apply (Callable): Called with the operation, key and value of
+                every logged mutation newer than the snapshot, in order.
+            snapshots (PickledSnapshots): The format of the snapshots.
+        """
+        if os.path.exists(self.snapshot_path):
+            self.snapshot_lsn, state = snapshots.load(self.snapshot_path)
+            self.lsn = self.snapshot_lsn
+            load_snapshot(state)
+
+        def apply_record(lsn: int, op: str, key: Any, value: Any) -> None:
+            if lsn > self.snapshot_lsn:
+                apply(op, key, value)
+            self.lsn = max(self.lsn, lsn)
+
+        for _, path in self._segments():
+            self._read_segment(path, apply_record)
+        self.file = open(self._segment_path(self.lsn + 1), "ab")
+
+    def append(self, op: str, key: Any, value: Any = None) -> asyncio.Future:
+        """
+        Appends a mutation to the log.
+
+        Must be called in the order the mutations are applied, which the
+        callers guarantee by appending under their write lock.
+
+        Args:
+            op (str): The operation, such as "put" or "delete".
+            key (Any): The key of the mutated item.
+            value (Any): The new value of the item, if any.
+
+        Returns:
+            asyncio.Future: Resolved once the record is committed.
+        """
+        self.lsn += 1
+        payload = pickle.dumps(
+            (self.lsn, op, key, value), protocol=pickle.HIGHEST_PROTOCOL
+        )
+        self.pending.append(
+            HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        )
+        return self._wait_for_flush()
+
+    def rotate(self) -> Tuple[int, asyncio.Future]:
+        """
+        Starts a new log segment after the records appended so far.
+
+        Returns:
+            Tuple[int, asyncio.Future]: The last LSN of the closed segment,
+                and a future resolved once the segment is closed.
+        """
+        self.pending.append(self.lsn + 1)
+        return self.lsn, self._wait_for_flush()
+
+    def _wait_for_flush(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append(future)
+        if self.flusher is None:
+            self.flusher = loop.create_task(self._flush())
+        return future
+
+    async def _flush(self) -> None:
+        """
+        Writes the pending records until there are none left.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                if self.commit_interval:
+                    await asyncio.sleep(self.commit_interval)
+                pending, self.pending = self.pending, []
+                waiters, self.waiters = self.waiters, []
+                try:
+                    await loop.run_in_executor(None, self._write, pending)
+                except Exception as exc:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(exc)
+                else:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(None)
+        finally:
+            self.flusher = None
+
+    def _write(self, pending: List[Union[bytes, int]]) -> None:
+        """
+        Writes a group commit to the log, on a worker thread.
+
+        Args:
+            pending (List[Union[bytes, int]]): Encoded records, and the
+                first LSN of the next segment wherever one starts.
+        """
+        chunk: List[bytes] = []
+        for entry in pending:
+            if isinstance(entry, bytes):
+                chunk.append(entry)
+                continue
+            self.file.write(b"".join(chunk))
+            self._sync(force=True)
+            self.file.close()
+            self.file = open(self._segment_path(entry), "ab")
+            chunk = []
+        self.file.write(b"".join(chunk))
+        self._sync()
+
+    def _sync(self, force: bool = False) -> None:
+        self.file.flush()
+        now = time.monotonic()
+        if (
+            force
+            or self.fsync == "always"
+            or (
+                self.fsync == "interval"
+                and now - self.last_fsync >= self.fsync_interval
+            )
+        ):
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+    async def snapshot(
+        self,
+        lsn: int,
+        make_state: Callable[[], Any],
+        snapshots: PickledSnapshots = PICKLED,
+    ) -> None:
+        """
+        Writes a snapshot and drops the log segments it covers.
+
+        The log must have been rotated at `lsn` beforehand, so that every
+        record up to `lsn` lives in a closed segment.
+
+        Args:
+            lsn (int): The LSN the state reflects.
+            make_state (Callable): Builds the state to store. Called on a
+                worker thread.
+            snapshots (PickledSnapshots): The format of the snapshot.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, self._write_snapshot, lsn, make_state, snapshots
+        )
+        self.snapshot_lsn = lsn
+
+    def _write_snapshot(
+        self,
+        lsn: int,
+        make_state: Callable[[], Any],
+        snapshots: PickledSnapshots,
+    ) -> None:
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as file:
+            snapshots.dump(file, lsn, make_state())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        for first_lsn, path in self._segments():
+            if first_lsn <= lsn:
+                os.remove(path)
+
+    async def close(self) -> None:
+        """
+        Commits the pending records and closes the log.
+        """
+        while self.flusher is not None:
+            await self.flusher
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,199 @@
+"""
+Full-text search for the in-memory `Database`.
+
+`SearchIndex` is an inverted index over documents identified by an integer
+key. It maps every term to the documents containing it (posting lists) and
+ranks the documents matching a query with BM25. `TextIndex` feeds a text
+field of a `Database` into a `SearchIndex`; several of them can feed the
+same search index, so that a product document holds the terms of the
+product name and of all its reviews.
+
+Both are kept up to date by the `Database` on every mutation, like the
+secondary indexes.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Tuple
+
+TOKEN = re.compile(r"\w+")
+# BM25 parameters: term frequency saturation and document length
+# normalization.
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase terms.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The terms, in order of appearance.
+    """
+    return TOKEN.findall(text.casefold())
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        """
+        Initializes the SearchIndex instance.
+
+        Attributes:
+            postings (Dict[str, Dict[int, int]]): The documents containing
+                each term, with the number of occurrences.
+            lengths (Dict[int, int]): The number of terms of each document.
+            total_length (int): The number of terms of all the documents.
+        """
+        self.postings: Dict[str, Dict[int, int]] = dict()
+        self.lengths: Dict[int, int] = dict()
+        self.total_length: int = 0
+
+    def add(self, document: int, terms: List[str]) -> None:
+        """
+        Adds terms to a document.
+
+        Args:
+            document (int): The key of the document.
+            terms (List[str]): The terms to add.
+        """
+        if not terms:
+            return
+        for term, count in Counter(terms).items():
+            documents = self.postings.setdefault(term, {})
+            documents[document] = documents.get(document, 0) + count
+        self.lengths[document] = self.lengths.get(document, 0) + len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, document: int, terms: List[str]) -> None:
+        """
+        Removes terms previously added to a document.
+
+        Args:
+            document (int): The key of the document.
+            terms (List[str]): The terms to remove.
+        """
+        if not terms:
+            return
+        for term, count in Counter(terms).items():
+            documents = self.postings[term]
+            documents[document] -= count
+            if not documents[document]:
+                del documents[document]
+                if not documents:
+                    del self.postings[term]
+        self.lengths[document] -= len(terms)
+        if not self.lengths[document]:
+            del self.lengths[document]
+        self.total_length -= len(terms)
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """
+        Ranks the documents matching a query with BM25.
+
+        Only the posting lists of the query terms are visited, rarest term
+        first. Once the terms left cannot lift a document that matched
+        none of the terms seen so far into the top `limit` (MaxScore),
+        they are only looked up for the documents already matched, so a
+        common term combined with a rarer one does not cost a pass over
+        its whole posting list.
+
+        Args:
+            query (str): The query text.
+            limit (int): The maximum number of documents returned.
+
+        Returns:
+            List[Tuple[int, float]]: The key and score of the best
+                documents, best first.
+        """
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count
+        lengths = self.lengths
+        terms = sorted(
+            (
+                (len(documents), documents)
+                for documents in map(self.postings.get, set(tokenize(query)))
+                if documents
+            ),
+            key=itemgetter(0),
+        )
+        idfs = [
+            math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for frequency, _ in terms
+        ]
+        # The contribution of a term tends to idf * (K1 + 1) as its
+        # frequency in the document grows.
+        remaining = sum(idf * (K1 + 1) for idf in idfs)
+        scores: Dict[int, float] = {}
+        matches: Iterable[Tuple[int, int]]
+        essential = True
+        for (_, documents), idf in zip(terms, idfs):
+            remaining -= idf * (K1 + 1)
+            if essential:
+                matches = documents.items()
+            else:
+                matches = [
+                    (document, documents[document])
+                    for document in scores
+                    if document in documents
+                ]
+            for document, frequency in matches:
+                norm = K1 * (1 - B + B * lengths[document] / average_length)
+                scores[document] = scores.get(document, 0.0) + idf * (
+                    frequency * (K1 + 1) / (frequency + norm)
+                )
+            if essential and len(scores) >= limit:
+                threshold = heapq.nlargest(limit, scores.values())[-1]
+                essential = remaining >= threshold
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    def clear(self) -> None:
+        self.postings.clear()
+        self.lengths.clear()
+        self.total_length = 0
+
+
+class TextIndex:
+    def __init__(
+        self, field: str, search_index: SearchIndex, document: str = "id"
+    ) -> None:
+        """
+        Initializes the TextIndex instance.
+
+        Args:
+            field (str): The name of the indexed text field.
+            search_index (SearchIndex): The search index fed.
+            document (str): The field holding the key of the document the
+                text belongs to, such as the product ID of a review.
+        """
+        self.field: str = field
+        self.search_index: SearchIndex = search_index
+        self.document: str = document
+
+    def add(self, data: Any) -> None:
+        """
+        Adds the text of an item to its document.
+
+        Args:
+            data (Any): The item.
+        """
+        self.search_index.add(
+            getattr(data, self.document), tokenize(getattr(data, self.field))
+        )
+
+    def remove(self, data: Any) -> None:
+        """
+        Removes the text of an item from its document.
+
+        Args:
+            data (Any): The item.
+        """
+        self.search_index.remove(
+            getattr(data, self.document), tokenize(getattr(data, self.field))
+        )
@@ -0,0 +1,736 @@
+"""
+Shared storage backend, for several worker processes.
+
+One writer process, `python -m app.database.writer`, owns the in-memory
+databases. Every mutation it applies is appended, in order, to the change
+log of its collection, a file of the shared directory. The workers map the
+change logs in memory with mmap, so the records are shared by all of them
+through the page cache. Each worker only keeps its own indexes, brought up
+to date before every read with the records appended since its last read.
+
+`SharedDatabase` and `SharedDict` are the worker side: they serve the reads
+from the mapped change logs and forward the writes to the writer over a
+Unix socket. The writer answers once the change is in the log, so a worker
+reads its own writes.
+
+A change log is a sequence of records, each made of a header holding the
+operation and the length of the body, followed by the body: the JSON array
+[key, value] for "put", the JSON key for "delete". The values of the
+databases are the tuples of their field values, paired with the version of
+the record in the writer, which the replicas hand out for conditional writes
+and the writer checks them against. When the log holds more
+overwritten records than live ones, the writer writes the live items to a
+new log, its next generation, and renames it over the current one. Readers
+notice the new file and reload it.
+"""
+import asyncio
+import mmap
+import os
+import socket
+import struct
+import threading
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import orjson
+
+from app.database.base import (
+    Encoded,
+    Requirement,
+    Summary,
+    UserStorage,
+    VersionConflict,
+)
+from app.database.db import Database
+
+# Operation code and body length of a change log record.
+HEADER = struct.Struct("<BI")
+OPS = {"put": 1, "delete": 2}
+OP_NAMES = {code: op for op, code in OPS.items()}
+# Length prefix of the messages exchanged with the writer.
+FRAME = struct.Struct("<I")
+# Size from which a change log is compacted, once most of it is garbage.
+COMPACT_MIN_SIZE = 16 * 1024 * 1024
+
+
+def frame(message: Any) -> bytes:
+    """
+    Encodes a message exchanged with the writer.
+
+    Args:
+        message (Any): The message, JSON serializable.
+
+    Returns:
+        bytes: The length-prefixed JSON message.
+    """
+    body = orjson.dumps(message)
+    return FRAME.pack(len(body)) + body
+
+
+def log_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.log")
+
+
+class SharedLog:
+    def __init__(
+        self,
+        path: str,
+        items: Callable[[], Iterable[Tuple[Any, Any]]],
+        encode: Callable[[Any], Any] = lambda value: value,
+    ) -> None:
+        """
+        Initializes the SharedLog instance, the writer side of a change log.
+
+        Its `append` method is a listener of the mutations of a database.
+
+        Args:
+            path (str): The path of the change log.
+            items (Callable[[], Iterable[Tuple[Any, Any]]]): Returns the
+                live (key, value) pairs, written to every new generation.
+            encode (Callable[[Any], Any]): Converts a value to JSON
+                serializable data.
+
+        Attributes:
+            size (int): The size of the log.
+            sizes (Dict[Any, int]): The size of the latest record of every
+                live key.
+            live (int): The total size of the latest records.
+        """
+        self.path: str = path
+        self.items = items
+        self.encode = encode
+        self.file: Optional[Any] = None
+        self.size: int = 0
+        self.sizes: Dict[Any, int] = dict()
+        self.live: int = 0
+
+    def _record(self, op: str, body: bytes) -> bytes:
+        return HEADER.pack(OPS[op], len(body)) + body
+
+    def rewrite(self) -> None:
+        """
+        Writes the live items to a new generation of the log, and renames
+        it over the current one.
+        """
+        if self.file is not None:
+            self.file.close()
+        self.size, self.live = 0, 0
+        self.sizes.clear()
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as file:
+            for key, value in self.items():
+                record = self._record(
+                    "put", orjson.dumps([key, self.encode(value)])
+                )
+                file.write(record)
+                self.sizes[key] = len(record)
+                self.size += len(record)
+        os.replace(temporary, self.path)
+        self.live = self.size
+        self.file = open(self.path, "ab", buffering=0)
+
+    def append(self, op: str, key: Any, value: Any = None) -> None:
+        """
+        Appends a mutation to the log, visible to the readers at once.
+
+        Args:
+            op (str): The operation: "put", "delete" or "reset".
+            key (Any): The key of the mutated item.
+            value (Any): The new value of the item, for "put".
+        """
+        if op == "reset":
+            self.rewrite()
+            return
+        if op == "put":
+            record = self._record(op, orjson.dumps([key, self.encode(value)]))
+        else:
+            record = self._record(op, orjson.dumps(key))
+        assert self.file is not None
+        self.file.write(record)
+        self.size += len(record)
+        self.live -= self.sizes.pop(key, 0)
+        if op == "put":
+            self.sizes[key] = len(record)
+            self.live += len(record)
+        if self.size > COMPACT_MIN_SIZE and self.size > 2 * self.live:
+            self.rewrite()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LogReader:
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the LogReader instance, the worker side of a change log.
+
+        Args:
+            path (str): The path of the change log.
+
+        Attributes:
+            fd (Optional[int]): The descriptor of the open log, if any.
+            inode (Optional[int]): The inode of the open log.
+            buffer (Any): The mapped log, or empty bytes. Replaced when the
+                log grows, so a reference to it stays valid.
+            position (int): The offset of the first record not read yet.
+        """
+        self.path: str = path
+        self.fd: Optional[int] = None
+        self.inode: Optional[int] = None
+        self.buffer: Any = b""
+        self.position: int = 0
+
+    def replaced(self) -> bool:
+        """
+        Tells whether a new generation of the log was published since it
+        was opened.
+
+        Returns:
+            bool: True if the log must be reopened.
+        """
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def reopen(self) -> None:
+        """
+        Opens the current generation of the log, to be read from the start.
+        """
+        self.close()
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.inode = os.fstat(self.fd).st_ino
+
+    def read(self) -> List[Tuple[str, int, int]]:
+        """
+        Reads the records appended since the last call.
+
+        Returns:
+            List[Tuple[str, int, int]]: The operation, and the start and
+                stop offsets of the body of every complete new record.
+        """
+        if self.fd is None:
+            return []
+        size = os.fstat(self.fd).st_size
+        if size > len(self.buffer):
+            self.buffer = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        records = []
+        position, buffer = self.position, self.buffer
+        while position + HEADER.size <= size:
+            code, length = HEADER.unpack_from(buffer, position)
+            start = position + HEADER.size
+            stop = start + length
+            # The writer may be halfway through appending the record.
+            if stop > size:
+                break
+            records.append((OP_NAMES[code], start, stop))
+            position = stop
+        self.position = position
+        return records
+
+    def body(self, start: int, stop: int) -> bytes:
+        return self.buffer[start:stop]
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd, self.inode, self.buffer, self.position = None, None, b"", 0
+
+
+class WriterClient:
+    """
+    Connection of a worker to the writer process.
+
+    Asynchronous requests go through an asyncio stream, synchronous ones,
+    for the synchronous interfaces such as `MutableMapping`, through a
+    blocking socket. Each connection is opened on first use and serves one
+    request at a time.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the WriterClient instance.
+
+        Args:
+            path (str): The path of the Unix socket of the writer.
+        """
+        self.path: str = path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.socket: Optional[socket.socket] = None
+        self.socket_lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _result(reply: bytes) -> Any:
+        message = orjson.loads(reply)
+        if "error" in message:
+            raise ValueError(message["error"])
+        if "conflict" in message:
+            raise VersionConflict(message["conflict"])
+        return message["result"]
+
+    async def request(self, message: Dict[str, Any]) -> Any:
+        """
+        Sends a request to the writer and waits for its result.
+
+        Args:
+            message (Dict[str, Any]): The request.
+
+        Returns:
+            Any: The result of the request.
+
+        Raises:
+            ValueError: If the writer rejected the request.
+            VersionConflict: If a conditional write failed.
+            ConnectionError: If the writer cannot be reached.
+        """
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    (
+                        self.reader,
+                        self.writer,
+                    ) = await asyncio.open_unix_connection(self.path)
+                assert self.reader is not None
+                self.writer.write(frame(message))
+                await self.writer.drain()
+                (length,) = FRAME.unpack(
+                    await self.reader.readexactly(FRAME.size)
+                )
+                reply = await self.reader.readexactly(length)
+            except (OSError, asyncio.IncompleteReadError) as error:
+                self.close()
+                raise ConnectionError("Writer unavailable") from error
+        return self._result(reply)
+
+    def request_sync(self, message: Dict[str, Any]) -> Any:
+        """
+        Sends a request to the writer and blocks until its result.
+
+        Args:
+            message (Dict[str, Any]): The request.
+
+        Returns:
+            Any: The result of the request.
+
+        Raises:
+            ValueError: If the writer rejected the request.
+            VersionConflict: If a conditional write failed.
+            ConnectionError: If the writer cannot be reached.
+        """
+        with self.socket_lock:
+            try:
+                if self.socket is None:
+                    self.socket = socket.socket(socket.AF_UNIX)
+                    self.socket.connect(self.path)
+                self.socket.sendall(frame(message))
+                (length,) = FRAME.unpack(self._receive(FRAME.size))
+                reply = self._receive(length)
+            except OSError as error:
+                self.close()
+                raise ConnectionError("Writer unavailable") from error
+        return self._result(reply)
+
+    def _receive(self, size: int) -> bytes:
+        assert self.socket is not None
+        chunks = []
+        while size:
+            chunk = self.socket.recv(size)
+            if not chunk:
+                raise ConnectionResetError("Writer closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        if self.socket is not None:
+            self.socket.close()
+        self.reader, self.writer, self.socket = None, None, None
+
+
+class MappedRecords(MutableMapping):
+    """
+    Mapping of IDs to data items stored in a mapped change log.
+
+    Reads decode the record of the item on every call. Only the writer
+    process writes records, so items are added by assigning the span of
+    their record in `spans`, and cannot be assigned directly.
+    """
+
+    def __init__(self, log: LogReader, decode: Callable[[bytes], Any]):
+        """
+        Initializes the MappedRecords instance.
+
+        Args:
+            log (LogReader): The change log holding the records.
+            decode (Callable[[bytes], Any]): Decodes the body of a record.
+
+        Attributes:
+            spans (Dict[int, Tuple[int, int]]): The start and stop offsets
+                of the latest record of every item.
+        """
+        self.log: LogReader = log
+        self.decode = decode
+        self.spans: Dict[int, Tuple[int, int]] = dict()
+
+    def __getitem__(self, key: int) -> Any:
+        return self.decode(self.log.body(*self.spans[key]))
+
+    def get(self, key: int, default: Any = None) -> Any:
+        span = self.spans.get(key)
+        return default if span is None else self.decode(self.log.body(*span))
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        raise TypeError("Mapped records are written by the writer process")
+
+    def __delitem__(self, key: int) -> None:
+        del self.spans[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.spans
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class SharedDatabase(Database):
+    """
+    Database of a worker of the shared backend.
+
+    Reads are served by the inherited `Database` methods, over a collection
+    mapping the change log of the writer and indexes kept by the worker,
+    brought up to date before each read. Writes are forwarded to the
+    writer.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        input_model: Any,
+        client: WriterClient,
+        directory: str,
+        **options: Any,
+    ) -> None:
+        """
+        Initializes the SharedDatabase instance.
+
+        Args:
+            name (str): The name of the collection in the writer.
+            model (Any): The model class representing the data structure.
+            input_model (Any): The model class of the data saved.
+            client (WriterClient): The connection to the writer.
+            directory (str): The directory of the change logs.
+            **options (Any): The indexes, see `Database`.
+        """
+        super().__init__(model, **options)
+        self.name: str = name
+        self.input_model: Any = input_model
+        self.client: WriterClient = client
+        self.log: LogReader = LogReader(log_path(directory, name))
+        self.records: MappedRecords = MappedRecords(self.log, self._decode)
+        self.collection = self.records
+        # The versions of the replicas differ, so they keep no change feed.
+        self.changes = None
+
+    def _decode(self, body: bytes) -> Any:
+        values, _ = orjson.loads(body)[1]
+        return self._from_values(values)
+
+    def _from_values(self, values: List[Any]) -> Any:
+        return self._restore(tuple(values))
+
+    def _is_stored(self, data: Any) -> bool:
+        # Every read decodes a new item, which cannot be told apart from
+        # one read before a later write, so encodings are not cached.
+        return False
+
+    def _refresh(self) -> None:
+        """
+        Applies the records appended to the change log since the last
+        call, reloading it if the writer published a new generation.
+        """
+        if self.log.replaced():
+            self._clear()
+            self.log.reopen()
+        records = self.log.read()
+        if not records:
+            return
+
+        def apply() -> None:
+            for record in records:
+                self._apply(*record)
+
+        if self.ids:
+            apply()
+        else:
+            self._without_indexes(apply)
+
+    def ensure_indexes(self) -> None:
+        """
+        Brings the collection and its indexes up to date with the change
+        log, so that indexes read without a read of the collection, such
+        as the shared search index, see the latest writes.
+        """
+        self._refresh()
+        super().ensure_indexes()
+
+    def _apply(self, op: str, start: int, stop: int) -> None:
+        body = self.log.body(start, stop)
+        if op == "delete":
+            self._pop(orjson.loads(body))
+            return
+        id, (values, version) = orjson.loads(body)
+        old_data = self.records.get(id)
+        if old_data is not None:
+            self._remove_from_indexes(old_data)
+        elif not self.ids or self.ids[-1] < id:
+            self.ids.append(id)
+        else:
+            insort(self.ids, id)
+        self.records.spans[id] = (start, stop)
+        self._add_to_indexes(self._from_values(values))
+        self.encoded.discard(id)
+        self.versions.set(id, version)
+        self.index = max(self.index, id + 1)
+        self.version += 1
+
+    def _pop(self, index: int) -> Any:
+        data = self.records.get(index)
+        if data is not None:
+            del self.records[index]
+            del self.ids[bisect_left(self.ids, index)]
+            self._remove_from_indexes(data)
+            self.encoded.discard(index)
+            self.versions.discard(index)
+            self.version += 1
+        return data
+
+    async def get(self, index: int) -> Any:
+        self._refresh()
+        return await super().get(index)
+
+    async def get_all(self) -> List[Any]:
+        self._refresh()
+        return await super().get_all()
+
+    async def get_encoded(self, index: int) -> Optional[Encoded]:
+        self._refresh()
+        encoded = await super().get_encoded(index)
+        if encoded is None:
+            return None
+        # Encodings are not cached, so they do not carry the version yet.
+        return encoded._replace(version=self.versions.get(index))
+
+    async def scan(self, *args: Any, **kwargs: Any) -> List[Any]:
+        self._refresh()
+        return await super().scan(*args, **kwargs)
+
+    async def scan_sorted(self, *args: Any, **kwargs: Any) -> List[Any]:
+        self._refresh()
+        return await super().scan_sorted(*args, **kwargs)
+
+    async def summarize(self, *args: Any, **kwargs: Any) -> Summary:
+        self._refresh()
+        return await super().summarize(*args, **kwargs)
+
+    async def iter_chunks(self, size: int) -> AsyncIterator[List[Any]]:
+        """
+        Iterates over a snapshot of the data items in ascending ID order,
+        in chunks.
+
+        The snapshot holds the offsets of the records and the mapped log
+        they are read from, which stays valid after the log grows or is
+        replaced.
+
+        Args:
+            size (int): The number of data items per chunk.
+
+        Yields:
+            List[Any]: The next chunk of data items.
+        """
+        self._refresh()
+        buffer, spans = self.log.buffer, self.records.spans
+        snapshot = [spans[id] for id in self.ids]
+        for start in range(0, len(snapshot), size):
+            stop = start + size
+            yield [
+                self._decode(buffer[begin:end])
+                for begin, end in snapshot[start:stop]
+            ]
+
+    def etag(self) -> Optional[str]:
+        """
+        Returns a strong ETag for the state of the whole collection.
+
+        Returns:
+            Optional[str]: The quoted entity tag, built from the generation
+                of the change log and the position read, which all the
+                workers agree on.
+        """
+        self._refresh()
+        return f'"{self.log.inode or 0:x}-{self.log.position:x}"'
+
+    async def _request(self, op: str, **message: Any) -> Any:
+        result = await self.client.request(
+            {"collection": self.name, "op": op, **message}
+        )
+        self._refresh()
+        return result
+
+    async def save(
+        self, data: Any, requires: Optional[Requirement] = None, **fields: Any
+    ) -> Any:
+        message: Dict[str, Any] = {"data": data.dict(), "fields": fields}
+        if requires is not None:
+            # The writer checks the requirement against its own databases.
+            other = requires.storage
+            if not isinstance(other, SharedDatabase) or (
+                other.client.path != self.client.path
+            ):
+                raise ValueError("Required data item of another backend")
+            message["requires"] = {
+                "collection": other.name,
+                "id": requires.id,
+                "version": requires.version,
+            }
+        values = await self._request("save", **message)
+        return self._from_values(values)
+
+    async def save_many(self, items: Sequence[Any]) -> List[Any]:
+        saved = await self._request(
+            "save_many", items=[data.dict() for data in items]
+        )
+        return [self._from_values(values) for values in saved]
+
+    async def update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Any:
+        if isinstance(data, self.model) and data.id != id:
+            raise ValueError("ID in data does not match key ID")
+        values = await self._request(
+            "update", id=id, data=data.dict(), version=version
+        )
+        return None if values is None else self._from_values(values)
+
+    async def delete(self, index: int, version: Optional[int] = None) -> Any:
+        values = await self._request("delete", id=index, version=version)
+        return None if values is None else self._from_values(values)
+
+    async def delete_many(self, indexes: Iterable[int]) -> List[Any]:
+        deleted = await self._request("delete_many", ids=list(indexes))
+        return [self._from_values(values) for values in deleted]
+
+    def reset(self) -> None:
+        self.client.request_sync({"collection": self.name, "op": "reset"})
+        self._refresh()
+
+    def close(self) -> None:
+        self.client.close()
+        self.log.close()
+
+
+class SharedDict(UserStorage):
+    """
+    Dictionary of strings of a worker of the shared backend.
+
+    The items are replicated from the change log of the writer before each
+    read, and writes are forwarded to the writer: without blocking the
+    event loop by `put`, and with a blocking request by the synchronous
+    mapping methods, which the request handlers do not use.
+    """
+
+    def __init__(
+        self, name: str, client: WriterClient, directory: str
+    ) -> None:
+        """
+        Initializes the SharedDict instance.
+
+        Args:
+            name (str): The name of the dictionary in the writer.
+            client (WriterClient): The connection to the writer.
+            directory (str): The directory of the change logs.
+        """
+        self.name: str = name
+        self.client: WriterClient = client
+        self.log: LogReader = LogReader(log_path(directory, name))
+        self.items_: Dict[str, str] = dict()
+
+    def _refresh(self) -> Dict[str, str]:
+        if self.log.replaced():
+            self.items_.clear()
+            self.log.reopen()
+        for op, start, stop in self.log.read():
+            body = orjson.loads(self.log.body(start, stop))
+            if op == "put":
+                self.items_[body[0]] = body[1]
+            else:
+                self.items_.pop(body, None)
+        return self.items_
+
+    async def _request(self, op: str, **message: Any) -> Any:
+        result = await self.client.request(
+            {"collection": self.name, "op": op, **message}
+        )
+        self._refresh()
+        return result
+
+    def _request_sync(self, op: str, **message: Any) -> Any:
+        result = self.client.request_sync(
+            {"collection": self.name, "op": op, **message}
+        )
+        self._refresh()
+        return result
+
+    def __getitem__(self, key: str) -> str:
+        return self._refresh()[key]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self._request_sync("put", key=key, value=value)
+
+    async def fetch(self, key: str) -> Optional[str]:
+        return self._refresh().get(key)
+
+    async def put(self, key: str, value: str) -> None:
+        # The writer answers once the journal committed the write.
+        await self._request("put", key=key, value=value)
+
+    def __delitem__(self, key: str) -> None:
+        if not self._request_sync("delete", key=key):
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._refresh()))
+
+    def __len__(self) -> int:
+        return len(self._refresh())
+
+    def clear(self) -> None:
+        self._request_sync("reset")
+
+    def close(self) -> None:
+        self.client.close()
+        self.log.close()
@@ -0,0 +1,284 @@
+"""
+Memory-mapped snapshot format for the in-memory `Database`.
+
+The journal snapshot of a collection is written as a catalogue, a file that
+can be served in place once mapped in memory, rather than a pickle to be
+loaded whole:
+
+- a header holding the LSN and ID counter of the snapshot, the number of
+  records and the offset of the ID index;
+- the records, each the JSON array of the field values of a data item
+  prefixed with its length;
+- the ID index, the IDs of the records in ascending order followed by the
+  offsets of their records, as 64-bit integers.
+
+Opening a catalogue only maps the file, so a database is recovered in
+milliseconds whatever its size. A record is looked up with a binary search
+of the ID index, and only decoded, and paged in from disk, when read.
+Records written after the snapshot are kept in memory, see `MappedRows`.
+"""
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from operator import itemgetter
+from typing import IO, Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+import orjson
+
+from app.database.compact import Row
+from app.database.journal import PickledSnapshots
+
+MAGIC = b"CATL"
+# Magic number, format version, LSN, ID counter, number of records and
+# offset of the ID index.
+HEADER = struct.Struct("<4sIQQQQ")
+LENGTH = struct.Struct("<I")
+ID = struct.Struct("<q")
+FORMAT_VERSION = 1
+
+
+class CatalogueSnapshots(PickledSnapshots):
+    """
+    Snapshot format storing the state of a database as a catalogue.
+
+    The state is the ID counter and the field values of every data item,
+    as saved by `Database.checkpoint`.
+    """
+
+    def __init__(self, key: int) -> None:
+        """
+        Initializes the CatalogueSnapshots instance.
+
+        Args:
+            key (int): The position of the ID among the field values.
+        """
+        self.key = itemgetter(key)
+
+    def dump(
+        self, file: IO[bytes], lsn: int, state: Tuple[int, Iterable[Row]]
+    ) -> None:
+        """
+        Writes a catalogue.
+
+        Args:
+            file (IO[bytes]): The file to write, at its start.
+            lsn (int): The LSN the state reflects.
+            state (Tuple[int, Iterable[Row]]): The ID counter, and the
+                field values of every data item.
+        """
+        index, rows = state
+        rows = sorted(rows, key=self.key)
+        offsets = array("Q")
+        position = HEADER.size
+        file.write(bytes(HEADER.size))
+        for row in rows:
+            body = orjson.dumps(row)
+            file.write(LENGTH.pack(len(body)) + body)
+            offsets.append(position)
+            position += LENGTH.size + len(body)
+        # The ID index is aligned, to be read in place as 64-bit integers.
+        padding = -position % ID.size
+        file.write(bytes(padding))
+        ids = array("q", map(self.key, rows))
+        file.write(ids.tobytes())
+        file.write(offsets.tobytes())
+        file.seek(0)
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                lsn,
+                index,
+                len(rows),
+                position + padding,
+            )
+        )
+        file.seek(0, os.SEEK_END)
+
+    def load(self, path: str) -> Tuple[int, Any]:
+        """
+        Opens a catalogue, or loads an older pickled snapshot.
+
+        Args:
+            path (str): The path of the snapshot.
+
+        Returns:
+            Tuple[int, Any]: The LSN and the state of the snapshot, a
+                `Catalogue` unless the snapshot is pickled.
+        """
+        with open(path, "rb") as file:
+            magic = file.read(len(MAGIC))
+        if magic != MAGIC:
+            return super().load(path)
+        catalogue = Catalogue(path)
+        return catalogue.lsn, catalogue
+
+
+class Catalogue(Mapping):
+    """
+    Mapping of IDs to the field values of the records of a catalogue.
+
+    Reads decode the record on every call.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the Catalogue instance, mapping the file in memory.
+
+        The mapping stays valid after the file is replaced by a newer
+        snapshot.
+
+        Args:
+            path (str): The path of the catalogue.
+
+        Raises:
+            ValueError: If the file is not a catalogue of a known version.
+
+        Attributes:
+            lsn (int): The LSN the catalogue reflects.
+            index (int): The ID counter of the database.
+            ids (memoryview): The IDs of the records, in ascending order.
+            offsets (memoryview): The offsets of the records, in the order
+                of `ids`.
+        """
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a catalogue: {path}")
+        (
+            _,
+            version,
+            self.lsn,
+            self.index,
+            count,
+            start,
+        ) = HEADER.unpack_from(self.buffer)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unknown catalogue version: {version}")
+        view = memoryview(self.buffer)
+        middle = start + count * ID.size
+        stop = middle + count * ID.size
+        self.ids: memoryview = view[start:middle].cast("q")
+        self.offsets: memoryview = view[middle:stop].cast("Q")
+
+    def _position(self, key: Any) -> int:
+        position = bisect_left(self.ids, key)
+        if position == len(self.ids) or self.ids[position] != key:
+            return -1
+        return position
+
+    def __getitem__(self, key: Any) -> Row:
+        position = self._position(key)
+        if position < 0:
+            raise KeyError(key)
+        offset = self.offsets[position]
+        (length,) = LENGTH.unpack_from(self.buffer, offset)
+        start = offset + LENGTH.size
+        stop = start + length
+        return tuple(orjson.loads(self.buffer[start:stop]))
+
+    def __contains__(self, key: Any) -> bool:
+        return self._position(key) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def id_list(self) -> List[int]:
+        """
+        Copies the IDs of the records.
+
+        Returns:
+            List[int]: The IDs in ascending order, read from the mapped
+                index in one call rather than one by one.
+        """
+        return self.ids.tolist()
+
+
+class MappedRows(MutableMapping):
+    """
+    Rows of a `CompactDict` recovered from a catalogue.
+
+    The rows of the catalogue are read in place. Rows written later are
+    kept in memory, and take precedence.
+    """
+
+    def __init__(self, catalogue: Mapping) -> None:
+        """
+        Initializes the MappedRows instance.
+
+        Args:
+            catalogue (Mapping): The rows of the snapshot, by ID.
+
+        Attributes:
+            changed (Dict[Any, Row]): The rows written since the snapshot.
+            deleted (Set[Any]): The IDs of the rows of the catalogue
+                deleted since the snapshot.
+            size (int): The number of rows.
+        """
+        self.catalogue: Mapping = catalogue
+        self.changed: Dict[Any, Row] = dict()
+        self.deleted: Set[Any] = set()
+        self.size: int = len(catalogue)
+
+    def __getitem__(self, key: Any) -> Row:
+        row = self.changed.get(key)
+        if row is not None:
+            return row
+        if key in self.deleted:
+            raise KeyError(key)
+        return self.catalogue[key]
+
+    def __setitem__(self, key: Any, row: Row) -> None:
+        if key not in self:
+            self.size += 1
+        self.changed[key] = row
+        self.deleted.discard(key)
+
+    def __delitem__(self, key: Any) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.changed.pop(key, None)
+        if key in self.catalogue:
+            self.deleted.add(key)
+        self.size -= 1
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self.changed:
+            return True
+        return key not in self.deleted and key in self.catalogue
+
+    def __iter__(self) -> Iterator[Any]:
+        deleted = self.deleted
+        for key in self.catalogue:
+            if key not in deleted:
+                yield key
+        for key in self.changed:
+            if key not in self.catalogue:
+                yield key
+
+    def __len__(self) -> int:
+        return self.size
+
+    def copy(self) -> "MappedRows":
+        """
+        Copies the rows, sharing the catalogue with the copy.
+
+        Returns:
+            MappedRows: The copy, unaffected by later writes.
+        """
+        rows = MappedRows(self.catalogue)
+        rows.changed, rows.deleted = dict(self.changed), set(self.deleted)
+        rows.size = self.size
+        return rows
+
+    def clear(self) -> None:
+        self.catalogue = {}
+        self.changed.clear()
+        self.deleted.clear()
+        self.size = 0
@@ -0,0 +1,767 @@
+"""
+SQLite storage backend.
+
+This module provides `SqliteDatabase`, a `Storage` backed by a table of a
+SQLite database file, and `SqliteDict`, a dictionary backed by a key-value
+table. Several processes can share the same file, which allows running the
+application with `uvicorn --workers N`.
+
+Every row carries the version of its record in a `version` column, which
+every write increments. Conditional writes only match the row at the version
+the caller read, so they are checked and applied by the same statement.
+
+The database runs in WAL mode, so readers never block the writer. Every
+`SqliteDatabase` keeps a pool of connections used from a matching pool of
+worker threads: a coroutine borrows a connection, runs its statements on a
+worker thread and gives the connection back, so the event loop never waits
+on SQLite. The SQL of each operation is a constant string, so every
+connection prepares it once and reuses it from its statement cache.
+"""
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from app.database.base import (
+    Encoded,
+    Requirement,
+    Storage,
+    Summary,
+    UserStorage,
+    VersionConflict,
+    encode,
+)
+from app.database.batching import Write, WriteBatcher
+from app.database.indexes import MAX_CHAR, to_number
+
+SQL_TYPES = {int: "INTEGER", float: "REAL", bool: "INTEGER"}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Opens a connection to a SQLite database in WAL mode.
+
+    Args:
+        path (str): The path of the database file.
+
+    Returns:
+        sqlite3.Connection: The connection, in autocommit mode.
+    """
+    connection = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256,
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    # Used by the expression indexes of numeric fields.
+    connection.create_function("to_number", 1, to_number, deterministic=True)
+    return connection
+
+
+class SqliteDatabase(Storage):
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        model: Any,
+        hash_indexes: Sequence[str] = (),
+        sorted_indexes: Sequence[str] = (),
+        numeric_indexes: Sequence[str] = (),
+        distinct_indexes: Sequence[Tuple[str, str]] = (),
+        pool_size: int = 4,
+        write_batch_size: int = 1,
+        write_batch_interval: float = 0.0,
+    ) -> None:
+        """
+        Initializes the SqliteDatabase instance, creating the table if
+        needed.
+
+        Args:
+            path (str): The path of the database file.
+            table (str): The name of the table.
+            model (Any): The model class representing the data structure.
+            hash_indexes (Sequence[str]): The fields to index for equality
+                lookups.
+            sorted_indexes (Sequence[str]): The fields to index for range
+                and prefix lookups.
+            numeric_indexes (Sequence[str]): The text fields holding
+                numbers to index for numeric range lookups and ordering.
+            distinct_indexes (Sequence[Tuple[str, str]]): The (group,
+                field) pairs whose distinct values are counted per group,
+                for summaries.
+            pool_size (int): The number of pooled connections.
+            write_batch_size (int): The number of concurrent writes
+                applied in one transaction, see `WriteBatcher`. Writes are
+                applied one by one if 1.
+            write_batch_interval (float): The maximum number of seconds a
+                write waits for others to be batched with.
+
+        Attributes:
+            fields (List[str]): The columns of the table, the model fields.
+            indexed (Set[str]): The fields with an index.
+            numeric (Set[str]): The fields indexed by the number they hold.
+            distinct (Set[Tuple[str, str]]): The pairs indexed for
+                summaries.
+            connections (List[sqlite3.Connection]): The pooled connections.
+            pool (asyncio.Queue): The connections not in use.
+            executor (ThreadPoolExecutor): The threads running statements.
+            batcher (Optional[WriteBatcher]): Queues the writes to apply
+                them in batches, if batching is on.
+        """
+        self.path: str = path
+        self.table: str = table
+        self.model: Any = model
+        self.fields: List[str] = list(model.__fields__)
+        self.indexed = {*hash_indexes, *sorted_indexes, *numeric_indexes}
+        self.numeric = set(numeric_indexes)
+        self.distinct = set(distinct_indexes)
+        self.connections: List[sqlite3.Connection] = [
+            connect(path) for _ in range(pool_size)
+        ]
+        self.pool: asyncio.Queue = asyncio.Queue()
+        for connection in self.connections:
+            self.pool.put_nowait(connection)
+        self.executor = ThreadPoolExecutor(
+            pool_size, thread_name_prefix=f"sqlite-{table}"
+        )
+        self.batcher: Optional[WriteBatcher] = (
+            WriteBatcher(
+                self._write_batch, write_batch_size, write_batch_interval
+            )
+            if write_batch_size > 1
+            else None
+        )
+
+        columns = ", ".join(
+            f"{field} {self._column_type(field)}"
+            for field in self.fields
+            if field != "id"
+        )
+        self.select_sql = f"SELECT {', '.join(self.fields)} FROM {table}"
+        self.insert_sql = (
+            f"INSERT INTO {table} ({', '.join(self.fields)}) "
+            f"VALUES ({', '.join('?' for _ in self.fields)})"
+        )
+        self.update_sql = (
+            f"UPDATE {table} SET "
+            f"{', '.join(f'{field} = ?' for field in self.fields)}, "
+            "version = version + 1 WHERE id = ?"
+        )
+        indexes = "".join(
+            f"CREATE INDEX IF NOT EXISTS {table}_{field} "
+            f"ON {table} ({self._key(field)}, id);"
+            for field in sorted(self.indexed)
+        ) + "".join(
+            f"CREATE INDEX IF NOT EXISTS {table}_{group}_{field} "
+            f"ON {table} ({group}, {field});"
+            for group, field in sorted(self.distinct)
+        )
+        with closing(connect(path)) as connection:
+            connection.executescript(
+                f"""
+                BEGIN;
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    {columns},
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS sequences (
+                    name TEXT PRIMARY KEY, next INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO sequences VALUES ('{table}', 0);
+                {indexes}
+                COMMIT;
+                """
+            )
+            # Tables created before records had versions.
+            existing = {
+                row[1]
+                for row in connection.execute(f"PRAGMA table_info({table})")
+            }
+            if "version" not in existing:
+                connection.execute(
+                    f"ALTER TABLE {table} "
+                    "ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def _key(self, field: str) -> str:
+        """
+        Returns the SQL expression a field is indexed and compared by.
+        """
+        return f"to_number({field})" if field in self.numeric else field
+
+    def _column_type(self, field: str) -> str:
+        return SQL_TYPES.get(self.model.__fields__[field].type_, "TEXT")
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a function on a worker thread with a pooled connection.
+
+        Args:
+            func (Callable): Called with the connection and the arguments.
+            *args (Any): The arguments passed to the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        connection = await self.pool.get()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, func, connection, *args
+            )
+        finally:
+            self.pool.put_nowait(connection)
+
+    def _fetch(
+        self, connection: sqlite3.Connection, sql: str, params: Sequence[Any]
+    ) -> List[Any]:
+        rows = connection.execute(sql, params).fetchall()
+        return [self._restore(row) for row in rows]
+
+    async def get(self, index: int) -> Any:
+        items = await self._run(
+            self._fetch, f"{self.select_sql} WHERE id = ?", (index,)
+        )
+        return items[0] if items else None
+
+    async def get_all(self) -> List[Any]:
+        return await self._run(
+            self._fetch, f"{self.select_sql} ORDER BY id", ()
+        )
+
+    def _fetch_encoded(
+        self, connection: sqlite3.Connection, index: int
+    ) -> Optional[Encoded]:
+        row = connection.execute(
+            f"SELECT {', '.join(self.fields)}, version FROM {self.table} "
+            "WHERE id = ?",
+            (index,),
+        ).fetchone()
+        if row is None:
+            return None
+        return encode(self._restore(row[:-1]))._replace(version=row[-1])
+
+    async def get_encoded(self, index: int) -> Optional[Encoded]:
+        """
+        Retrieves a data item by its ID, encoded as JSON.
+
+        Args:
+            index (int): The ID of the data item to retrieve.
+
+        Returns:
+            Optional[Encoded]: The encoded data item, with the version of
+                its row, or None if not found.
+        """
+        return await self._run(self._fetch_encoded, index)
+
+    async def scan(
+        self,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        conditions: List[str] = []
+        params: List[Any] = []
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+        ranges = {
+            field: (value, value + MAX_CHAR)
+            for field, value in (prefix or {}).items()
+        }
+        ranges.update(between or {})
+        for field in [*(equal or {}), *ranges]:
+            if field not in self.indexed:
+                raise ValueError(f"No index on field: {field}")
+        for field, value in (equal or {}).items():
+            conditions.append(f"{field} = ?")
+            params.append(value)
+        for field, (low, high) in ranges.items():
+            conditions.append(f"{self._key(field)} BETWEEN ? AND ?")
+            params.extend((low, high))
+        sql = self.select_sql
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return await self._run(self._fetch, sql, params)
+
+    async def scan_sorted(
+        self,
+        field: str,
+        limit: int,
+        descending: bool = False,
+        equal: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Dict[str, str]] = None,
+        between: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    ) -> List[Any]:
+        if field not in self.indexed:
+            raise ValueError(f"No index on field: {field}")
+        conditions = [f"{self._key(field)} IS NOT NULL"]
+        params: List[Any] = []
+        ranges = {
+            other: (value, value + MAX_CHAR)
+            for other, value in (prefix or {}).items()
+        }
+        ranges.update(between or {})
+        for other, value in (equal or {}).items():
+            conditions.append(f"{other} = ?")
+            params.append(value)
+        for other, (low, high) in ranges.items():
+            conditions.append(f"{self._key(other)} BETWEEN ? AND ?")
+            params.extend((low, high))
+        order = "DESC" if descending else "ASC"
+        sql = (
+            f"{self.select_sql} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {self._key(field)} {order}, id {order} LIMIT ?"
+        )
+        params.append(limit)
+        return await self._run(self._fetch, sql, params)
+
+    def _open_cursor(self, connection: sqlite3.Connection) -> sqlite3.Cursor:
+        connection.execute("BEGIN")
+        return connection.execute(f"{self.select_sql} ORDER BY id")
+
+    async def iter_chunks(self, size: int) -> AsyncIterator[List[Any]]:
+        """
+        Iterates over the data items in ascending ID order, in chunks.
+
+        The items are read by a single read transaction on a borrowed
+        connection, which sees a consistent snapshot of the table in WAL
+        mode while writers go on.
+
+        Args:
+            size (int): The number of data items per chunk.
+
+        Yields:
+            List[Any]: The next chunk of data items.
+        """
+        connection = await self.pool.get()
+        loop = asyncio.get_running_loop()
+        try:
+            cursor = await loop.run_in_executor(
+                self.executor, self._open_cursor, connection
+            )
+            while True:
+                rows = await loop.run_in_executor(
+                    self.executor, cursor.fetchmany, size
+                )
+                if not rows:
+                    return
+                yield [self._restore(row) for row in rows]
+        finally:
+            # Ending a read transaction is immediate.
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            self.pool.put_nowait(connection)
+
+    def _check_requirement(
+        self, connection: sqlite3.Connection, requires: Requirement
+    ) -> None:
+        """
+        Checks, in the transaction of a write, that the data item a new
+        data item requires is stored, at the required version if one is
+        given.
+
+        Args:
+            connection (sqlite3.Connection): The connection of the write.
+            requires (Requirement): The required data item.
+
+        Raises:
+            VersionConflict: If the row is missing or at another version.
+            ValueError: If the row is not in the same database file.
+        """
+        other = requires.storage
+        if not isinstance(other, SqliteDatabase) or other.path != self.path:
+            raise ValueError("Required data item of another backend")
+        row = connection.execute(
+            f"SELECT version FROM {other.table} WHERE id = ?", (requires.id,)
+        ).fetchone()
+        if row is None:
+            raise VersionConflict(f"Data item {requires.id} was deleted")
+        if requires.version is not None and row[0] != requires.version:
+            raise VersionConflict(
+                f"Data item {requires.id} was written since version "
+                f"{requires.version}"
+            )
+
+    def _save(
+        self,
+        connection: sqlite3.Connection,
+        values: Dict[str, Any],
+        requires: Optional[Requirement] = None,
+    ) -> Any:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if requires is not None:
+                self._check_requirement(connection, requires)
+            (index,) = connection.execute(
+                "SELECT next FROM sequences WHERE name = ?", (self.table,)
+            ).fetchone()
+            connection.execute(
+                "UPDATE sequences SET next = ? WHERE name = ?",
+                (index + 1, self.table),
+            )
+            new_data = self.model(**values, id=index)
+            connection.execute(self.insert_sql, self._dump(new_data))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return new_data
+
+    async def save(
+        self, data: Any, requires: Optional[Requirement] = None, **fields: Any
+    ) -> Any:
+        if self.batcher is not None:
+            return await self.batcher.submit("save", data, fields, requires)
+        return await self._run(self._save, {**data.dict(), **fields}, requires)
+
+    def _save_many(
+        self, connection: sqlite3.Connection, items: List[Dict[str, Any]]
+    ) -> List[Any]:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            (first,) = connection.execute(
+                "SELECT next FROM sequences WHERE name = ?", (self.table,)
+            ).fetchone()
+            connection.execute(
+                "UPDATE sequences SET next = ? WHERE name = ?",
+                (first + len(items), self.table),
+            )
+            saved = [
+                self.model(**values, id=index)
+                for index, values in enumerate(items, first)
+            ]
+            connection.executemany(
+                self.insert_sql, [self._dump(data) for data in saved]
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return saved
+
+    async def save_many(self, items: Sequence[Any]) -> List[Any]:
+        return await self._run(
+            self._save_many, [data.dict() for data in items]
+        )
+
+    def _check_missed(
+        self, connection: sqlite3.Connection, index: int, version: int
+    ) -> None:
+        """
+        Checks why a conditional write matched no row.
+
+        Args:
+            connection (sqlite3.Connection): The connection of the write.
+            index (int): The ID of the data item.
+            version (int): The version the write expected.
+
+        Raises:
+            VersionConflict: If the row exists, at another version. The
+                write missed the row if it does not.
+        """
+        row = connection.execute(
+            f"SELECT 1 FROM {self.table} WHERE id = ?", (index,)
+        ).fetchone()
+        if row is not None:
+            raise VersionConflict(
+                f"Data item {index} was written since version {version}"
+            )
+
+    def _update(
+        self,
+        connection: sqlite3.Connection,
+        id: int,
+        data: Any,
+        version: Optional[int] = None,
+    ) -> Any:
+        if isinstance(data, self.model):
+            if data.id != id:
+                raise ValueError("ID in data does not match key ID")
+            new_data = data
+        else:
+            new_data = self.model(**data.dict(), id=id)
+        if version is None:
+            cursor = connection.execute(
+                self.update_sql, (*self._dump(new_data), id)
+            )
+            return new_data if cursor.rowcount else None
+        cursor = connection.execute(
+            f"{self.update_sql} AND version = ?",
+            (*self._dump(new_data), id, version),
+        )
+        if not cursor.rowcount:
+            self._check_missed(connection, id, version)
+            return None
+        return new_data
+
+    async def update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Any:
+        if self.batcher is not None:
+            return await self.batcher.submit("update", id, data, version)
+        return await self._run(self._update, id, data, version)
+
+    def _pop(
+        self,
+        connection: sqlite3.Connection,
+        index: int,
+        version: Optional[int] = None,
+    ) -> Any:
+        row = connection.execute(
+            f"SELECT {', '.join(self.fields)}, version FROM {self.table} "
+            "WHERE id = ?",
+            (index,),
+        ).fetchone()
+        if row is None:
+            return None
+        if version is not None and row[-1] != version:
+            raise VersionConflict(
+                f"Data item {index} was written since version {version}"
+            )
+        connection.execute(f"DELETE FROM {self.table} WHERE id = ?", (index,))
+        return self._restore(row[:-1])
+
+    def _delete(
+        self,
+        connection: sqlite3.Connection,
+        index: int,
+        version: Optional[int] = None,
+    ) -> Any:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            data = self._pop(connection, index, version)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return data
+
+    async def delete(self, index: int, version: Optional[int] = None) -> Any:
+        if self.batcher is not None:
+            return await self.batcher.submit("delete", index, version)
+        return await self._run(self._delete, index, version)
+
+    def _apply_batch(
+        self, connection: sqlite3.Connection, writes: List[Write]
+    ) -> List[Any]:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            (first,) = connection.execute(
+                "SELECT next FROM sequences WHERE name = ?", (self.table,)
+            ).fetchone()
+            index, results = first, []
+            for write in writes:
+                # Invalid data is rejected before any statement runs, so
+                # only that write fails.
+                try:
+                    if write.op == "save":
+                        data, fields, requires = write.args
+                        if requires is not None:
+                            self._check_requirement(connection, requires)
+                        result = self.model(**data.dict(), **fields, id=index)
+                        connection.execute(self.insert_sql, self._dump(result))
+                        index += 1
+                    elif write.op == "update":
+                        result = self._update(connection, *write.args)
+                    else:
+                        result = self._pop(connection, *write.args)
+                except (ValueError, VersionConflict) as error:
+                    result = error
+                results.append(result)
+            if index != first:
+                connection.execute(
+                    "UPDATE sequences SET next = ? WHERE name = ?",
+                    (index, self.table),
+                )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return results
+
+    async def _write_batch(self, writes: List[Write]) -> List[Any]:
+        """
+        Applies a batch of writes in a single transaction.
+
+        Args:
+            writes (List[Write]): The writes, in the order they are
+                applied.
+
+        Returns:
+            List[Any]: The result of every write, or the `ValueError` or
+                `VersionConflict` it failed with.
+        """
+        return await self._run(self._apply_batch, writes)
+
+    def _delete_many(
+        self, connection: sqlite3.Connection, indexes: List[int]
+    ) -> List[Any]:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = []
+            for index in dict.fromkeys(indexes):
+                deleted.extend(
+                    self._fetch(
+                        connection, f"{self.select_sql} WHERE id = ?", (index,)
+                    )
+                )
+            connection.executemany(
+                f"DELETE FROM {self.table} WHERE id = ?",
+                [(data.id,) for data in deleted],
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return deleted
+
+    async def delete_many(self, indexes: Iterable[int]) -> List[Any]:
+        return await self._run(self._delete_many, list(indexes))
+
+    def _summarize(
+        self,
+        connection: sqlite3.Connection,
+        field: str,
+        value: Any,
+        distinct: str,
+        latest: int,
+    ) -> Summary:
+        count, distinct_count = connection.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT {distinct}) FROM {self.table} "
+            f"WHERE {field} = ?",
+            (value,),
+        ).fetchone()
+        rows = connection.execute(
+            f"SELECT id FROM {self.table} WHERE {field} = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (value, latest),
+        ).fetchall()
+        return Summary(count, distinct_count, [id for (id,) in rows])
+
+    async def summarize(
+        self, field: str, value: Any, distinct: str, latest: int
+    ) -> Summary:
+        if (field, distinct) not in self.distinct:
+            raise ValueError(
+                f"No distinct index on fields: {field}, {distinct}"
+            )
+        return await self._run(self._summarize, field, value, distinct, latest)
+
+    def reset(self) -> None:
+        with closing(connect(self.path)) as connection:
+            connection.executescript(
+                f"""
+                BEGIN;
+                DELETE FROM {self.table};
+                UPDATE sequences SET next = 0 WHERE name = '{self.table}';
+                COMMIT;
+                """
+            )
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections and stops the worker threads.
+        """
+        self.executor.shutdown(wait=True)
+        for connection in self.connections:
+            connection.close()
+
+
+class SqliteDict(UserStorage):
+    """
+    Dictionary of strings backed by a key-value table.
+
+    Used for the user table. The mapping methods run their statement on
+    the calling thread. `fetch` and `put`, used by the request handlers,
+    run it on a worker thread instead, since SQLite waits up to its busy
+    timeout for the lock of a database file written by another process.
+    """
+
+    def __init__(self, path: str, table: str) -> None:
+        """
+        Initializes the SqliteDict instance, creating the table if needed.
+
+        Args:
+            path (str): The path of the database file.
+            table (str): The name of the table.
+        """
+        self.table: str = table
+        self.connection: sqlite3.Connection = connect(path)
+        self.executor = ThreadPoolExecutor(
+            1, thread_name_prefix=f"sqlite-{table}"
+        )
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def __getitem__(self, key: str) -> str:
+        row = self.connection.execute(
+            f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?)",
+            (key, value),
+        )
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def fetch(self, key: str) -> Optional[str]:
+        return await self._run(self.get, key)
+
+    async def put(self, key: str, value: str) -> None:
+        # Writes are committed as they are made.
+        await self._run(self.__setitem__, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        cursor = self.connection.execute(
+            f"DELETE FROM {self.table} WHERE key = ?", (key,)
+        )
+        if not cursor.rowcount:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.connection.execute(f"SELECT key FROM {self.table}")
+        return iter([key for (key,) in rows])
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM {self.table}"
+        ).fetchone()[0]
+
+    def clear(self) -> None:
+        self.connection.execute(f"DELETE FROM {self.table}")
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.connection.close()
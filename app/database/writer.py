@@ -0,0 +1,233 @@
+"""
+Writer process of the shared storage backend.
+
+Owns the in-memory databases, journaled to the data directory if one is
+set, publishes their changes to the change logs read by the workers, and
+applies the writes the workers send over a Unix socket. See
+`app.database.shared`.
+
+Usage:
+    STORAGE=shared python -m app.database.writer
+"""
+import asyncio
+import os
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.config import settings
+from app.database import db
+from app.database.base import Requirement, VersionConflict
+from app.database.db import Database, JournaledDict
+from app.database.shared import FRAME, SharedLog, frame, log_path
+from app.models.products import ProductIn
+from app.models.reviews import ReviewIn
+
+
+class Writer:
+    def __init__(
+        self,
+        directory: str,
+        databases: Dict[str, Tuple[Database, Any]],
+        users: JournaledDict,
+    ) -> None:
+        """
+        Initializes the Writer instance.
+
+        Args:
+            directory (str): The directory of the change logs.
+            databases (Dict[str, Tuple[Database, Any]]): The databases by
+                collection name, with the model class of the data saved.
+            users (JournaledDict): The user table.
+
+        Attributes:
+            logs (List[SharedLog]): The change logs, once published.
+        """
+        self.directory: str = directory
+        self.databases = databases
+        self.users: JournaledDict = users
+        self.logs: List[SharedLog] = []
+
+    def publish(self) -> None:
+        """
+        Writes a new generation of the change log of every collection, and
+        appends the later changes to it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for name, (database, _) in self.databases.items():
+            self._publish(
+                name,
+                database,
+                partial(self._items, database),
+                partial(self._encode, database),
+            )
+        self._publish("users", self.users, lambda: list(self.users.items()))
+
+    @staticmethod
+    def _items(database: Database) -> Iterable[Tuple[int, Any]]:
+        return ((id, database.collection[id]) for id in database.ids)
+
+    @staticmethod
+    def _encode(database: Database, data: Any) -> Tuple[Any, int]:
+        # The replicas check conditional writes against these versions.
+        return database._dump(data), database.versions.get(data.id)
+
+    def _publish(
+        self,
+        name: str,
+        target: Any,
+        items: Callable[[], Iterable[Tuple[Any, Any]]],
+        *encode: Callable[[Any], Any],
+    ) -> None:
+        log = SharedLog(log_path(self.directory, name), items, *encode)
+        log.rewrite()
+        target.listeners.append(log.append)
+        self.logs.append(log)
+
+    async def handle(self, message: Dict[str, Any]) -> Any:
+        """
+        Applies a write sent by a worker.
+
+        Args:
+            message (Dict[str, Any]): The collection, the operation and its
+                arguments.
+
+        Returns:
+            Any: The result of the operation, data items as the tuples of
+                their field values.
+
+        Raises:
+            ValueError: If the request is invalid.
+            VersionConflict: If a conditional write found the data item at
+                another version.
+        """
+        collection, op = message["collection"], message["op"]
+        if collection == "users":
+            if op == "put":
+                await self.users.put(message["key"], message["value"])
+                return None
+            if op == "delete":
+                return self.users.pop(message["key"], None) is not None
+            if op == "reset":
+                self.users.clear()
+                return None
+            raise ValueError(f"Unknown operation: {op}")
+        if collection not in self.databases:
+            raise ValueError(f"Unknown collection: {collection}")
+        database, input_model = self.databases[collection]
+        dump = database._dump
+        if op == "save":
+            requires = message.get("requires")
+            if requires is not None:
+                if requires["collection"] not in self.databases:
+                    raise ValueError(
+                        f"Unknown collection: {requires['collection']}"
+                    )
+                other, _ = self.databases[requires["collection"]]
+                requires = Requirement(
+                    other, requires["id"], requires["version"]
+                )
+            saved = await database.save(
+                input_model(**message["data"]),
+                requires=requires,
+                **message["fields"],
+            )
+            return dump(saved)
+        if op == "save_many":
+            saved = await database.save_many(
+                [input_model(**data) for data in message["items"]]
+            )
+            return [dump(data) for data in saved]
+        if op == "update":
+            data = message["data"]
+            model = database.model if "id" in data else input_model
+            updated = await database.update(
+                message["id"], model(**data), version=message.get("version")
+            )
+            return None if updated is None else dump(updated)
+        if op == "delete":
+            deleted = await database.delete(
+                message["id"], version=message.get("version")
+            )
+            return None if deleted is None else dump(deleted)
+        if op == "delete_many":
+            deleted = await database.delete_many(message["ids"])
+            return [dump(data) for data in deleted]
+        if op == "reset":
+            database.reset()
+            return None
+        raise ValueError(f"Unknown operation: {op}")
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Answers the requests of a worker connection, one at a time.
+        """
+        try:
+            while True:
+                header = await reader.readexactly(FRAME.size)
+                (length,) = FRAME.unpack(header)
+                message = orjson.loads(await reader.readexactly(length))
+                try:
+                    reply = {"result": await self.handle(message)}
+                except ValueError as error:
+                    reply = {"error": str(error)}
+                except VersionConflict as error:
+                    reply = {"conflict": str(error)}
+                writer.write(frame(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path: str) -> asyncio.AbstractServer:
+        """
+        Publishes the change logs and listens for the workers.
+
+        Args:
+            path (str): The path of the Unix socket.
+
+        Returns:
+            asyncio.AbstractServer: The listening server.
+        """
+        self.publish()
+        if os.path.exists(path):
+            os.unlink(path)
+        return await asyncio.start_unix_server(self.serve_client, path)
+
+    def close(self) -> None:
+        for log in self.logs:
+            log.close()
+
+
+async def main() -> None:
+    if settings.data_dir:
+        db.load_journals(settings.data_dir)
+    # The writer never calls `open_dbs`, it owns the in-memory databases.
+    products, reviews, users = db.PRODUCT_DB, db.REVIEW_DB, db.USER_DB
+    assert isinstance(products, Database) and isinstance(reviews, Database)
+    assert isinstance(users, JournaledDict)
+    writer = Writer(
+        settings.shared_dir,
+        {"products": (products, ProductIn), "reviews": (reviews, ReviewIn)},
+        users,
+    )
+    server = await writer.serve(settings.shared_socket)
+    checkpoints: Optional[asyncio.Task] = None
+    if settings.data_dir:
+        checkpoints = asyncio.create_task(db.checkpoint_periodically())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if checkpoints is not None:
+            checkpoints.cancel()
+        writer.close()
+        await db.close_dbs()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,13 +1,29 @@
+import asyncio
+from typing import Optional
+
 from fastapi import FastAPI, status
+from fastapi.responses import PlainTextResponse
 
+from app.api.admin import admin_router
 from app.api.product import product_router
 from app.api.review import review_router
-from app.api.user import user_router
+from app.api.search import search_router
+from app.api.user import hasher, user_router
+from app.config import settings
+from app.database.db import checkpoint_periodically, close_dbs, open_dbs
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, render
+from app.profiling import ProfilingMiddleware
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 app.include_router(product_router)
 app.include_router(review_router)
+app.include_router(search_router)
 app.include_router(user_router)
+app.include_router(admin_router)
+
+checkpoint_task: Optional[asyncio.Task] = None
 
 
 @app.get("/healthcheck", status_code=status.HTTP_200_OK)
@@ -22,3 +38,47 @@ def perform_healthcheck():
         - 200: The health check was successful.
     """
     return {"message": "OK"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """
+    Exposes the metrics of this worker process.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text format.
+
+    Response:
+        - 200: The metrics.
+    """
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+
+@app.on_event("startup")
+async def open_databases() -> None:
+    """
+    Sets up the storage backend, recovering the in-memory databases from
+    their journals if durability is enabled.
+    """
+    global checkpoint_task
+    open_dbs()
+    if settings.storage == "memory" and settings.data_dir:
+        checkpoint_task = asyncio.create_task(checkpoint_periodically())
+
+
+@app.on_event("shutdown")
+async def close_databases() -> None:
+    """
+    Stops the snapshots and closes the storage backend.
+    """
+    if checkpoint_task is not None:
+        checkpoint_task.cancel()
+    await close_dbs()
+
+
+@app.on_event("shutdown")
+def shutdown_hasher() -> None:
+    """
+    Shuts down the password hashing pool.
+    """
+    hasher.shutdown()
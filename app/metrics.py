@@ -0,0 +1,340 @@
+"""
+Metrics module for the application.
+
+This module provides counters, gauges and histograms rendered in the
+Prometheus text format, and the ASGI middleware measuring the requests.
+
+Every metric is updated from the event loop thread, so updates are plain
+integer and float operations without any lock. Each worker process keeps
+its own metrics, which Prometheus aggregates across the scraped workers.
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.profiling import record
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds of the latency buckets, in seconds.
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    kind: str = "untyped"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = ()
+    ) -> None:
+        """
+        Initializes the Metric instance and registers it.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labels (Sequence[str]): The names of the labels telling the
+                series of the metric apart.
+        """
+        self.name: str = name
+        self.help: str = help
+        self.labels: Tuple[str, ...] = tuple(labels)
+        REGISTRY.append(self)
+
+    def samples(self) -> List[Tuple[str, str, Any]]:
+        """
+        Returns the current samples of the metric.
+
+        Returns:
+            List[Tuple[str, str, Any]]: The name suffix, formatted labels
+                and value of every sample.
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Renders the metric in the Prometheus text format.
+
+        Returns:
+            str: The help and type lines followed by one line per sample.
+        """
+        lines = [
+            f"# HELP {self.name} {_escape(self.help)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {value}"
+            for suffix, labels, value in self.samples()
+        )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = dict()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Increments the series of the given label values.
+
+        Args:
+            *labels (str): The label values.
+            amount (float): The increment.
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[Tuple[str, str, Any]]:
+        return [
+            ("", _format_labels(self.labels, labels), value)
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], Dict[Labels, float]]] = None,
+    ) -> None:
+        """
+        Initializes the Gauge instance and registers it.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labels (Sequence[str]): The names of the labels.
+            function (Optional[Callable[[], Dict[Labels, float]]]): Reads
+                the value of every series when the metric is rendered,
+                instead of keeping them up to date.
+        """
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """
+        Decrements the series of the given label values.
+
+        Args:
+            *labels (str): The label values.
+            amount (float): The decrement.
+        """
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[Tuple[str, str, Any]]:
+        if self.function is not None:
+            self.values = self.function()
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        """
+        Initializes the Histogram instance and registers it.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labels (Sequence[str]): The names of the labels.
+            buckets (Sequence[float]): The upper bounds of the buckets, in
+                ascending order.
+
+        Attributes:
+            series (Dict[Labels, List[float]]): The number of observations
+                in each bucket, the last one unbounded, followed by the sum
+                of the observations, per series.
+        """
+        super().__init__(name, help, labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.series: Dict[Labels, List[float]] = dict()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        Records an observation in the series of the given label values.
+
+        Args:
+            value (float): The observed value.
+            *labels (str): The label values.
+        """
+        counts = self.series.get(labels)
+        if counts is None:
+            counts = self.series[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[Tuple[str, str, Any]]:
+        samples: List[Tuple[str, str, Any]] = []
+        names = (*self.labels, "le")
+        for labels, counts in self.series.items():
+            total: float = 0
+            bounds = [*map(str, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                total += count
+                samples.append(
+                    ("_bucket", _format_labels(names, (*labels, bound)), total)
+                )
+            formatted = _format_labels(self.labels, labels)
+            samples.append(("_sum", formatted, counts[-1]))
+            samples.append(("_count", formatted, total))
+        return samples
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """
+    Renders every registered metric in the Prometheus text format.
+
+    Returns:
+        str: The exposition text.
+    """
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled."
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, response body included.",
+    ("method", "route"),
+)
+
+
+class TimedLock(asyncio.Lock):
+    """
+    `asyncio.Lock` measuring how long it is waited for and held.
+
+    The wait is also reported as the "lock" phase of profiled requests.
+    """
+
+    def __init__(self, wait: Histogram, hold: Histogram, *labels: str):
+        """
+        Initializes the TimedLock instance.
+
+        Args:
+            wait (Histogram): The histogram of the wait times.
+            hold (Histogram): The histogram of the hold times.
+            *labels (str): The label values of the observations.
+        """
+        super().__init__()
+        self.wait: Histogram = wait
+        self.hold: Histogram = hold
+        self.label_values: Tuple[str, ...] = labels
+        self.acquired: float = 0.0
+
+    async def acquire(self) -> Literal[True]:
+        start = time.perf_counter()
+        await super().acquire()
+        self.acquired = time.perf_counter()
+        self.wait.observe(self.acquired - start, *self.label_values)
+        record("lock", self.acquired - start)
+        return True
+
+    def release(self) -> None:
+        held = time.perf_counter() - self.acquired
+        super().release()
+        self.hold.observe(held, *self.label_values)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting the HTTP requests and measuring their latency.
+
+    Requests are labelled with the template of the route they matched, such
+    as `/products/{id}`, so that the number of series stays bounded.
+    Requests matching no route are labelled "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope.
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUESTS.inc(method, path, str(status_code))
+            REQUEST_DURATION.observe(elapsed, method, path)
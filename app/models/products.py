@@ -1,8 +1,6 @@
-from typing import List
-
 from pydantic import BaseModel
 
-from app.models.reviews import Review
+from app.models.reviews import ReviewSummary
 
 
 class ProductBase(BaseModel):
@@ -13,8 +11,11 @@ class ProductBase(BaseModel):
 
 class Product(ProductBase):
     id: int
-    reviews: List[Review]
 
 
 class ProductIn(ProductBase):
     pass
+
+
+class ProductDetail(Product):
+    review_summary: ReviewSummary
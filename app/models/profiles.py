@@ -0,0 +1,13 @@
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class ProfileSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    started: float
+    duration_ms: float
+    spans_ms: Dict[str, float]
+    cpu_profile: bool
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel, EmailStr
 
 
@@ -6,8 +8,16 @@ class ReviewBase(BaseModel):
 
 
 class Review(ReviewBase):
+    id: int
+    product_id: int
     user: EmailStr
 
 
 class ReviewIn(ReviewBase):
     pass
+
+
+class ReviewSummary(BaseModel):
+    review_count: int
+    reviewer_count: int
+    latest_review_ids: List[int]
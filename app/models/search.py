@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+from app.models.products import Product
+
+
+class SearchResult(BaseModel):
+    product: Product
+    score: float
@@ -0,0 +1,192 @@
+"""
+Profiling module for the application.
+
+When profiling is switched on in the settings, `ProfilingMiddleware`
+profiles the requests sent with an `X-Profile: 1` header, and a random
+sample of the others. A profiled request gets:
+
+- timing spans for the named phases of its handling: password hashing
+  ("hash"), token verification ("jwt"), waiting for a database write lock
+  ("lock") and response encoding ("serialize"), sent back in a
+  `Server-Timing` header;
+- a cProfile CPU profile, kept with the spans among the latest profiles
+  and downloadable from the admin endpoints.
+
+The phases report their time with `span` or `record`, which cost a
+context variable lookup when the request is not profiled.
+"""
+import cProfile
+import itertools
+import marshal
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+
+class RequestProfile:
+    def __init__(self, id: int, method: str, path: str) -> None:
+        """
+        Initializes the RequestProfile instance.
+
+        Args:
+            id (int): The ID of the profile.
+            method (str): The HTTP method of the request.
+            path (str): The path of the request.
+
+        Attributes:
+            started (float): When the request started, as a UNIX time.
+            duration (float): Seconds spent handling the request.
+            spans (Dict[str, float]): Seconds spent in each named phase.
+            stats (Optional[bytes]): The CPU profile in the marshalled
+                `pstats` format, or None if another request was being
+                profiled at the same time.
+        """
+        self.id: int = id
+        self.method: str = method
+        self.path: str = path
+        self.started: float = time.time()
+        self.duration: float = 0.0
+        self.spans: Dict[str, float] = dict()
+        self.stats: Optional[bytes] = None
+
+    def server_timing(self, total: float) -> str:
+        """
+        Formats the spans as a `Server-Timing` header value.
+
+        Args:
+            total (float): The seconds spent on the request so far.
+
+        Returns:
+            str: The header value, durations in milliseconds.
+        """
+        metrics = [
+            f"{name};dur={seconds * 1e3:.3f}"
+            for name, seconds in self.spans.items()
+        ]
+        metrics.append(f"total;dur={total * 1e3:.3f}")
+        return ", ".join(metrics)
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar(
+    "current_profile", default=None
+)
+# The latest profiles, oldest first.
+PROFILES: Deque[RequestProfile] = deque(maxlen=settings.profile_history)
+profile_ids = itertools.count(1)
+# cProfile hooks the whole thread, so only one request is CPU profiled at
+# a time.
+cpu_profiler: Optional[cProfile.Profile] = None
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    Adds time to a phase of the request being handled, if it is profiled.
+
+    Args:
+        name (str): The name of the phase.
+        seconds (float): The time spent in the phase.
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.spans[name] = profile.spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Times the enclosed block as a phase of the request being handled.
+
+    Args:
+        name (str): The name of the phase.
+    """
+    if current_profile.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def get_profile(id: int) -> Optional[RequestProfile]:
+    """
+    Returns one of the latest profiles.
+
+    Args:
+        id (int): The ID of the profile.
+
+    Returns:
+        Optional[RequestProfile]: The profile, or None if not kept.
+    """
+    for profile in PROFILES:
+        if profile.id == id:
+            return profile
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests asking for it, or sampled.
+
+    The CPU profile covers the event loop thread while the request is
+    handled, so it also holds the work of the requests handled
+    concurrently.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def _wanted(self, scope: Scope) -> bool:
+        if not settings.profiling or scope["type"] != "http":
+            return False
+        if (b"x-profile", b"1") in scope["headers"]:
+            return True
+        return random.random() < settings.profile_sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        global cpu_profiler
+        if not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            next(profile_ids), scope["method"], scope["path"]
+        )
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timing = profile.server_timing(time.perf_counter() - start)
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode()),
+                    ],
+                }
+            await send(message)
+
+        profiler = None
+        if cpu_profiler is None:
+            profiler = cpu_profiler = cProfile.Profile()
+            profiler.enable()
+        token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            profile.duration = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                cpu_profiler = None
+                profiler.create_stats()
+                profile.stats = marshal.dumps(profiler.stats)
+            PROFILES.append(profile)
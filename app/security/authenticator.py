@@ -1,6 +1,8 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
+from app.config import settings
+from app.profiling import span
 from app.security.jwt import verify_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/signin")
@@ -19,5 +21,27 @@ async def authenticate(token: str = Depends(oauth2_scheme)) -> str:
     Raises:
         HTTPException: If the token is invalid or has expired.
     """
-    decoded_token = await verify_token(token)
+    with span("jwt"):
+        decoded_token = await verify_token(token)
     return decoded_token["user"]
+
+
+async def authenticate_admin(user: str = Depends(authenticate)) -> str:
+    """
+    Authenticates a user allowed to use the admin endpoints.
+
+    Args:
+        user (str): The authenticated user identifier.
+
+    Returns:
+        str: The user identifier.
+
+    Raises:
+        HTTPException: If the user is not an admin.
+    """
+    if user not in settings.admin_users:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return user
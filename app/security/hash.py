@@ -1,6 +1,57 @@
+import asyncio
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from app.config import settings
+from app.metrics import Histogram
+from app.profiling import record
+
 ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+HASHER_DURATION = Histogram(
+    "hasher_duration_seconds",
+    "Time spent hashing or verifying a password on the pool, queueing "
+    "included.",
+    ("function",),
+)
+
+
+def hash_password(password: str) -> str:
+    """
+    Hashes the given password.
+
+    Defined at module level so it can be pickled into a process pool.
+
+    Args:
+        password (str): The plain password.
+
+    Returns:
+        str: The hashed password.
+    """
+    return ctx.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifies if the plain password matches the hashed password.
+
+    Defined at module level so it can be pickled into a process pool.
+
+    Args:
+        plain_password (str): The plain password.
+        hashed_password (str): The hashed password.
+
+    Returns:
+        bool: True if the passwords match, False otherwise.
+    """
+    return ctx.verify(plain_password, hashed_password)
 
 
 class Hasher:
@@ -18,7 +69,7 @@ class Hasher:
         Returns:
             str: The hashed password.
         """
-        return ctx.hash(password)
+        return hash_password(password)
 
     def verify(self, plain_password: str, hashed_password: str) -> bool:
         """
@@ -31,4 +82,129 @@ class Hasher:
         Returns:
             bool: True if the passwords match, False otherwise.
         """
-        return ctx.verify(plain_password, hashed_password)
+        return verify_password(plain_password, hashed_password)
+
+
+class AsyncHasher:
+    """
+    Password hashing service that runs bcrypt on a worker pool.
+
+    bcrypt is deliberately slow, so calling it inside a coroutine stalls the
+    event loop for every other request. This class moves the work to a
+    thread or process pool and bounds the number of jobs queued or running.
+    When the bound is reached new jobs are rejected with a 429 instead of
+    piling up behind the pool.
+    """
+
+    def __init__(
+        self,
+        executor: str = settings.hasher_executor,
+        max_workers: int = settings.hasher_max_workers,
+        max_pending: int = settings.hasher_max_pending,
+    ) -> None:
+        """
+        Initializes the AsyncHasher instance.
+
+        The pool itself is created lazily on first use, so importing this
+        module never forks worker processes.
+
+        Args:
+            executor (str): Pool type, either "thread" or "process".
+            max_workers (int): Number of workers in the pool.
+            max_pending (int): Maximum number of jobs queued or running.
+
+        Raises:
+            ValueError: If the executor type is unknown.
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown hasher executor: {executor}")
+        self.executor_type: str = executor
+        self.max_workers: int = max_workers
+        self.max_pending: int = max_pending
+        self.pending: int = 0
+        self.executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.executor_type == "process":
+                self.executor = ProcessPoolExecutor(self.max_workers)
+            else:
+                self.executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="hasher"
+                )
+        return self.executor
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a hashing function on the pool.
+
+        Args:
+            func (Callable): The function to run.
+            *args (Any): The arguments passed to the function.
+
+        Returns:
+            Any: The result of the function.
+
+        Raises:
+            HTTPException: If the pool is saturated.
+        """
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again later.",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            result = await loop.run_in_executor(
+                self._get_executor(), func, *args
+            )
+            elapsed = time.perf_counter() - start
+            HASHER_DURATION.observe(elapsed, func.__name__)
+            record("hash", elapsed)
+            return result
+        finally:
+            self.pending -= 1
+
+    async def create(self, password: str) -> str:
+        """
+        Hashes the given password on the pool.
+
+        Args:
+            password (str): The plain password.
+
+        Returns:
+            str: The hashed password.
+
+        Raises:
+            HTTPException: If the pool is saturated.
+        """
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verifies a password against its hash on the pool.
+
+        Args:
+            plain_password (str): The plain password.
+            hashed_password (str): The hashed password.
+
+        Returns:
+            bool: True if the passwords match, False otherwise.
+
+        Raises:
+            HTTPException: If the pool is saturated.
+        """
+        return await self._run(
+            verify_password, plain_password, hashed_password
+        )
+
+    def shutdown(self) -> None:
+        """
+        Shuts the pool down, waiting for running jobs to finish.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
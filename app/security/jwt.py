@@ -1,13 +1,17 @@
+import hashlib
 import secrets
 import time
-from datetime import datetime
+from collections import OrderedDict
+from typing import Optional
 
 from fastapi import HTTPException, status
 from jose import JWTError, jwt
 
-from app.database.db import USER_DB
+from app.config import settings
+from app.database.db import get_user_db
 
-generated_key = secrets.token_urlsafe(nbytes=32)
+# Workers sharing a storage backend must share the key too.
+generated_key = settings.jwt_secret or secrets.token_urlsafe(nbytes=32)
 
 
 def create_token(user: str) -> str:
@@ -25,15 +29,78 @@ def create_token(user: str) -> str:
     return token
 
 
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens.
+
+    Entries are keyed on the SHA-256 digest of the token, so the cache never
+    holds usable credentials, and store the decoded claims. An entry lives
+    until the `expires` claim of its token, or until it is evicted to make
+    room for a newer one.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Initializes the TokenCache instance.
+
+        Args:
+            max_size (int): The maximum number of cached tokens.
+        """
+        self.max_size: int = max_size
+        self.entries: "OrderedDict[bytes, dict]" = OrderedDict()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        """
+        Returns the claims of a cached token, marking it as recently used.
+
+        Args:
+            digest (bytes): The digest of the token.
+
+        Returns:
+            Optional[dict]: The decoded claims, or None if not cached.
+        """
+        claims = self.entries.get(digest)
+        if claims is not None:
+            self.entries.move_to_end(digest)
+        return claims
+
+    def put(self, digest: bytes, claims: dict) -> None:
+        """
+        Caches the claims of a verified token.
+
+        Args:
+            digest (bytes): The digest of the token.
+            claims (dict): The decoded claims.
+        """
+        self.entries[digest] = claims
+        self.entries.move_to_end(digest)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, digest: bytes) -> None:
+        self.entries.pop(digest, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+token_cache = TokenCache(settings.token_cache_size)
+
+
 async def verify_token(token: str) -> dict:
     """
     Verifies the authenticity of a JSON Web Token (JWT).
 
+    Tokens that passed verification are cached until they expire, so that
+    the signature of a reused token is only checked once. The user is
+    looked up on every call, so removing a user invalidates their cached
+    tokens.
+
     Args:
         token (str): The JWT to be verified.
 
     Returns:
-        dict: The decoded payload of the JWT.
+        dict: The decoded payload of the JWT. Must not be modified.
 
     Raises:
         HTTPException: If the token is invalid or has expired.
@@ -45,22 +112,28 @@ async def verify_token(token: str) -> dict:
                 detail="Invalid token",
             )
 
-        data = jwt.decode(token, generated_key, algorithms=["HS256"])
+        digest = hashlib.sha256(token.encode()).digest()
+        data = token_cache.get(digest)
+        if data is None:
+            data = jwt.decode(token, generated_key, algorithms=["HS256"])
         expire = data.get("expires")
 
-        if datetime.utcnow() > datetime.utcfromtimestamp(expire):
+        if expire is None or time.time() > expire:
+            token_cache.discard(digest)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token expired!",
             )
 
-        user_exist = USER_DB.get(data["user"])
+        user_exist = await get_user_db().fetch(data["user"])
         if not user_exist:
+            token_cache.discard(digest)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token",
             )
 
+        token_cache.put(digest, data)
         return data
 
     except JWTError:
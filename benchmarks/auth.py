@@ -0,0 +1,43 @@
+"""
+Authentication overhead benchmark.
+
+Measures the time `verify_token` takes per request when every call decodes
+and verifies the token (cache cleared before each call), and when a reused
+token is answered from the verified-token cache.
+
+Usage:
+    python -m benchmarks.auth --calls 100000
+"""
+import argparse
+import asyncio
+import time
+
+from app.database.db import USER_DB
+from app.security.jwt import create_token, token_cache, verify_token
+
+
+async def main(calls: int) -> None:
+    user = "bench@example.com"
+    USER_DB[user] = "hash"
+    token = create_token(user)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        token_cache.clear()
+        await verify_token(token)
+    uncached = (time.perf_counter() - start) / calls
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        await verify_token(token)
+    cached = (time.perf_counter() - start) / calls
+
+    print(f"uncached: {uncached * 1e6:.1f}us per request")
+    print(f"cached:   {cached * 1e6:.1f}us per request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
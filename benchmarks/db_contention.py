@@ -0,0 +1,146 @@
+"""
+Contention benchmark for the in-memory `Database`.
+
+Runs many concurrent tasks issuing a mix of reads and writes against a
+`Database` and reports p50/p99 latency per operation. The same load is run
+against `ThreadLockDatabase`, which takes a `threading.Lock` around every
+operation like the previous implementation did, over the same write path,
+for comparison.
+
+Usage:
+    python -m benchmarks.db_contention --tasks 200 --ops 500 --writes 0.1
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from app.database.base import Requirement
+from app.database.db import Database
+from app.models.products import Product, ProductIn
+
+
+class ThreadLockDatabase(Database):
+    """
+    The previous `Database` locking, a `threading.Lock` around every
+    operation, over the same write path as `Database`: the ID sequence, the
+    indexes and the versions are maintained by the same helpers.
+    """
+
+    def __init__(self, model: Any) -> None:
+        super().__init__(model)
+        self.thread_lock = Lock()
+
+    async def get(self, index: int) -> Any:
+        with self.thread_lock:
+            return self.collection.get(index)
+
+    async def get_all(self) -> List[Any]:
+        with self.thread_lock:
+            return [self.collection[id] for id in self.ids]
+
+    async def delete(self, index: int, version: Optional[int] = None) -> Any:
+        with self.thread_lock:
+            return self._delete(index, version)[0]
+
+    async def save(
+        self, data: Any, requires: Optional[Requirement] = None, **fields: Any
+    ) -> Any:
+        with self.thread_lock:
+            return self._save(data, fields, requires)[0]
+
+    async def update(
+        self, id: int, data: Any, version: Optional[int] = None
+    ) -> Any:
+        with self.thread_lock:
+            return self._update(id, data, version)[0]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of the samples.
+    """
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(q) - 1]
+
+
+async def worker(
+    db: Database,
+    ops: int,
+    write_ratio: float,
+    size: int,
+    latencies: Dict[str, List[float]],
+) -> None:
+    product = ProductIn(name="Benchmark", category="bench", score="1")
+    for _ in range(ops):
+        roll = random.random()
+        start = time.perf_counter()
+        if roll < write_ratio / 2:
+            await db.save(product)
+            op = "save"
+        elif roll < write_ratio:
+            await db.update(random.randrange(size), product)
+            op = "update"
+        else:
+            await db.get(random.randrange(size))
+            op = "get"
+        latencies[op].append(time.perf_counter() - start)
+        # Let the other tasks interleave, as concurrent requests would.
+        await asyncio.sleep(0)
+
+
+async def run(
+    db: Database, tasks: int, ops: int, write_ratio: float, size: int
+) -> Dict[str, Dict[str, float]]:
+    product = ProductIn(name="Benchmark", category="bench", score="1")
+    for _ in range(size):
+        await db.save(product)
+    latencies: Dict[str, List[float]] = {"get": [], "save": [], "update": []}
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(worker(db, ops, write_ratio, size, latencies) for _ in range(tasks))
+    )
+    elapsed = time.perf_counter() - start
+    report = {
+        op: {
+            "count": len(samples),
+            "p50_us": percentile(samples, 50) * 1e6,
+            "p99_us": percentile(samples, 99) * 1e6,
+        }
+        for op, samples in latencies.items()
+    }
+    report["total"] = {
+        "ops_per_s": tasks * ops / elapsed,
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--writes", type=float, default=0.1)
+    parser.add_argument("--size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    for name, db in (
+        ("threading.Lock", ThreadLockDatabase(Product)),
+        ("asyncio", Database(Product)),
+    ):
+        report = asyncio.run(
+            run(db, args.tasks, args.ops, args.writes, args.size)
+        )
+        print(f"{name}: {report.pop('total')['ops_per_s']:.0f} ops/s")
+        for op, stats in report.items():
+            print(
+                f"  {op:<6} n={stats['count']:<7} "
+                f"p50={stats['p50_us']:.1f}us p99={stats['p99_us']:.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Write and recovery benchmark for the journaled `Database`.
+
+Saves `--records` products from `--tasks` concurrent tasks into a journaled
+database and reports the write throughput. Then measures the recovery time
+from the write-ahead log alone, the snapshot time, and the recovery time
+from the snapshot, each up to the first read, and the time the indexes
+take to build on their first use.
+
+Usage:
+    python -m benchmarks.journal --records 1000000 --fsync always
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from app.database.db import Database
+from app.database.journal import FSYNC_POLICIES, Journal
+from app.models.products import Product, ProductIn
+
+
+def open_db(directory: str, fsync: str) -> Database:
+    products_db = Database(
+        Product, hash_indexes=("category",), sorted_indexes=("name",)
+    )
+    products_db.load(Journal(directory, "products", fsync=fsync))
+    return products_db
+
+
+async def write(directory: str, records: int, tasks: int, fsync: str) -> None:
+    products_db = open_db(directory, fsync)
+    products = [
+        ProductIn(name=f"Product {i}", category=f"category {i % 100}", score=i)
+        for i in range(records)
+    ]
+
+    async def worker(offset: int) -> None:
+        for product in products[offset::tasks]:
+            await products_db.save(product)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(tasks)))
+    await products_db.journal.close()
+    elapsed = time.perf_counter() - start
+    print(f"write:    {elapsed:.2f}s, {records / elapsed:.0f} records/s")
+
+
+async def recover(directory: str, label: str) -> Database:
+    start = time.perf_counter()
+    products_db = open_db(directory, "never")
+    await products_db.get(len(products_db.ids) // 2)
+    elapsed = time.perf_counter() - start
+    print(f"recover:  {elapsed:.3f}s from {label}, to the first read")
+    start = time.perf_counter()
+    products_db.ensure_indexes()
+    elapsed = time.perf_counter() - start
+    print(f"indexes:  {elapsed:.2f}s to build on first use")
+    return products_db
+
+
+async def main(records: int, tasks: int, fsync: str) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        await write(directory, records, tasks, fsync)
+        products_db = await recover(directory, "the write-ahead log")
+
+        start = time.perf_counter()
+        await products_db.checkpoint()
+        await products_db.journal.close()
+        elapsed = time.perf_counter() - start
+        print(f"snapshot: {elapsed:.2f}s")
+
+        await recover(directory, "the snapshot")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="always")
+    args = parser.parse_args()
+    asyncio.run(main(args.records, args.tasks, args.fsync))
@@ -0,0 +1,267 @@
+"""
+API load benchmark.
+
+Seeds the product database at each of the given sizes and drives the ASGI
+application in-process with concurrent clients, for each request mix:
+
+- read: product pages, product details, reviews and search;
+- write: product and review creation, and product deletion;
+- login: sign-ins, which each run bcrypt on the hashing pool.
+
+Prints the throughput and the p50/p95/p99 latency of every endpoint, and
+writes the results as JSON so that runs on different commits can be
+compared.
+
+Usage:
+    python -m benchmarks.load --products 1000,100000 --clients 16
+        --duration 10 --mixes read,write,login --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from httpx import AsyncClient
+
+from app.database.db import PRODUCT_DB, REVIEW_DB, USER_DB, reset_dbs
+from app.main import app
+from app.models.products import ProductIn
+from app.models.reviews import ReviewIn
+from app.security.hash import hash_password
+from app.security.jwt import create_token
+
+USER = "bench@example.com"
+PASSWORD = "bench-password"
+WORDS = ["phone", "laptop", "camera", "tablet", "watch", "speaker"]
+
+# The operations of each mix with their weights. An operation is the name
+# the latencies are reported under, its HTTP method and a path template.
+MIXES: Dict[str, List[Tuple[float, str, str, str]]] = {
+    "read": [
+        (40, "list", "GET", "/products?limit=100&after={after}"),
+        (30, "detail", "GET", "/products/{id}"),
+        (15, "reviews", "GET", "/products/{id}/reviews"),
+        (10, "search", "GET", "/search?q={word}"),
+        (5, "top", "GET", "/products?sort=-score&limit=20"),
+    ],
+    "write": [
+        (50, "create", "POST", "/products"),
+        (30, "review", "POST", "/products/{id}/reviews"),
+        (10, "detail", "GET", "/products/{id}"),
+        (10, "delete", "DELETE", "/products/{id}"),
+    ],
+    "login": [
+        (90, "signin", "POST", "/user/signin"),
+        (10, "detail", "GET", "/products/{id}"),
+    ],
+}
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    """
+    Returns a percentile of sorted latencies, by the nearest rank.
+    """
+    rank = max(0, min(len(latencies) - 1, round(fraction * len(latencies))))
+    return latencies[rank]
+
+
+async def seed(products: int) -> None:
+    """
+    Resets the databases and fills them with products, a review for every
+    tenth product, and the benchmark user.
+    """
+    reset_dbs()
+    rng = random.Random(0)
+    for start in range(0, products, 10_000):
+        stop = min(products, start + 10_000)
+        await PRODUCT_DB.save_many(
+            [
+                ProductIn(
+                    name=f"{rng.choice(WORDS)} {i}",
+                    category=rng.choice(WORDS),
+                    score=f"{rng.uniform(0, 100):.1f}",
+                )
+                for i in range(start, stop)
+            ]
+        )
+    for id in range(0, products, 10):
+        await REVIEW_DB.save(
+            ReviewIn(content=f"a fine {rng.choice(WORDS)}"),
+            product_id=id,
+            user=USER,
+        )
+    USER_DB[USER] = hash_password(PASSWORD)
+
+
+async def client_loop(
+    client: AsyncClient,
+    operations: List[Tuple[float, str, str, str]],
+    products: int,
+    deadline: float,
+    rng: random.Random,
+    latencies: Dict[str, List[float]],
+    statuses: Dict[str, Dict[int, int]],
+) -> None:
+    """
+    Sends requests of a mix one after the other until the deadline.
+    """
+    headers = {"Authorization": f"Bearer {create_token(USER)}"}
+    weights = [weight for weight, *_ in operations]
+    while time.perf_counter() < deadline:
+        _, name, method, path = rng.choices(operations, weights)[0]
+        id = rng.randrange(max(products, 1))
+        url = path.format(
+            id=id, after=id - 1, word=rng.choice(WORDS) + " fine"
+        )
+        kwargs: Dict[str, Any] = {"headers": headers}
+        if name == "create":
+            kwargs["json"] = {
+                "name": f"{rng.choice(WORDS)} new",
+                "category": rng.choice(WORDS),
+                "score": f"{rng.uniform(0, 100):.1f}",
+            }
+        elif name == "review":
+            kwargs["json"] = {"content": f"a new {rng.choice(WORDS)}"}
+        elif name == "signin":
+            kwargs = {"data": {"username": USER, "password": PASSWORD}}
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        latencies.setdefault(name, []).append(elapsed)
+        counts = statuses.setdefault(name, {})
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def run_mix(
+    mix: str, products: int, clients: int, duration: float
+) -> Dict[str, Any]:
+    """
+    Runs one mix against a freshly seeded database.
+
+    Returns:
+        Dict[str, Any]: The overall throughput, and the throughput, latency
+            percentiles in milliseconds and response status counts of
+            every operation.
+    """
+    await seed(products)
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, Dict[int, int]] = {}
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(
+            *(
+                client_loop(
+                    client,
+                    MIXES[mix],
+                    products,
+                    deadline,
+                    random.Random(seed_),
+                    latencies,
+                    statuses,
+                )
+                for seed_ in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    total = sum(map(len, latencies.values()))
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        endpoints[name] = {
+            "requests": len(values),
+            "statuses": dict(sorted(statuses[name].items())),
+            "throughput": len(values) / elapsed,
+            **{
+                f"p{int(fraction * 100)}_ms": percentile(values, fraction)
+                * 1e3
+                for fraction in (0.5, 0.95, 0.99)
+            },
+        }
+    return {
+        "mix": mix,
+        "products": products,
+        "clients": clients,
+        "duration": elapsed,
+        "requests": total,
+        "throughput": total / elapsed,
+        "endpoints": endpoints,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(
+    products: List[int],
+    clients: int,
+    duration: float,
+    mixes: List[str],
+    output: Optional[str],
+) -> None:
+    results = []
+    for size in products:
+        for mix in mixes:
+            result = await run_mix(mix, size, clients, duration)
+            results.append(result)
+            print(
+                f"{mix} mix, {size} products, {clients} clients: "
+                f"{result['throughput']:.1f} requests/s"
+            )
+            for name, stats in result["endpoints"].items():
+                print(
+                    f"  {name:8} {stats['throughput']:8.1f} requests/s  "
+                    f"p50 {stats['p50_ms']:7.2f}ms  "
+                    f"p95 {stats['p95_ms']:7.2f}ms  "
+                    f"p99 {stats['p99_ms']:7.2f}ms  "
+                    f"statuses {stats['statuses']}"
+                )
+    if output:
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--products",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1_000, 100_000],
+        help="comma separated database sizes",
+    )
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="seconds per run"
+    )
+    parser.add_argument(
+        "--mixes",
+        type=lambda value: value.split(","),
+        default=list(MIXES),
+        help="comma separated mixes: read, write, login",
+    )
+    parser.add_argument("--output", help="path of the JSON results")
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            args.products, args.clients, args.duration, args.mixes, args.output
+        )
+    )
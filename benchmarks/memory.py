@@ -0,0 +1,107 @@
+"""
+Record storage memory benchmark.
+
+Saves the same products and reviews to a database storing model instances,
+and to one in compact mode with its repeated strings interned, and
+measures with tracemalloc the memory taken per record, by the records alone
+and with the secondary indexes of the application.
+
+Usage:
+    python -m benchmarks.memory --products 20000 --reviews 20000
+"""
+import argparse
+import asyncio
+import gc
+import random
+import tracemalloc
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+from app.database.db import PRODUCT_INDEXES, REVIEW_INDEXES, Database
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+
+def make_products(count: int) -> List[ProductIn]:
+    rng = random.Random(0)
+    return [
+        ProductIn(
+            name=f"Product {i}",
+            category=f"category-{rng.randrange(50)}",
+            score=f"{rng.uniform(0, 5):.1f}",
+        )
+        for i in range(count)
+    ]
+
+
+def make_reviews(count: int, products: int) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    return [
+        {
+            "data": ReviewIn(content=f"Review {i}"),
+            "product_id": rng.randrange(products),
+            # Like emails read from access tokens, each is a new string.
+            "user": f"user{rng.randrange(1_000)}@example.com",
+        }
+        for i in range(count)
+    ]
+
+
+async def measure(
+    model: Any, options: Dict[str, Any], make: Callable[[], List[Any]]
+) -> float:
+    """
+    Returns the memory taken per item by a database holding the items.
+
+    The input items are built while tracing and dropped once saved, so the
+    strings the database keeps references to are counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    db = Database(model, **options)
+    items = make()
+    if model is Product:
+        await db.save_many(items)
+    else:
+        for item in items:
+            await db.save(item.pop("data"), **item)
+    del items
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(db.collection)
+
+
+async def main(products: int, reviews: int) -> None:
+    for name, model, indexes, interned, make in (
+        (
+            "products",
+            Product,
+            PRODUCT_INDEXES,
+            ("category", "score"),
+            partial(make_products, products),
+        ),
+        (
+            "reviews",
+            Review,
+            REVIEW_INDEXES,
+            ("user",),
+            partial(make_reviews, reviews, products),
+        ),
+    ):
+        compact = {"compact": True, "interned_fields": interned}
+        for label, extra in (("records", {}), ("indexed", indexes)):
+            default = await measure(model, extra, make)
+            small = await measure(model, {**compact, **extra}, make)
+            print(
+                f"{name} ({label}): {default:.0f} bytes per record, "
+                f"{small:.0f} bytes compact ({default / small:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--reviews", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.reviews))
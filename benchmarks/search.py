@@ -0,0 +1,68 @@
+"""
+Full-text search latency benchmark.
+
+Fills a `SearchIndex` with synthetic reviews whose words follow a Zipf
+distribution, then measures the latency of queries for rare, medium and
+common terms.
+
+Usage:
+    python -m benchmarks.search --reviews 1000000 --products 100000
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from app.database.search import SearchIndex
+
+VOCABULARY = 50_000
+WORDS_PER_REVIEW = 12
+
+
+def main(reviews: int, products: int, queries: int) -> None:
+    rng = random.Random(0)
+    words = [f"word{rank}" for rank in range(VOCABULARY)]
+    cum_weights = list(
+        itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY))
+    )
+    index = SearchIndex()
+    start = time.perf_counter()
+    for _ in range(reviews):
+        index.add(
+            rng.randrange(products),
+            rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_REVIEW),
+        )
+    elapsed = time.perf_counter() - start
+    print(f"indexed {reviews} reviews in {elapsed:.1f}s")
+
+    for label, ranks in [
+        ("rare", range(10_000, VOCABULARY)),
+        ("medium", range(100, 1_000)),
+        ("common", range(10)),
+        ("rare and common", None),
+    ]:
+        latencies = []
+        for _ in range(queries):
+            if ranks is None:
+                query = f"{words[rng.randrange(10_000, VOCABULARY)]} " + (
+                    words[rng.randrange(10)]
+                )
+            else:
+                query = " ".join(words[rng.choice(ranks)] for _ in range(2))
+            start = time.perf_counter()
+            index.search(query, 10)
+            latencies.append(time.perf_counter() - start)
+        cuts = statistics.quantiles(latencies, n=100)
+        print(
+            f"{label}: p50 {cuts[49] * 1e3:.2f}ms, p99 {cuts[98] * 1e3:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    main(args.reviews, args.products, args.queries)
@@ -0,0 +1,60 @@
+"""
+Product list serialization benchmark.
+
+Seeds the product database and measures the throughput of a product list
+served through `response_model` validation and `jsonable_encoder`, and
+through `RecordResponse`, which encodes the stored products with orjson.
+
+Usage:
+    python -m benchmarks.serialization --products 10000 --requests 50
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.api.responses import RecordResponse
+from app.database.db import PRODUCT_DB
+from app.models.products import Product, ProductIn
+
+app = FastAPI()
+
+
+@app.get("/validated", response_model=List[Product])
+async def validated() -> List[Product]:
+    return await PRODUCT_DB.get_all()
+
+
+@app.get("/encoded", response_model=List[Product])
+async def encoded() -> RecordResponse:
+    return RecordResponse(await PRODUCT_DB.get_all())
+
+
+async def main(products: int, requests: int) -> None:
+    for i in range(products):
+        product = ProductIn(name=f"Product {i}", category="bench", score="4")
+        await PRODUCT_DB.save(product)
+
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        for path in ("/validated", "/encoded"):
+            response = await client.get(path)
+            assert len(response.json()) == products
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.get(path)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{path}: {requests / elapsed:.1f} requests/s, "
+                f"{elapsed / requests * 1e3:.1f}ms per request"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.requests))
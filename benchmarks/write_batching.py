@@ -0,0 +1,108 @@
+"""
+Write batching benchmark.
+
+Posts bursts of concurrent reviews to the review databases of every
+backend, applying the writes one by one and then in batches, and reports
+the throughput and p50/p99 latency of the saves.
+
+Usage:
+    python -m benchmarks.write_batching --concurrency 1000 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from app.database.db import REVIEW_INDEXES, Database
+from app.database.journal import Journal
+from app.database.sqlite import SqliteDatabase
+from app.models.reviews import Review, ReviewIn
+from benchmarks.db_contention import percentile
+
+
+async def post_reviews(
+    db: Any, concurrency: int, rounds: int
+) -> Dict[str, float]:
+    review = ReviewIn(content="Does what it says on the tin.")
+    latencies: List[float] = []
+
+    async def post(index: int) -> None:
+        start = time.perf_counter()
+        await db.save(
+            review, product_id=index % 100, user=f"user{index}@example.com"
+        )
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(post(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "saves_per_s": concurrency * rounds / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+    }
+
+
+async def run(
+    name: str,
+    open_db: Callable[[str, Dict[str, Any]], Any],
+    args: argparse.Namespace,
+) -> None:
+    for batching in (
+        {},
+        {
+            "write_batch_size": args.batch_size,
+            "write_batch_interval": args.batch_interval,
+        },
+    ):
+        with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+            db = open_db(directory, batching)
+            report = await post_reviews(db, args.concurrency, args.rounds)
+            if isinstance(db, SqliteDatabase):
+                db.close()
+            elif db.journal is not None:
+                await db.journal.close()
+        mode = "batched" if batching else "one by one"
+        print(
+            f"{name:<8} {mode:<11} {report['saves_per_s']:>9.0f} saves/s "
+            f"p50={report['p50_ms']:.1f}ms p99={report['p99_ms']:.1f}ms"
+        )
+
+
+def memory(directory: str, options: Dict[str, Any]) -> Database:
+    return Database(Review, **REVIEW_INDEXES, **options)
+
+
+def journal(directory: str, options: Dict[str, Any]) -> Database:
+    db = Database(Review, **REVIEW_INDEXES, **options)
+    db.load(Journal(directory, "reviews", fsync="always"))
+    return db
+
+
+def sqlite(directory: str, options: Dict[str, Any]) -> SqliteDatabase:
+    path = os.path.join(directory, "bench.db")
+    return SqliteDatabase(path, "reviews", Review, **REVIEW_INDEXES, **options)
+
+
+async def main(args: argparse.Namespace) -> None:
+    for name, open_db in (
+        ("memory", memory),
+        ("journal", journal),
+        ("sqlite", sqlite),
+    ):
+        await run(name, open_db, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--batch-interval", type=float, default=0.002)
+    parser.add_argument(
+        "--directory", help="Where the databases are written (default: tmp)"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+import marshal
+import pstats
+from typing import Dict, List
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.models.products import ProductIn
+
+
+@pytest.mark.asyncio
+async def test_profile_request(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    good_user: Dict[str, str],
+    username: str,
+    headers: Dict[str, str],
+    auth_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path,
+) -> None:
+    response = await client.post(
+        "/user/signup", json=good_user, headers=headers
+    )
+    assert response.status_code == 200
+
+    # requests are only profiled when profiling is switched on
+    profile_headers = {**auth_headers, "X-Profile": "1"}
+    response = await client.post(
+        "/products", json=mock_products[0].dict(), headers=profile_headers
+    )
+    assert "server-timing" not in response.headers
+
+    monkeypatch.setattr(settings, "profiling", True)
+    monkeypatch.setattr(settings, "admin_users", [username])
+    response = await client.post(
+        "/products", json=mock_products[1].dict(), headers=profile_headers
+    )
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    for phase in ("jwt", "lock", "total"):
+        assert f"{phase};dur=" in timing
+    response = await client.get("/products", headers=headers)
+    assert "server-timing" not in response.headers
+
+    # admins can list and download the profiles
+    response = await client.get("/admin/profiles", headers=auth_headers)
+    assert response.status_code == 200
+    profile = response.json()[0]
+    assert profile["method"] == "POST"
+    assert profile["path"] == "/products"
+    assert set(profile["spans_ms"]) >= {"jwt", "lock"}
+    assert profile["cpu_profile"]
+
+    response = await client.get(
+        f"/admin/profiles/{profile['id']}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    path = tmp_path / "request.prof"
+    path.write_bytes(response.content)
+    assert marshal.loads(response.content)
+    assert pstats.Stats(str(path)).get_stats_profile().func_profiles
+
+    response = await client.get("/admin/profiles/0", headers=auth_headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_profiles_require_admin(
+    client: httpx.AsyncClient,
+    auth_headers: Dict[str, str],
+    headers: Dict[str, str],
+) -> None:
+    response = await client.get("/admin/profiles", headers=headers)
+    assert response.status_code == 401
+    response = await client.get("/admin/profiles", headers=auth_headers)
+    assert response.status_code == 403
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import pytest
+
+from app.database.db import PRODUCT_DB
+from app.main import app
+from app.models.products import ProductIn
+
+
+async def read_events(
+    query: str, events: int, headers: Optional[Dict[str, str]] = None
+) -> Tuple[int, List[Dict[str, str]]]:
+    """
+    Streams the product changes through the application until `events`
+    events arrived, then disconnects, since the test client waits for the
+    end of the response.
+    """
+    body = bytearray()
+    received = asyncio.Event()
+    status = 0
+
+    async def receive():
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        else:
+            body.extend(message.get("body", b""))
+            if body.count(b"\n\n") >= events or not message["more_body"]:
+                received.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("test", 80),
+        "client": ("test", 1234),
+        "root_path": "",
+        "path": "/products/changes",
+        "raw_path": b"/products/changes",
+        "query_string": query.encode(),
+        "headers": [
+            (name.lower().encode(), value.encode())
+            for name, value in (headers or {}).items()
+        ],
+    }
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    parsed = []
+    for event in bytes(body).decode().split("\n\n")[:events]:
+        fields = dict(line.split(": ", 1) for line in event.splitlines())
+        parsed.append(fields)
+    return status, parsed
+
+
+@pytest.mark.asyncio
+async def test_stream_changes(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    good_user: Dict[str, str],
+    headers: Dict[str, str],
+    auth_headers: Dict[str, str],
+) -> None:
+    response = await client.post(
+        "/user/signup", json=good_user, headers=headers
+    )
+    assert response.status_code == 200
+
+    assert PRODUCT_DB.changes is not None
+    version = PRODUCT_DB.changes.version
+    stream = asyncio.create_task(read_events(f"since={version}", 3))
+    await asyncio.sleep(0.01)
+    for product in mock_products:
+        response = await client.post(
+            "/products", json=product.dict(), headers=auth_headers
+        )
+        assert response.status_code == 200
+    response = await client.delete("/products/0", headers=auth_headers)
+    assert response.status_code == 200
+
+    status, events = await stream
+    assert status == 200
+    changes = [json.loads(event["data"]) for event in events]
+    assert [(change["op"], change["id"]) for change in changes] == [
+        ("put", 0),
+        ("put", 1),
+        ("delete", 0),
+    ]
+    assert [int(event["id"]) for event in events] == [
+        change["version"] for change in changes
+    ]
+
+    # reconnecting clients resume after the last event they received
+    _, events = await read_events(
+        "", 2, headers={"Last-Event-ID": events[0]["id"]}
+    )
+    assert [json.loads(event["data"])["id"] for event in events] == [1, 0]
+
+
+@pytest.mark.asyncio
+async def test_stream_changes_resync() -> None:
+    assert PRODUCT_DB.changes is not None
+    version = PRODUCT_DB.changes.version
+    status, events = await read_events(f"since={version + 100}", 1)
+    assert status == 200
+    assert events[0]["event"] == "resync"
+    assert json.loads(events[0]["data"]) == {"version": version}
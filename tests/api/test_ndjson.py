@@ -0,0 +1,33 @@
+from typing import AsyncIterator, List, Optional
+
+import pytest
+
+from app.api.ndjson import iter_lines
+
+
+async def _stream(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def _lines(*chunks: bytes, max_length: int = 8) -> List[Optional[bytes]]:
+    return [line async for line in iter_lines(_stream(*chunks), max_length)]
+
+
+@pytest.mark.asyncio
+async def test_lines_across_chunks():
+    assert await _lines(b"ab\ncd", b"e\n", b"\nf") == [
+        b"ab",
+        b"cde",
+        b"",
+        b"f",
+    ]
+    assert await _lines(b"ab\n") == [b"ab"]
+    assert await _lines() == []
+
+
+@pytest.mark.asyncio
+async def test_overlong_lines():
+    lines = await _lines(b"123456789", b"0\nok\n12345", b"6789\n", b"tail")
+    assert lines == [None, b"ok", None, b"tail"]
+    assert await _lines(b"ok\n123456789") == [b"ok", None]
@@ -1,8 +1,11 @@
-from typing import Dict, List
+import json
+from typing import Any, Dict, List
 
 import httpx
 import pytest
 
+from app.config import settings
+from app.database import db
 from app.models.products import ProductIn
 
 
@@ -61,7 +64,101 @@ async def test_get_all_products(
         assert response.json()[i]["name"] == product.name
         assert response.json()[i]["category"] == product.category
         assert response.json()[i]["score"] == product.score
-        assert response.json()[i]["reviews"] == []
+        assert "reviews" not in response.json()[i]
+
+
+@pytest.mark.asyncio
+async def test_export_products(
+    client: httpx.AsyncClient, mock_products: List[ProductIn]
+) -> None:
+    response = await client.get("/products/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == len(mock_products)
+    for i, (line, product) in enumerate(zip(lines, mock_products)):
+        assert json.loads(line) == {**product.dict(), "id": i}
+
+
+@pytest.mark.asyncio
+async def test_get_products_paginated(
+    client: httpx.AsyncClient, mock_products: List[ProductIn]
+) -> None:
+    response = await client.get("/products", params={"limit": 1})
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [0]
+    assert response.links["next"]["url"].endswith("limit=1&after=0")
+
+    response = await client.get(response.links["next"]["url"])
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [1]
+
+    response = await client.get("/products", params={"after": 1})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "link" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_products_fields(
+    client: httpx.AsyncClient, mock_products: List[ProductIn]
+) -> None:
+    response = await client.get("/products", params={"fields": "id,name"})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": i, "name": product.name}
+        for i, product in enumerate(mock_products)
+    ]
+
+    response = await client.get("/products", params={"fields": "id,price"})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Unknown fields: price"
+
+
+@pytest.mark.asyncio
+async def test_get_products_filtered(
+    client: httpx.AsyncClient, mock_products: List[ProductIn]
+) -> None:
+    response = await client.get("/products", params={"category": "smartphone"})
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [0, 1]
+
+    response = await client.get("/products", params={"name_prefix": "iPh"})
+    assert response.status_code == 200
+    assert [product["name"] for product in response.json()] == ["iPhone 14"]
+
+    response = await client.get(
+        "/products", params={"category": "laptop", "name_prefix": "iPh"}
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_get_products_by_score(client: httpx.AsyncClient) -> None:
+    # Scores are "90" and "75"
+    response = await client.get("/products", params={"sort": "-score"})
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [0, 1]
+    assert "link" not in response.headers
+    response = await client.get(
+        "/products", params={"sort": "score", "limit": 1}
+    )
+    assert [product["id"] for product in response.json()] == [1]
+
+    response = await client.get("/products", params={"min_score": 80})
+    assert [product["id"] for product in response.json()] == [0]
+    response = await client.get(
+        "/products", params={"max_score": 80, "sort": "-score"}
+    )
+    assert [product["id"] for product in response.json()] == [1]
+
+    response = await client.get(
+        "/products", params={"sort": "-score", "after": 0}
+    )
+    assert response.status_code == 422
+    response = await client.get("/products", params={"sort": "name"})
+    assert response.status_code == 422
 
 
 @pytest.mark.asyncio
@@ -76,7 +173,80 @@ async def test_get_single(
         assert response.json()["name"] == product.name
         assert response.json()["category"] == product.category
         assert response.json()["score"] == product.score
-        assert response.json()["reviews"] == []
+        assert "reviews" not in response.json()
+
+
+@pytest.mark.asyncio
+async def test_get_single_not_modified(client: httpx.AsyncClient) -> None:
+    response = await client.get("/products/0")
+    etag = response.headers["etag"]
+    response = await client.get("/products/0", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+    # Another product has another tag
+    response = await client.get("/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_update_product(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    product = mock_products[0].copy(update={"score": "1"})
+    response = await client.put(
+        "/products/0", json=product.dict(), headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["message"] == "Product updated successfully"
+    response = await client.get("/products/0")
+    assert response.json()["score"] == "1"
+    etag = response.headers["etag"]
+
+    # an update of the product as last read succeeds
+    product = mock_products[0]
+    conditional = {**auth_headers, "If-Match": etag}
+    response = await client.put(
+        "/products/0", json=product.dict(), headers=conditional
+    )
+    assert response.status_code == 200
+    assert (await client.get("/products/0")).json()["score"] == product.score
+
+    # then the tag is stale, and the product is left as is
+    response = await client.put(
+        "/products/0",
+        json={**product.dict(), "score": "2"},
+        headers=conditional,
+    )
+    assert response.status_code == 412
+    response = await client.delete("/products/0", headers=conditional)
+    assert response.status_code == 412
+    assert (await client.get("/products/0")).json()["score"] == product.score
+
+    # weak tags never match, any tag matches an existing product
+    response = await client.put(
+        "/products/0",
+        json=product.dict(),
+        headers={**auth_headers, "If-Match": f"W/{etag}"},
+    )
+    assert response.status_code == 412
+    response = await client.put(
+        "/products/0",
+        json=product.dict(),
+        headers={**auth_headers, "If-Match": "*"},
+    )
+    assert response.status_code == 200
+
+    url = f"/products/{len(mock_products) + 1}"
+    response = await client.put(url, json=product.dict(), headers=auth_headers)
+    assert response.status_code == 404
+    response = await client.put(
+        url, json=product.dict(), headers={**auth_headers, "If-Match": "*"}
+    )
+    assert response.status_code == 412
 
 
 @pytest.mark.asyncio
@@ -118,6 +288,138 @@ async def test_delete_wrong_product(
     assert response.json()["detail"] == "Product not found"
 
 
+@pytest.mark.asyncio
+async def test_delete_product_deleted_since(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    product_db = db.get_product_db()
+    product_id = (await product_db.save(mock_products[0])).id
+    get = product_db.get
+
+    # another request deletes the product after the route found it
+    async def get_deleted(index: int) -> Any:
+        product = await get(index)
+        await product_db.delete(index)
+        return product
+
+    monkeypatch.setattr(product_db, "get", get_deleted)
+    response = await client.delete(
+        f"/products/{product_id}", headers=auth_headers
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Product not found"
+
+
+@pytest.mark.asyncio
+async def test_batch(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    response = await client.post(
+        "/products:batch",
+        json=[product.dict() for product in mock_products],
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    ids = response.json()["ids"]
+    assert len(ids) == len(mock_products)
+    for id, product in zip(ids, mock_products):
+        response = await client.get(f"/products/{id}")
+        assert response.json()["name"] == product.name
+
+    response = await client.post(
+        f"/products/{ids[0]}/reviews",
+        json={"content": "Batch review"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    response = await client.request(
+        "DELETE",
+        "/products:batch",
+        json=[ids[0], ids[-1], ids[-1] + 100],
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["ids"] == [ids[0], ids[-1]]
+    response = await client.get(f"/products/{ids[0]}/reviews")
+    assert response.status_code == 404
+
+    response = await client.request(
+        "DELETE", "/products:batch", json=ids, headers=auth_headers
+    )
+    assert response.json()["ids"] == ids[1:-1]
+
+
+@pytest.mark.asyncio
+async def test_import_products(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    lines = [product.json().encode() for product in mock_products]
+    lines[1:1] = [b"", b"{not json", b'{"name": "No category"}']
+
+    async def body():
+        # Lines split across chunks
+        data = b"\n".join(lines)
+        for start in range(0, len(data), 7):
+            stop = start + 7
+            yield data[start:stop]
+
+    response = await client.post(
+        "/products/import", content=body(), headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["created"] == len(mock_products)
+    assert response.json()["failed"] == 2
+    errors = response.json()["errors"]
+    assert [error["line"] for error in errors] == [3, 4]
+    assert errors[1]["detail"][0]["loc"] == ["category"]
+
+    response = await client.get("/products/export")
+    imported = [json.loads(line) for line in response.text.splitlines()]
+    first = len(imported) - len(mock_products)
+    imported = imported[first:]
+    assert [product["name"] for product in imported] == [
+        product.name for product in mock_products
+    ]
+    response = await client.request(
+        "DELETE",
+        "/products:batch",
+        json=[product["id"] for product in imported],
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_batch_unauthenticated(client: httpx.AsyncClient) -> None:
+    response = await client.post("/products:batch", json=[])
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_batch_too_large(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "batch_max_size", 1)
+    response = await client.post(
+        "/products:batch",
+        json=[product.dict() for product in mock_products[:2]],
+        headers=auth_headers,
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Batch too large, at most 1 items"
+
+
 @pytest.mark.asyncio
 async def test_db_empty_again(client: httpx.AsyncClient) -> None:
     response = await client.get("/products")
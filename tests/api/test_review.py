@@ -3,7 +3,10 @@ from typing import Dict, List
 import httpx
 import pytest
 
-from app.models.products import ProductIn
+from app.api import review as review_api
+from app.database.base import Storage
+from app.database.db import REVIEW_DB
+from app.models.products import Product, ProductIn
 from app.models.reviews import ReviewIn
 
 
@@ -96,6 +99,102 @@ async def test_get_all_product_reviews(
         assert response.json()[i]["content"] == review.content
 
 
+@pytest.mark.asyncio
+async def test_get_product_review_summary(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    mock_reviews: List[ReviewIn],
+) -> None:
+    product_id = len(mock_products) - 1
+    response = await client.get(f"/products/{product_id}/reviews/summary")
+    assert response.status_code == 200
+    summary = {
+        "review_count": len(mock_reviews),
+        "reviewer_count": 1,
+        "latest_review_ids": list(reversed(range(len(mock_reviews)))),
+    }
+    assert response.json() == summary
+
+    response = await client.get(f"/products/{product_id}")
+    assert response.json()["review_summary"] == summary
+
+    response = await client.get("/products/0/reviews/summary")
+    assert response.json()["review_count"] == 0
+
+    response = await client.get(
+        f"/products/{len(mock_products)}/reviews/summary"
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_product_reviews_paginated(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    mock_reviews: List[ReviewIn],
+) -> None:
+    product_id = len(mock_products) - 1
+    url = f"/products/{str(product_id)}/reviews"
+    response = await client.get(url, params={"limit": 2})
+
+    assert response.status_code == 200
+    assert [review["id"] for review in response.json()] == [0, 1]
+    assert all(
+        review["product_id"] == product_id for review in response.json()
+    )
+
+    response = await client.get(response.links["next"]["url"])
+    assert response.status_code == 200
+    assert [review["id"] for review in response.json()] == [2]
+    assert "link" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_product_reviews_not_modified(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    url = f"/products/{str(len(mock_products)-1)}/reviews"
+    response = await client.get(url)
+    etag = response.headers["etag"]
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    # A new review changes the tag
+    response = await client.post(
+        url, json={"content": "Changed my mind"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_create_review_if_match(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    url = f"/products/{str(len(mock_products)-1)}"
+    etag = (await client.get(url)).headers["etag"]
+    review = {"content": "Still great"}
+    conditional = {**auth_headers, "If-Match": etag}
+    response = await client.post(
+        f"{url}/reviews", json=review, headers=conditional
+    )
+    assert response.status_code == 200
+
+    # the review changed the summary of the product, and so its tag
+    response = await client.post(
+        f"{url}/reviews", json=review, headers=conditional
+    )
+    assert response.status_code == 412
+    assert response.json()["detail"] == "Precondition failed"
+
+
 @pytest.mark.asyncio
 async def test_empty_product_reviews(
     client: httpx.AsyncClient,
@@ -108,6 +207,48 @@ async def test_empty_product_reviews(
     assert response.json() == []
 
 
+@pytest.mark.asyncio
+async def test_delete_product_deletes_reviews(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+) -> None:
+    product_id = len(mock_products) - 1
+    response = await client.delete(
+        f"/products/{str(product_id)}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert await REVIEW_DB.scan(equal={"product_id": product_id}) == []
+
+
+@pytest.mark.asyncio
+async def test_review_of_deleted_product(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    auth_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    get_product = review_api._get_product
+
+    # the product is deleted after the route found it, before the save
+    async def get_deleted_product(
+        product_id: int, product_db: Storage
+    ) -> Product:
+        product = await get_product(product_id, product_db)
+        await product_db.delete(product_id)
+        return product
+
+    monkeypatch.setattr(review_api, "_get_product", get_deleted_product)
+    product_id = len(mock_products) - 2
+    response = await client.post(
+        f"/products/{str(product_id)}/reviews",
+        json={"content": "Just in time"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 404
+    assert await REVIEW_DB.scan(equal={"product_id": product_id}) == []
+
+
 """
 @pytest.mark.skip
 @pytest.mark.asyncio
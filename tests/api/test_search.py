@@ -0,0 +1,48 @@
+from typing import Dict, List
+
+import httpx
+import pytest
+
+from app.models.products import ProductIn
+
+
+@pytest.mark.asyncio
+async def test_search(
+    client: httpx.AsyncClient,
+    mock_products: List[ProductIn],
+    good_user: Dict[str, str],
+    headers: Dict[str, str],
+    auth_headers: Dict[str, str],
+) -> None:
+    response = await client.post(
+        "/user/signup", json=good_user, headers=headers
+    )
+    assert response.status_code == 200
+    for product in mock_products:
+        response = await client.post(
+            "/products", json=product.dict(), headers=auth_headers
+        )
+        assert response.status_code == 200
+    response = await client.post(
+        "/products/0/reviews",
+        json={"content": "Repairable and fair"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/search", params={"q": "iphone"})
+    assert response.status_code == 200
+    assert [result["product"]["id"] for result in response.json()] == [1]
+
+    response = await client.get("/search", params={"q": "Repairable"})
+    assert response.json()[0]["product"]["name"] == "Fairphone 4"
+    assert response.json()[0]["score"] > 0
+
+    response = await client.get("/search", params={"q": "tablet"})
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_search_requires_query(client: httpx.AsyncClient) -> None:
+    response = await client.get("/search")
+    assert response.status_code == 422
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.database.batching import WriteBatcher
+from app.database.db import Database
+from app.database.journal import Journal
+from app.database.sqlite import SqliteDatabase
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+
+
+@pytest.mark.asyncio
+async def test_write_batcher():
+    batches = []
+
+    async def apply(writes):
+        batches.append([write.args[0] for write in writes])
+        return [
+            ValueError(index) if index < 0 else index * 10
+            for (index,) in (write.args for write in writes)
+        ]
+
+    # full batches are flushed at once, the rest after the interval
+    batcher = WriteBatcher(apply, 3, 0.01)
+    results = await asyncio.gather(
+        *(batcher.submit("delete", index) for index in (1, 2, -1, 3)),
+        return_exceptions=True,
+    )
+    assert batches == [[1, 2, -1], [3]]
+    assert results[:2] == [10, 20] and results[3] == 30
+    assert isinstance(results[2], ValueError)
+
+    # a failing batch fails every write of the batch
+    async def fail(writes):
+        raise RuntimeError("disk full")
+
+    batcher = WriteBatcher(fail, 10, 0.0)
+    results = await asyncio.gather(
+        *(batcher.submit("delete", index) for index in range(2)),
+        return_exceptions=True,
+    )
+    assert [type(result) for result in results] == [RuntimeError] * 2
+
+
+@pytest.mark.asyncio
+async def test_batched_database(tmp_path):
+    products = Database(
+        Product,
+        hash_indexes=("category",),
+        write_batch_size=100,
+        write_batch_interval=0.001,
+    )
+    products.load(Journal(str(tmp_path), "products"))
+    saved = await asyncio.gather(
+        *(products.save(product_a) for _ in range(5)),
+        products.update(0, product_b),
+        products.update(1, Product(**product_a.dict(), id=2)),
+        products.delete(4),
+        return_exceptions=True,
+    )
+    assert [product.id for product in saved[:5]] == [0, 1, 2, 3, 4]
+    assert saved[5] == Product(**product_b.dict(), id=0)
+    assert isinstance(saved[6], ValueError)
+    assert saved[7].id == 4
+    assert [product.id for product in await products.get_all()] == [0, 1, 2, 3]
+    page = await products.scan(equal={"category": "laptop"})
+    assert [product.id for product in page] == [0]
+    # the writes were applied in the order they were made
+    changes = [change.id for change in products.changes.changes]
+    assert changes == [0, 1, 2, 3, 4, 0, 4]
+    await products.journal.close()
+
+    # the journal recovers the batch like any other writes
+    recovered = Database(Product, hash_indexes=("category",))
+    recovered.load(Journal(str(tmp_path), "products"))
+    assert await recovered.get_all() == await products.get_all()
+    await recovered.journal.close()
+
+
+@pytest.mark.asyncio
+async def test_batched_sqlite(tmp_path):
+    reviews = SqliteDatabase(
+        str(tmp_path / "test.db"),
+        "reviews",
+        Review,
+        hash_indexes=("product_id",),
+        write_batch_size=100,
+    )
+    review = ReviewIn(content="Great")
+    saved = await asyncio.gather(
+        reviews.save(review, product_id=1, user="a@example.com"),
+        reviews.save(review, product_id=1, user="not an email"),
+        reviews.save(review, product_id=2, user="b@example.com"),
+        reviews.delete(0),
+        reviews.update(
+            1,
+            Review(**review.dict(), id=1, product_id=2, user="c@example.com"),
+        ),
+        return_exceptions=True,
+    )
+    # the invalid review is rejected without using up an ID
+    assert isinstance(saved[1], ValueError)
+    assert [saved[0].id, saved[2].id] == [0, 1]
+    assert saved[3] == saved[0]
+    assert saved[4].user == "c@example.com"
+    assert await reviews.get_all() == [saved[4]]
+    new_review = await reviews.save(review, product_id=3, user="d@ex.com")
+    assert new_review.id == 2
+    reviews.close()
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from app.database.changes import Change, ChangeFeed
+from app.database.db import Database
+from app.models.products import Product, ProductIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+
+
+def test_change_feed():
+    feed = ChangeFeed(3)
+    assert feed.since(0) == []
+    feed.append("put", 0, 1)
+    feed.append("put", 1, 2)
+    feed.append("delete", 0, 3)
+    assert feed.since(1) == [Change("put", 1, 2), Change("delete", 0, 3)]
+    assert feed.since(3) == []
+
+    # consumers behind the oldest change kept must resync
+    feed.append("put", 2, 4)
+    assert feed.since(0) is None
+    assert [change.version for change in feed.since(1)] == [2, 3, 4]
+    # as well as consumers ahead of the feed
+    assert feed.since(5) is None
+
+    feed.restart(10)
+    assert feed.since(4) is None
+    assert feed.since(10) == []
+
+
+@pytest.mark.asyncio
+async def test_wait():
+    feed = ChangeFeed(10)
+    assert not await feed.wait(0.01)
+    waiters = [asyncio.create_task(feed.wait(1)) for _ in range(3)]
+    await asyncio.sleep(0)
+    feed.append("put", 0, 1)
+    assert await asyncio.gather(*waiters) == [True, True, True]
+
+
+@pytest.mark.asyncio
+async def test_database_changes():
+    products_db = Database(Product)
+    await products_db.save(product_a)
+    await products_db.save_many([product_b, product_a])
+    await products_db.update(0, product_b)
+    await products_db.delete(1)
+    products_db.reset()
+    versions = [change.version for change in products_db.changes.changes]
+    # the products of a batch share a version
+    assert versions[1] == versions[2]
+    assert versions == sorted(versions)
+    assert [change[:2] for change in products_db.changes.since(0)] == [
+        ("put", 0),
+        ("put", 1),
+        ("put", 2),
+        ("put", 0),
+        ("delete", 1),
+        ("reset", None),
+    ]
+    assert products_db.changes.version == products_db.version
@@ -1,7 +1,12 @@
+import asyncio
+import json
+
 import pytest
 
 from app.database import db
+from app.database.base import Requirement, VersionConflict
 from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
 
 product_a = ProductIn(
     name="Test Product",
@@ -55,7 +60,19 @@ async def test_get_all():
         assert product.name == products[product.id].name
         assert product.category == products[product.id].category
         assert product.score == products[product.id].score
-        assert product.reviews == products[product.id].reviews
+
+
+@pytest.mark.asyncio
+async def test_scan():
+    # scan pages in ID order
+    page = await db.PRODUCT_DB.scan(limit=1)
+    assert [product.id for product in page] == [0]
+    page = await db.PRODUCT_DB.scan(after=0, limit=1)
+    assert [product.id for product in page] == [1]
+    page = await db.PRODUCT_DB.scan(after=1)
+    assert page == []
+    page = await db.PRODUCT_DB.scan()
+    assert [product.id for product in page] == [0, 1]
 
 
 @pytest.mark.asyncio
@@ -67,7 +84,6 @@ async def test_update():
             name="Updated Product",
             category="Updated Category",
             score=19,
-            reviews=[],
         ),
     )
     assert isinstance(updated_product, Product)
@@ -75,7 +91,6 @@ async def test_update():
     assert updated_product.name == "Updated Product"
     assert updated_product.category == "Updated Category"
     assert updated_product.score == "19"
-    assert updated_product.reviews == []
 
     # update product with invalid ID
     with pytest.raises(ValueError) as exc_info:
@@ -86,12 +101,66 @@ async def test_update():
                 name="Updated Product",
                 category="Updated Category",
                 score=19,
-                reviews=[],
             ),
         )
     assert str(exc_info.value) == "ID in data does not match key ID"
 
 
+@pytest.mark.asyncio
+async def test_get_encoded():
+    # the encoding is cached until the item is written again
+    product = (await db.PRODUCT_DB.get_all())[0]
+    encoded = await db.PRODUCT_DB.get_encoded(product.id)
+    assert json.loads(encoded.body) == product.dict()
+    assert await db.PRODUCT_DB.get_encoded(product.id) is encoded
+    version = db.PRODUCT_DB.version
+    updated = await db.PRODUCT_DB.update(
+        product.id, product.copy(update={"score": "1"})
+    )
+    assert db.PRODUCT_DB.version > version
+    encoded_again = await db.PRODUCT_DB.get_encoded(product.id)
+    assert encoded_again.etag != encoded.etag
+    assert json.loads(encoded_again.body) == updated.dict()
+    assert json.loads(db.PRODUCT_DB.encode_all([product, updated])) == [
+        product.dict(),
+        updated.dict(),
+    ]
+    assert await db.PRODUCT_DB.get_encoded(-1) is None
+
+
+def test_record_versions():
+    versions = db.RecordVersions()
+    assert versions.get(3) == 0
+    versions.set(3, 7)
+    versions.set(1, 9)
+    assert [versions.get(index) for index in range(5)] == [0, 9, 0, 7, 0]
+    versions.discard(3)
+    versions.discard(10)
+    assert versions.get(3) == 0 and versions.get(-1) == 0
+    versions.clear()
+    assert versions.get(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_encoded_cache_size():
+    products_db = db.Database(Product, encoded_cache_size=2)
+    await products_db.save_many([product_a, product_b, product_a])
+    first = await products_db.get_encoded(0)
+    await products_db.get_encoded(1)
+    # reading an item makes it the most recently used
+    assert await products_db.get_encoded(0) is first
+    await products_db.get_encoded(2)
+    assert len(products_db.encoded) == 2
+    assert products_db.encoded.get(1) is None
+    assert await products_db.get_encoded(0) is first
+    # an evicted item is encoded again, with its version
+    encoded = await products_db.get_encoded(1)
+    assert encoded is not None and encoded.version == products_db.versions.get(
+        1
+    )
+    assert products_db.encoded.get(2) is None
+
+
 @pytest.mark.asyncio
 async def test_delete():
     # delete products
@@ -103,8 +172,192 @@ async def test_delete():
         assert deleted_product.name == product.name
         assert deleted_product.category == product.category
         assert deleted_product.score == product.score
-        assert deleted_product.reviews == product.reviews
 
     # delete product with invalid ID
     deleted_product = await db.PRODUCT_DB.delete(0)
     assert deleted_product is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_save():
+    # concurrent saves get unique, consecutive IDs
+    saved = await asyncio.gather(
+        *(db.PRODUCT_DB.save(product_a) for _ in range(50))
+    )
+    ids = sorted(product.id for product in saved)
+    assert ids == list(range(ids[0], ids[0] + 50))
+    assert len(await db.PRODUCT_DB.get_all()) == 50
+
+
+@pytest.mark.asyncio
+async def test_save_with_fields():
+    # extra fields are set on the saved item
+    review = await db.REVIEW_DB.save(
+        ReviewIn(content="Great"), product_id=3, user="a@b.com"
+    )
+    assert isinstance(review, Review)
+    assert review.product_id == 3
+    assert review.user == "a@b.com"
+    page = await db.REVIEW_DB.scan(equal={"product_id": 3})
+    assert page == [review]
+
+
+@pytest.mark.asyncio
+async def test_save_many_and_delete_many():
+    # batches get consecutive IDs in order
+    first = (await db.PRODUCT_DB.save(product_a)).id
+    saved = await db.PRODUCT_DB.save_many([product_a, product_b])
+    assert [product.id for product in saved] == [first + 1, first + 2]
+    assert saved[1].name == product_b.name
+    assert await db.PRODUCT_DB.get(first + 2) == saved[1]
+
+    # missing IDs are skipped
+    deleted = await db.PRODUCT_DB.delete_many([first + 2, -1, first])
+    assert [product.id for product in deleted] == [first + 2, first]
+    assert await db.PRODUCT_DB.get(first) is None
+    assert await db.PRODUCT_DB.get(first + 1) == saved[0]
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks():
+    # the iteration sees the collection as it was when it started
+    all_ids = [product.id for product in await db.PRODUCT_DB.get_all()]
+    chunks = db.PRODUCT_DB.iter_chunks(2)
+    first = await chunks.__anext__()
+    await db.PRODUCT_DB.delete(all_ids[-1])
+    await db.PRODUCT_DB.save(product_a)
+    ids = [product.id for product in first]
+    async for chunk in chunks:
+        assert len(chunk) <= 2
+        ids.extend(product.id for product in chunk)
+    assert ids == all_ids
+
+
+@pytest.mark.asyncio
+async def test_summarize():
+    # summaries follow the writes of the group
+    reviews = [
+        await db.REVIEW_DB.save(
+            ReviewIn(content="Fine"), product_id=7, user=user
+        )
+        for user in ["a@b.com", "c@d.com", "a@b.com"]
+    ]
+    summary = await db.REVIEW_DB.summarize(
+        "product_id", 7, distinct="user", latest=2
+    )
+    assert summary == (3, 2, [reviews[2].id, reviews[1].id])
+
+    await db.REVIEW_DB.delete(reviews[1].id)
+    summary = await db.REVIEW_DB.summarize(
+        "product_id", 7, distinct="user", latest=2
+    )
+    assert summary == (2, 1, [reviews[2].id, reviews[0].id])
+
+    with pytest.raises(ValueError):
+        await db.REVIEW_DB.summarize("user", "a@b.com", "id", latest=1)
+
+
+@pytest.mark.asyncio
+async def test_compact_storage():
+    # compact databases store tuples and return model instances
+    products_db = db.Database(
+        Product,
+        compact=True,
+        interned_fields=("category",),
+        **db.PRODUCT_INDEXES,
+    )
+    saved = await products_db.save_many([product_a, product_b])
+    assert products_db.collection.rows[0] == (
+        product_a.name,
+        product_a.category,
+        product_a.score,
+        0,
+    )
+    assert await products_db.get(1) == saved[1]
+    assert await products_db.get_all() == saved
+
+    # equal strings of interned fields are shared
+    category = "".join(["Test ", "Category"])
+    other = await products_db.save(
+        product_a.copy(update={"category": category})
+    )
+    stored = await products_db.get(other.id)
+    assert stored.category is (await products_db.get(0)).category
+
+    # the encoding cache compares the stored values
+    encoded = await products_db.get_encoded(0)
+    assert await products_db.get_encoded(0) is encoded
+    updated = await products_db.update(0, saved[0].copy(update={"score": "1"}))
+    assert json.loads(products_db.encode_all([saved[0]])) == [saved[0].dict()]
+    assert (await products_db.get_encoded(0)).etag != encoded.etag
+
+    page = await products_db.scan_sorted("score", limit=1, descending=True)
+    assert page == [saved[1]]
+    chunks = [chunk async for chunk in products_db.iter_chunks(2)]
+    assert chunks == [[updated, saved[1]], [stored]]
+    assert await products_db.delete(1) == saved[1]
+    assert await products_db.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_conditional_writes():
+    products_db = db.Database(Product, **db.PRODUCT_INDEXES)
+    await products_db.save_many([product_a, product_b])
+    version = (await products_db.get_encoded(0)).version
+    assert (await products_db.get_encoded(1)).version == version
+
+    # an update of the version read succeeds and moves the version on
+    updated = await products_db.update(0, product_b, version=version)
+    assert updated == Product(**product_b.dict(), id=0)
+    new_version = (await products_db.get_encoded(0)).version
+    assert new_version > version
+
+    # writes of an older version fail, without writing anything
+    with pytest.raises(VersionConflict):
+        await products_db.update(0, product_a, version=version)
+    with pytest.raises(VersionConflict):
+        await products_db.delete(0, version=version)
+    assert await products_db.get(0) == updated
+
+    # of concurrent updates of the same version, only the first succeeds
+    results = await asyncio.gather(
+        *(products_db.update(1, product_a, version=version) for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert results[0] == Product(**product_a.dict(), id=1)
+    assert all(isinstance(r, VersionConflict) for r in results[1:])
+
+    assert await products_db.delete(0, version=new_version) == updated
+    assert await products_db.delete(0, version=new_version) is None
+    assert await products_db.update(0, product_a, version=0) is None
+
+
+@pytest.mark.asyncio
+async def test_save_requirement():
+    products_db = db.Database(Product, **db.PRODUCT_INDEXES)
+    reviews_db = db.Database(Review, **db.REVIEW_INDEXES)
+    product = await products_db.save(product_a)
+    version = (await products_db.get_encoded(product.id)).version
+    review = ReviewIn(content="Great")
+    requires = Requirement(products_db, product.id, version)
+    saved = await reviews_db.save(
+        review, requires=requires, product_id=product.id, user="a@ex.com"
+    )
+    assert saved.id == 0
+
+    # a product written since the version read fails the save
+    await products_db.update(product.id, product_b)
+    with pytest.raises(VersionConflict):
+        await reviews_db.save(
+            review, requires=requires, product_id=product.id, user="a@ex.com"
+        )
+    # and so does a deleted one, whatever the version
+    await products_db.delete(product.id)
+    with pytest.raises(VersionConflict):
+        await reviews_db.save(
+            review,
+            requires=Requirement(products_db, product.id),
+            product_id=product.id,
+            user="a@ex.com",
+        )
+    assert [review.id for review in await reviews_db.get_all()] == [0]
@@ -0,0 +1,123 @@
+import pytest
+
+from app.database.db import Database
+from app.database.indexes import NumericIndex, SortedIndex
+from app.models.products import Product, ProductIn
+
+
+@pytest.fixture
+def products_db() -> Database:
+    return Database(
+        Product, hash_indexes=("category",), sorted_indexes=("name",)
+    )
+
+
+async def _save(products_db: Database) -> None:
+    for name, category in [
+        ("Fairphone 4", "smartphone"),
+        ("iPhone 14", "smartphone"),
+        ("ThinkPad", "laptop"),
+        ("iPhone 15", "smartphone"),
+    ]:
+        await products_db.save(
+            ProductIn(name=name, category=category, score="1")
+        )
+
+
+@pytest.mark.asyncio
+async def test_equal(products_db: Database):
+    await _save(products_db)
+    page = await products_db.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0, 1, 3]
+    page = await products_db.scan(
+        equal={"category": "smartphone"}, after=0, limit=1
+    )
+    assert [product.id for product in page] == [1]
+    assert await products_db.scan(equal={"category": "tablet"}) == []
+
+
+@pytest.mark.asyncio
+async def test_prefix_and_between(products_db: Database):
+    await _save(products_db)
+    page = await products_db.scan(prefix={"name": "iPhone"})
+    assert [product.id for product in page] == [1, 3]
+    page = await products_db.scan(between={"name": ("G", "j")})
+    assert [product.id for product in page] == [1, 2, 3]
+    page = await products_db.scan(
+        equal={"category": "laptop"}, prefix={"name": "iPhone"}
+    )
+    assert page == []
+
+
+@pytest.mark.asyncio
+async def test_indexes_follow_mutations(products_db: Database):
+    await _save(products_db)
+    await products_db.update(
+        1, ProductIn(name="Pixel 8", category="phone", score="1")
+    )
+    await products_db.delete(3)
+    page = await products_db.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0]
+    page = await products_db.scan(prefix={"name": "iPhone"})
+    assert page == []
+    page = await products_db.scan(prefix={"name": "Pixel"})
+    assert [product.id for product in page] == [1]
+
+    products_db.reset()
+    assert await products_db.scan(equal={"category": "phone"}) == []
+
+
+@pytest.mark.asyncio
+async def test_unindexed_field(products_db: Database):
+    with pytest.raises(ValueError) as exc_info:
+        await products_db.scan(equal={"score": "1"})
+    assert str(exc_info.value) == "No hash index on field: score"
+
+
+def test_sorted_index_add_many():
+    # small batches are inserted, large ones merged, both keep the order
+    index = SortedIndex("name")
+    index.add_many((id, f"name {id % 7}") for id in range(3))
+    index.add_many((id, f"name {id % 7}") for id in range(3, 100))
+    assert index.entries == sorted((f"name {id % 7}", id) for id in range(100))
+
+
+def test_sorted_index_ids():
+    # the IDs of a range are sorted once, until the index changes
+    index = SortedIndex("name")
+    index.add_many((id, f"name {id % 7}") for id in range(100))
+    ids = index.ids("name 2", "name 3")
+    assert ids == [id for id in range(100) if id % 7 in (2, 3)]
+    assert index.ids("name 2", "name 3") is ids
+    index.add(100, "name 2")
+    assert index.ids("name 2", "name 3") == [*ids, 100]
+    # the cached ranges hold no more IDs than the index
+    for low in range(7):
+        index.ids(f"name {low}", "name 6")
+    assert index.cached <= len(index.entries)
+
+
+@pytest.mark.asyncio
+async def test_numeric_index():
+    # scores are ordered as numbers, non-numbers are left out
+    products_db = Database(Product, numeric_indexes=("score",))
+    for score in ["9", "10", "n/a", "8.5", "10"]:
+        await products_db.save(
+            ProductIn(name="Phone", category="phone", score=score)
+        )
+    page = await products_db.scan_sorted("score", 10, descending=True)
+    assert [product.id for product in page] == [4, 1, 0, 3]
+    page = await products_db.scan_sorted(
+        "score", 2, between={"score": (8.5, 9.5)}
+    )
+    assert [product.id for product in page] == [3, 0]
+    page = await products_db.scan(between={"score": (9, float("inf"))})
+    assert [product.id for product in page] == [0, 1, 4]
+
+    await products_db.delete(2)
+    await products_db.update(
+        1, ProductIn(name="Phone", category="phone", score="1")
+    )
+    index = products_db.sorted_indexes["score"]
+    assert isinstance(index, NumericIndex)
+    assert index.entries == [(1.0, 1), (8.5, 3), (9.0, 0), (10.0, 4)]
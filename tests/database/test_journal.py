@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from app.database.db import Database, JournaledDict
+from app.database.journal import Journal
+from app.models.products import Product, ProductIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+
+
+def _open(directory: str) -> Database:
+    products_db = Database(
+        Product, hash_indexes=("category",), sorted_indexes=("name",)
+    )
+    products_db.load(Journal(directory, "products"))
+    return products_db
+
+
+@pytest.mark.asyncio
+async def test_recover_from_log(tmp_path):
+    products_db = _open(str(tmp_path))
+    await products_db.save(product_a)
+    await products_db.save(product_b)
+    await products_db.save(product_a)
+    await products_db.update(1, product_a)
+    await products_db.delete(0)
+    await products_db.journal.close()
+
+    recovered = _open(str(tmp_path))
+    assert recovered.collection == products_db.collection
+    assert recovered.index == 3
+    page = await recovered.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [1, 2]
+    new_product = await recovered.save(product_b)
+    assert new_product.id == 3
+    await recovered.journal.close()
+
+
+@pytest.mark.asyncio
+async def test_recover_from_snapshot_and_log(tmp_path):
+    products_db = _open(str(tmp_path))
+    for _ in range(10):
+        await products_db.save(product_a)
+    await products_db.checkpoint()
+    await products_db.delete(4)
+    await products_db.save(product_b)
+    await products_db.journal.close()
+    segments = [name for name in os.listdir(tmp_path) if name.endswith("wal")]
+    assert segments == ["products.00000000000000000011.wal"]
+
+    recovered = _open(str(tmp_path))
+    assert recovered.collection == products_db.collection
+    assert recovered.ids == [0, 1, 2, 3, 5, 6, 7, 8, 9, 10]
+    await recovered.journal.close()
+
+
+@pytest.mark.asyncio
+async def test_recover_torn_tail(tmp_path):
+    products_db = _open(str(tmp_path))
+    await products_db.save(product_a)
+    await products_db.save(product_b)
+    await products_db.journal.close()
+    (path,) = [tmp_path / name for name in os.listdir(tmp_path)]
+    size = path.stat().st_size
+    with open(path, "r+b") as file:
+        file.truncate(size - 3)
+
+    recovered = _open(str(tmp_path))
+    assert list(recovered.collection) == [0]
+    assert path.stat().st_size < size - 3
+    await recovered.journal.close()
+
+
+@pytest.mark.asyncio
+async def test_journaled_dict(tmp_path):
+    users = JournaledDict()
+    users.load(Journal(str(tmp_path), "users"))
+    users["a@b.com"] = "hash-a"
+    users["c@d.com"] = "hash-c"
+    await users.checkpoint()
+    users.pop("a@b.com")
+    users["e@f.com"] = "hash-e"
+    # put returns once the write is committed
+    await users.put("g@h.com", "hash-g")
+    assert not users.journal.pending
+    await users.journal.close()
+
+    recovered = JournaledDict()
+    recovered.load(Journal(str(tmp_path), "users"))
+    assert recovered == {
+        "c@d.com": "hash-c",
+        "e@f.com": "hash-e",
+        "g@h.com": "hash-g",
+    }
+    await recovered.journal.close()
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        Journal(str(tmp_path), "products", fsync="sometimes")
+
+
+@pytest.mark.asyncio
+async def test_recover_compact(tmp_path):
+    products_db = Database(Product, compact=True, hash_indexes=("category",))
+    products_db.load(Journal(str(tmp_path), "products"))
+    await products_db.save(product_a)
+    await products_db.checkpoint()
+    await products_db.save(product_b)
+    await products_db.journal.close()
+
+    recovered = Database(Product, compact=True, hash_indexes=("category",))
+    recovered.load(Journal(str(tmp_path), "products"))
+    assert recovered.collection.rows == products_db.collection.rows
+    page = await recovered.scan(equal={"category": "laptop"})
+    assert [product.name for product in page] == ["ThinkPad"]
+    await recovered.journal.close()
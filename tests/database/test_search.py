@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from app.database.db import Database
+from app.database.search import SearchIndex, TextIndex, tokenize
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+
+def test_tokenize():
+    assert tokenize("Fairphone 4, the FAIR phone!") == [
+        "fairphone",
+        "4",
+        "the",
+        "fair",
+        "phone",
+    ]
+
+
+def test_search_index():
+    index = SearchIndex()
+    index.add(1, tokenize("red phone"))
+    index.add(2, tokenize("red red laptop"))
+    index.add(3, tokenize("blue phone case"))
+    assert [id for id, _ in index.search("red", 10)] == [2, 1]
+    assert [id for id, _ in index.search("phone red", 1)] == [1]
+    assert index.search("green", 10) == []
+
+    index.remove(2, tokenize("red red laptop"))
+    assert [id for id, _ in index.search("red", 10)] == [1]
+    assert "laptop" not in index.postings
+    assert 2 not in index.lengths
+
+
+def test_search_pruning_keeps_ranking():
+    # skipping the tails of common terms does not change the top results
+    rng = random.Random(0)
+    words = ["common", "usual", *(f"rare{i}" for i in range(50))]
+    index = SearchIndex()
+    for document in range(300):
+        terms = ["common"] * rng.randrange(1, 4) + rng.choices(words, k=5)
+        index.add(document, terms)
+    query = "rare7 common usual"
+    everything = dict(index.search(query, 300))
+    best = sorted(everything.items(), key=lambda item: -item[1])[:3]
+    assert [score for _, score in index.search(query, 3)] == pytest.approx(
+        [score for _, score in best]
+    )
+
+
+@pytest.mark.asyncio
+async def test_databases_feed_search_index():
+    search_index = SearchIndex()
+    products_db = Database(
+        Product, text_indexes=(TextIndex("name", search_index),)
+    )
+    reviews_db = Database(
+        Review,
+        text_indexes=(
+            TextIndex("content", search_index, document="product_id"),
+        ),
+    )
+    phone = await products_db.save(
+        ProductIn(name="Fairphone 4", category="smartphone", score="1")
+    )
+    laptop = await products_db.save(
+        ProductIn(name="ThinkPad", category="laptop", score="1")
+    )
+    review = await reviews_db.save(
+        ReviewIn(content="Great keyboard"),
+        product_id=laptop.id,
+        user="a@b.com",
+    )
+    assert search_index.search("keyboard", 10)[0][0] == laptop.id
+
+    await products_db.update(
+        phone.id, ProductIn(name="Pixel 8", category="phone", score="1")
+    )
+    assert search_index.search("fairphone", 10) == []
+    assert search_index.search("pixel", 10)[0][0] == phone.id
+
+    await reviews_db.delete(review.id)
+    assert search_index.search("keyboard", 10) == []
+    reviews_db.reset()
+    products_db.reset()
+    assert search_index.postings == {}
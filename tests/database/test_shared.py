@@ -0,0 +1,275 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.database import db, shared
+from app.database.base import Requirement, VersionConflict
+from app.database.db import Database, JournaledDict
+from app.database.search import SearchIndex, TextIndex
+from app.database.shared import SharedDatabase, SharedDict, WriterClient
+from app.database.writer import Writer
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+INDEXES = {
+    "hash_indexes": ("category",),
+    "sorted_indexes": ("name",),
+    "numeric_indexes": ("score",),
+}
+
+
+@pytest.fixture
+def writer(tmp_path):
+    # The writer runs its own event loop in a thread, like the separate
+    # process it is in production, since the synchronous requests of the
+    # replicas block the loop of the test.
+    writer = Writer(
+        str(tmp_path),
+        {
+            "products": (Database(Product, **INDEXES), ProductIn),
+            "reviews": (Database(Review), ReviewIn),
+        },
+        JournaledDict(),
+    )
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        writer.serve(str(tmp_path / "writer.sock"))
+    )
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield writer
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    writer.close()
+    loop.close()
+
+
+def replica(directory, **options):
+    return SharedDatabase(
+        "products",
+        Product,
+        ProductIn,
+        WriterClient(os.path.join(directory, "writer.sock")),
+        directory,
+        **options,
+    )
+
+
+@pytest.mark.asyncio
+async def test_replicas(writer: Writer):
+    search_index = SearchIndex()
+    first = replica(writer.directory, **INDEXES)
+    second = replica(
+        writer.directory,
+        text_indexes=(TextIndex("name", search_index),),
+        **INDEXES,
+    )
+
+    # writes are read back at once by the replica sending them
+    new_product = await first.save(product_a)
+    assert new_product == Product(**product_a.dict(), id=0)
+    assert await first.get(0) == new_product
+    await first.save_many([product_b, product_a])
+
+    # and seen by the other replicas on their next read
+    assert await second.get(0) == new_product
+    assert [product.id for product in await second.get_all()] == [0, 1, 2]
+    page = await second.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0, 2]
+    page = await second.scan_sorted("score", 10)
+    assert [product.id for product in page] == [1, 0, 2]
+    assert [id for id, _ in search_index.search("thinkpad", 10)] == [1]
+    encoded = await second.get_encoded(1)
+    assert encoded.body == b'{"name":"ThinkPad","category":"laptop",' + (
+        b'"score":"80","id":1}'
+    )
+    assert first.etag() == second.etag()
+
+    await second.update(1, ProductIn(name="X1", category="laptop", score="1"))
+    assert (await first.get(1)).name == "X1"
+    assert await second.scan(prefix={"name": "Think"}) == []
+    assert (await first.delete(0)).id == 0
+    assert [product.id for product in await second.delete_many([1, 5])] == [1]
+    assert [product.id for product in await first.get_all()] == [2]
+    assert await second.get(0) is None
+
+    second.reset()
+    assert await first.get_all() == []
+    assert first.etag() == second.etag()
+    first.close()
+    second.close()
+
+
+def reviews_replica(directory, **options):
+    return SharedDatabase(
+        "reviews",
+        Review,
+        ReviewIn,
+        WriterClient(os.path.join(directory, "writer.sock")),
+        directory,
+        **options,
+    )
+
+
+@pytest.mark.asyncio
+async def test_search_without_read(writer: Writer, monkeypatch):
+    # the replicas of a worker searching, before the other workers write
+    search_index = SearchIndex()
+    products = replica(
+        writer.directory, text_indexes=(TextIndex("name", search_index),)
+    )
+    reviews = reviews_replica(
+        writer.directory,
+        text_indexes=(
+            TextIndex("content", search_index, document="product_id"),
+        ),
+    )
+    monkeypatch.setattr(db.settings, "storage", "shared")
+    monkeypatch.setattr(db, "PRODUCT_DB", products)
+    monkeypatch.setattr(db, "REVIEW_DB", reviews)
+    monkeypatch.setattr(db, "SEARCH_INDEX", search_index)
+
+    other_products = replica(writer.directory)
+    other_reviews = reviews_replica(writer.directory)
+    await other_products.save_many([product_a, product_b])
+    await other_reviews.save(
+        ReviewIn(content="Great battery"), product_id=1, user="a@ex.com"
+    )
+
+    # the search reads the change logs, with no read of the collections
+    index = db.get_search_index()
+    assert index is not None
+    assert [id for id, _ in index.search("fairphone", 10)] == [0]
+    assert [id for id, _ in index.search("battery", 10)] == [1]
+    for database in (products, reviews, other_products, other_reviews):
+        database.close()
+
+
+@pytest.mark.asyncio
+async def test_conditional_writes(writer: Writer):
+    first = replica(writer.directory)
+    second = replica(writer.directory)
+    await first.save_many([product_a, product_b])
+
+    # the replicas agree on the versions, which the writer checks
+    version = (await first.get_encoded(0)).version
+    assert (await second.get_encoded(0)).version == version
+    updated = await second.update(0, product_b, version=version)
+    new_version = (await first.get_encoded(0)).version
+    assert new_version != version
+    with pytest.raises(VersionConflict):
+        await first.update(0, product_a, version=version)
+    with pytest.raises(VersionConflict):
+        await first.delete(0, version=version)
+    assert await first.delete(0, version=new_version) == updated
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_save_requirement(writer: Writer):
+    products = replica(writer.directory)
+    reviews = SharedDatabase(
+        "reviews",
+        Review,
+        ReviewIn,
+        WriterClient(os.path.join(writer.directory, "writer.sock")),
+        writer.directory,
+    )
+    product = await products.save(product_a)
+    requires = Requirement(
+        products, product.id, (await products.get_encoded(0)).version
+    )
+    review = ReviewIn(content="Great")
+    saved = await reviews.save(
+        review, requires=requires, product_id=product.id, user="a@ex.com"
+    )
+    assert saved.id == 0
+
+    # the writer checks the product it holds, not the replica
+    await products.delete(product.id)
+    with pytest.raises(VersionConflict):
+        await reviews.save(
+            review,
+            requires=Requirement(products, product.id),
+            product_id=product.id,
+            user="a@ex.com",
+        )
+    products.close()
+    reviews.close()
+
+
+@pytest.mark.asyncio
+async def test_log_compaction(writer: Writer, monkeypatch):
+    monkeypatch.setattr(shared, "COMPACT_MIN_SIZE", 0)
+    first = replica(writer.directory, **INDEXES)
+    second = replica(writer.directory, **INDEXES)
+    await first.save_many([product_a, product_b])
+    chunks = second.iter_chunks(1)
+    assert [product.id for product in await anext(chunks)] == [0]
+
+    # overwriting the products makes most of the log garbage
+    path = first.log.path
+    inode = os.stat(path).st_ino
+    for score in range(3):
+        await first.update(0, product_a.copy(update={"score": str(score)}))
+    assert os.stat(path).st_ino != inode
+    assert os.path.getsize(path) < 3 * first.log.position
+
+    # the snapshot being iterated is still readable
+    assert [product.id for product in await anext(chunks)] == [1]
+    assert (await second.get(0)).score == "2"
+    page = await second.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0]
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_writer_errors(writer: Writer):
+    products = replica(writer.directory)
+    with pytest.raises(ValueError):
+        await products.client.request({"collection": "products", "op": "x"})
+    with pytest.raises(ValueError):
+        await products.update(1, Product(**product_a.dict(), id=2))
+    products.close()
+
+    products = SharedDatabase(
+        "products",
+        Product,
+        ProductIn,
+        WriterClient(os.path.join(writer.directory, "missing.sock")),
+        writer.directory,
+    )
+    with pytest.raises(ConnectionError):
+        await products.save(product_a)
+    products.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_dict(writer: Writer):
+    path = os.path.join(writer.directory, "writer.sock")
+    first = SharedDict("users", WriterClient(path), writer.directory)
+    second = SharedDict("users", WriterClient(path), writer.directory)
+    first["a@example.com"] = "hash a"
+    await second.put("b@example.com", "hash b")
+    assert second["a@example.com"] == "hash a"
+    assert await first.fetch("b@example.com") == "hash b"
+    assert dict(first) == {
+        "a@example.com": "hash a",
+        "b@example.com": "hash b",
+    }
+    del second["a@example.com"]
+    assert "a@example.com" not in first
+    with pytest.raises(KeyError):
+        del first["a@example.com"]
+    first.clear()
+    assert len(second) == 0
+    first.close()
+    second.close()
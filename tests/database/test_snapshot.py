@@ -0,0 +1,96 @@
+import pickle
+
+import pytest
+
+from app.database.db import Database
+from app.database.journal import Journal
+from app.database.search import SearchIndex, TextIndex
+from app.database.snapshot import Catalogue, CatalogueSnapshots, MappedRows
+from app.models.products import Product, ProductIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+
+
+def test_catalogue(tmp_path):
+    path = tmp_path / "products.snapshot"
+    rows = [("b", 7), ("a", 2), ("c", 40)]
+    with open(path, "wb") as file:
+        CatalogueSnapshots(key=1).dump(file, 12, (41, rows))
+
+    lsn, catalogue = CatalogueSnapshots(key=1).load(str(path))
+    assert lsn == 12
+    assert catalogue.index == 41
+    assert list(catalogue) == [2, 7, 40]
+    assert catalogue[7] == ("b", 7)
+    assert 3 not in catalogue
+    with pytest.raises(KeyError):
+        catalogue[3]
+    assert catalogue.id_list() == [2, 7, 40]
+
+    # the rows written later take precedence
+    mapped = MappedRows(catalogue)
+    mapped[7] = ("B", 7)
+    mapped[50] = ("d", 50)
+    del mapped[2]
+    assert dict(mapped) == {7: ("B", 7), 40: ("c", 40), 50: ("d", 50)}
+    copy = mapped.copy()
+    mapped.clear()
+    assert len(mapped) == 0
+    assert list(copy) == [7, 40, 50]
+
+    with open(path, "wb") as file:
+        pickle.dump((3, "state"), file)
+    assert CatalogueSnapshots(key=1).load(str(path)) == (3, "state")
+    with pytest.raises(ValueError):
+        Catalogue(str(path))
+
+
+@pytest.mark.asyncio
+async def test_recover_lazily(tmp_path):
+    def open_products(search_index: SearchIndex) -> Database:
+        products_db = Database(
+            Product,
+            hash_indexes=("category",),
+            text_indexes=(TextIndex("name", search_index),),
+        )
+        products_db.load(Journal(str(tmp_path), "products"))
+        return products_db
+
+    products_db = open_products(SearchIndex())
+    await products_db.save_many([product_a, product_b, product_a])
+    await products_db.checkpoint()
+    await products_db.delete(2)
+    await products_db.journal.close()
+
+    search_index = SearchIndex()
+    recovered = open_products(search_index)
+    rows = recovered.collection.rows
+    # the snapshot is mapped, only the logged mutations are in memory
+    assert isinstance(rows.catalogue, Catalogue)
+    assert rows.changed == {} and rows.deleted == {2}
+    assert await recovered.get(1) == Product(**product_b.dict(), id=1)
+    assert [product.id for product in await recovered.get_all()] == [0, 1]
+    assert recovered.indexes_stale
+    assert search_index.search("thinkpad", 10) == []
+
+    page = await recovered.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0]
+    assert not recovered.indexes_stale
+    assert [id for id, _ in search_index.search("thinkpad", 10)] == [1]
+
+    new_product = await recovered.save(product_b)
+    assert new_product.id == 3
+    chunks = [chunk async for chunk in recovered.iter_chunks(2)]
+    assert [[product.id for product in chunk] for chunk in chunks] == [
+        [0, 1],
+        [3],
+    ]
+
+    # a new snapshot holds the mapped and the new records
+    await recovered.checkpoint()
+    await recovered.journal.close()
+    recovered = open_products(SearchIndex())
+    assert [product.id for product in await recovered.get_all()] == [0, 1, 3]
+    assert recovered.collection.rows.changed == {}
+    await recovered.journal.close()
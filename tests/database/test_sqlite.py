@@ -0,0 +1,252 @@
+import asyncio
+
+import pytest
+
+from app.database.base import Requirement, VersionConflict
+from app.database.sqlite import SqliteDatabase, SqliteDict
+from app.models.products import Product, ProductIn
+from app.models.reviews import Review, ReviewIn
+
+product_a = ProductIn(name="Fairphone 4", category="smartphone", score="90")
+product_b = ProductIn(name="ThinkPad", category="laptop", score="80")
+
+
+@pytest.fixture
+def products_db(tmp_path):
+    products_db = SqliteDatabase(
+        str(tmp_path / "test.db"),
+        "products",
+        Product,
+        hash_indexes=("category",),
+        sorted_indexes=("name",),
+        pool_size=2,
+    )
+    yield products_db
+    products_db.close()
+
+
+@pytest.mark.asyncio
+async def test_save_and_get(products_db: SqliteDatabase):
+    new_product = await products_db.save(product_a)
+    assert new_product == Product(**product_a.dict(), id=0)
+    assert await products_db.get(0) == new_product
+    assert await products_db.get(1) is None
+    await products_db.save(product_b)
+    assert [product.id for product in await products_db.get_all()] == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_save(products_db: SqliteDatabase):
+    saved = await asyncio.gather(
+        *(products_db.save(product_a) for _ in range(20))
+    )
+    assert sorted(product.id for product in saved) == list(range(20))
+
+
+@pytest.mark.asyncio
+async def test_scan(products_db: SqliteDatabase):
+    for product in [product_a, product_b, product_a]:
+        await products_db.save(product)
+    page = await products_db.scan(after=0, limit=1)
+    assert [product.id for product in page] == [1]
+    page = await products_db.scan(equal={"category": "smartphone"})
+    assert [product.id for product in page] == [0, 2]
+    page = await products_db.scan(prefix={"name": "Think"})
+    assert [product.id for product in page] == [1]
+    with pytest.raises(ValueError):
+        await products_db.scan(equal={"score": "90"})
+
+
+@pytest.mark.asyncio
+async def test_scan_by_score(tmp_path):
+    # product_a scores "90", product_b "80"
+    products_db = SqliteDatabase(
+        str(tmp_path / "test.db"),
+        "products",
+        Product,
+        hash_indexes=("category",),
+        numeric_indexes=("score",),
+    )
+    product_c = ProductIn(name="Unrated", category="laptop", score="n/a")
+    await products_db.save_many([product_a, product_b, product_c, product_b])
+    page = await products_db.scan_sorted("score", 10, descending=True)
+    assert [product.id for product in page] == [0, 3, 1]
+    page = await products_db.scan_sorted(
+        "score", 1, equal={"category": "laptop"}
+    )
+    assert [product.id for product in page] == [1]
+    page = await products_db.scan(between={"score": (85, 100)})
+    assert [product.id for product in page] == [0]
+    products_db.close()
+
+
+@pytest.mark.asyncio
+async def test_update_and_delete(products_db: SqliteDatabase):
+    await products_db.save(product_a)
+    updated_product = await products_db.update(0, product_b)
+    assert updated_product == Product(**product_b.dict(), id=0)
+    assert await products_db.get(0) == updated_product
+    assert await products_db.update(1, product_b) is None
+    with pytest.raises(ValueError):
+        await products_db.update(0, Product(**product_a.dict(), id=1))
+
+    assert await products_db.delete(0) == updated_product
+    assert await products_db.delete(0) is None
+
+    new_product = await products_db.save(product_a)
+    assert new_product.id == 1
+    products_db.reset()
+    assert await products_db.get_all() == []
+    new_product = await products_db.save(product_a)
+    assert new_product.id == 0
+
+
+@pytest.mark.asyncio
+async def test_conditional_writes(products_db: SqliteDatabase):
+    await products_db.save_many([product_a, product_b])
+    encoded = await products_db.get_encoded(0)
+    assert encoded is not None and encoded.version is not None
+    version = encoded.version
+
+    # an update of the version read succeeds and moves the version on
+    updated = await products_db.update(0, product_b, version=version)
+    assert updated == Product(**product_b.dict(), id=0)
+    encoded = await products_db.get_encoded(0)
+    assert encoded is not None and encoded.version != version
+    new_version = encoded.version
+
+    # writes of an older version fail, without writing anything
+    with pytest.raises(VersionConflict):
+        await products_db.update(0, product_a, version=version)
+    with pytest.raises(VersionConflict):
+        await products_db.delete(0, version=version)
+    assert await products_db.get(0) == updated
+
+    # of concurrent updates of the same version, only the first succeeds
+    results = await asyncio.gather(
+        *(products_db.update(1, product_a, version=version) for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert sum(isinstance(r, VersionConflict) for r in results) == 2
+
+    assert await products_db.delete(0, version=new_version) == updated
+    assert await products_db.delete(0, version=new_version) is None
+    assert await products_db.update(0, product_a, version=0) is None
+
+
+@pytest.mark.asyncio
+async def test_save_requirement(tmp_path, products_db: SqliteDatabase):
+    reviews_db = SqliteDatabase(
+        products_db.path, "reviews", Review, write_batch_size=10
+    )
+    product = await products_db.save(product_a)
+    encoded = await products_db.get_encoded(product.id)
+    assert encoded is not None
+    requires = Requirement(products_db, product.id, encoded.version)
+    review = ReviewIn(content="Great")
+    saved = await reviews_db.save(
+        review, requires=requires, product_id=product.id, user="a@ex.com"
+    )
+    assert saved.id == 0
+
+    # the requirement is checked in the transaction of the batch
+    await products_db.update(product.id, product_b)
+    results = await asyncio.gather(
+        reviews_db.save(
+            review, requires=requires, product_id=product.id, user="a@ex.com"
+        ),
+        reviews_db.save(
+            review,
+            requires=Requirement(products_db, product.id),
+            product_id=product.id,
+            user="b@ex.com",
+        ),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], VersionConflict)
+    assert results[1].id == 1
+
+    # a product of another database file cannot be checked
+    other_db = SqliteDatabase(str(tmp_path / "other.db"), "products", Product)
+    with pytest.raises(ValueError):
+        await reviews_db.save(
+            review,
+            requires=Requirement(other_db, product.id),
+            product_id=product.id,
+            user="a@ex.com",
+        )
+    other_db.close()
+    reviews_db.close()
+
+
+@pytest.mark.asyncio
+async def test_save_many_and_delete_many(products_db: SqliteDatabase):
+    await products_db.save(product_a)
+    saved = await products_db.save_many([product_b, product_a])
+    assert [product.id for product in saved] == [1, 2]
+    assert await products_db.get(1) == Product(**product_b.dict(), id=1)
+    deleted = await products_db.delete_many([2, 5, 0, 2])
+    assert [product.id for product in deleted] == [2, 0]
+    assert [product.id for product in await products_db.get_all()] == [1]
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks(products_db: SqliteDatabase):
+    await products_db.save_many([product_a, product_b, product_a])
+    chunks = products_db.iter_chunks(2)
+    first = await chunks.__anext__()
+    await products_db.delete(2)
+    await products_db.save(product_b)
+    rest = [product async for chunk in chunks for product in chunk]
+    assert [product.id for product in [*first, *rest]] == [0, 1, 2]
+    assert products_db.pool.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_summarize(tmp_path):
+    reviews_db = SqliteDatabase(
+        str(tmp_path / "test.db"),
+        "reviews",
+        Review,
+        hash_indexes=("product_id",),
+        distinct_indexes=(("product_id", "user"),),
+    )
+    for user in ["a@b.com", "c@d.com", "a@b.com"]:
+        await reviews_db.save(
+            ReviewIn(content="Fine"), product_id=1, user=user
+        )
+    summary = await reviews_db.summarize(
+        "product_id", 1, distinct="user", latest=2
+    )
+    assert summary == (3, 2, [2, 1])
+    with pytest.raises(ValueError):
+        await reviews_db.summarize("user", "a@b.com", "id", latest=1)
+    reviews_db.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_file(tmp_path):
+    path = str(tmp_path / "test.db")
+    reviews_db = SqliteDatabase(path, "reviews", Review)
+    other_reviews_db = SqliteDatabase(path, "reviews", Review)
+    review = await reviews_db.save(
+        ReviewIn(content="Great"), product_id=0, user="a@b.com"
+    )
+    assert await other_reviews_db.get(review.id) == review
+    reviews_db.close()
+    other_reviews_db.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_dict(tmp_path):
+    users = SqliteDict(str(tmp_path / "test.db"), "users")
+    users["a@b.com"] = "hash-a"
+    await users.put("c@d.com", "hash-c")
+    assert users.get("a@b.com") == "hash-a"
+    assert await users.fetch("c@d.com") == "hash-c"
+    assert await users.fetch("e@f.com") is None
+    del users["a@b.com"]
+    assert dict(users) == {"c@d.com": "hash-c"}
+    users.clear()
+    assert len(users) == 0
+    users.close()
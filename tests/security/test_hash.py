@@ -1,4 +1,9 @@
-from app.security.hash import Hasher
+import asyncio
+
+import pytest
+from fastapi import HTTPException, status
+
+from app.security.hash import AsyncHasher, Hasher
 
 # Create an instance of the Hasher class
 hasher = Hasher()
@@ -27,3 +32,36 @@ def test_hasher_verify_invalid():
     invalid_password = "invalid_password"
     result = hasher.verify(invalid_password, hashed_password)
     assert result is False
+
+
+async def test_async_hasher_create_and_verify():
+    # Test hashing and verification on the worker pool
+    async_hasher = AsyncHasher(max_workers=1, max_pending=2)
+    password = "password123"
+    hashed_password = await async_hasher.create(password)
+    assert hashed_password != password
+    assert await async_hasher.verify(password, hashed_password) is True
+    assert await async_hasher.verify("invalid", hashed_password) is False
+    assert async_hasher.pending == 0
+    async_hasher.shutdown()
+
+
+async def test_async_hasher_saturated():
+    # Test that jobs beyond the pending limit are rejected with a 429
+    async_hasher = AsyncHasher(max_workers=1, max_pending=1)
+    results = await asyncio.gather(
+        async_hasher.create("password123"),
+        async_hasher.create("password123"),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], HTTPException)
+    assert results[1].status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert async_hasher.pending == 0
+    async_hasher.shutdown()
+
+
+def test_async_hasher_unknown_executor():
+    # Test that an unknown pool type is refused
+    with pytest.raises(ValueError):
+        AsyncHasher(executor="fiber")
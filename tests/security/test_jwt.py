@@ -1,8 +1,11 @@
+import hashlib
+
 import pytest
 from fastapi import HTTPException, status
 from freezegun import freeze_time
 
 from app.database.db import USER_DB
+from app.security import jwt
 from app.security.jwt import create_token, verify_token
 
 
@@ -66,3 +69,61 @@ async def test_verify_token_no_user():
         await verify_token(token)
 
     assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_verify_token_cached(monkeypatch):
+    # Test that a reused token is only decoded once
+    user = "test_user"
+    token = create_token(user)
+    USER_DB[user] = {"id": 1, "username": user}
+    decoded = []
+    decode = jwt.jwt.decode
+    monkeypatch.setattr(
+        jwt.jwt,
+        "decode",
+        lambda *args, **kwargs: decoded.append(1) or decode(*args, **kwargs),
+    )
+    for _ in range(3):
+        data = await verify_token(token)
+        assert data["user"] == user
+    assert len(decoded) == 1
+
+
+async def test_verify_token_cached_expired():
+    # Test that a cached token is rejected once it expires
+    user = "test_user"
+    token = create_token(user)
+    USER_DB[user] = {"id": 1, "username": user}
+    await verify_token(token)
+    with pytest.raises(HTTPException) as exc_info:
+        with freeze_time("5000-01-01"):
+            await verify_token(token)
+
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert exc_info.value.detail == "Token expired!"
+
+
+async def test_verify_token_cached_user_removed():
+    # Test that removing a user invalidates their cached tokens
+    user = "test_user"
+    token = create_token(user)
+    USER_DB[user] = {"id": 1, "username": user}
+    await verify_token(token)
+    del USER_DB[user]
+    with pytest.raises(HTTPException) as exc_info:
+        await verify_token(token)
+
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    digest = hashlib.sha256(token.encode()).digest()
+    assert digest not in jwt.token_cache.entries
+
+
+def test_token_cache_lru():
+    # Test that the least recently used token is evicted first
+    cache = jwt.TokenCache(max_size=2)
+    cache.put(b"a", {"user": "a"})
+    cache.put(b"b", {"user": "b"})
+    assert cache.get(b"a") == {"user": "a"}
+    cache.put(b"c", {"user": "c"})
+    assert cache.get(b"b") is None
+    assert list(cache.entries) == [b"a", b"c"]
@@ -0,0 +1,58 @@
+import httpx
+import pytest
+
+from app import metrics
+
+
+def test_histogram():
+    histogram = metrics.Histogram(
+        "test_seconds", "Test histogram.", ("name",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.1, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+    assert histogram.render() == (
+        "# HELP test_seconds Test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{name="a",le="0.1"} 1\n'
+        'test_seconds_bucket{name="a",le="1.0"} 2\n'
+        'test_seconds_bucket{name="a",le="+Inf"} 3\n'
+        'test_seconds_sum{name="a"} 5.6\n'
+        'test_seconds_count{name="a"} 3\n'
+    )
+    metrics.REGISTRY.remove(histogram)
+
+
+def test_counter_and_gauge():
+    counter = metrics.Counter("test_total", "Test counter.", ("path",))
+    counter.inc('/a"b')
+    counter.inc('/a"b', amount=2)
+    assert counter.samples() == [("", '{path="/a\\"b"}', 3)]
+    gauge = metrics.Gauge(
+        "test_items", "Test gauge.", function=lambda: {(): 7}
+    )
+    assert gauge.samples() == [("", "", 7)]
+    metrics.REGISTRY.remove(counter)
+    metrics.REGISTRY.remove(gauge)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: httpx.AsyncClient, headers) -> None:
+    await client.get("/products/123456", headers=headers)
+    await client.get("/no/such/path")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    # requests are labelled with the route template
+    assert (
+        'http_requests_total{method="GET",route="/products/{id}",'
+        'status="404"}' in text
+    )
+    assert 'route="unmatched"' in text
+    assert "/products/123456" not in text
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/products/{id}"}' in text
+    )
+    assert 'db_collection_items{collection="product"}' in text